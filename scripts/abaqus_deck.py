@@ -0,0 +1,76 @@
+#!python
+"""
+    Streaming primitives of the Abaqus deck writers (abaqus_writer.py for
+    the section, tire_revolve.py for the revolved 3D tire). Rows are
+    written in chunks of CHUNK_SIZE lines so a deck is never built in
+    memory. This module doesn't use Cubit, the revolved deck is written
+    from a mesh archive outside of Cubit.
+"""
+import gzip
+
+import numpy as np
+
+CHUNK_SIZE = 4096
+IDS_PER_LINE = 16
+
+
+# Runs of consecutive ids. Returns (start, end) pairs of the sorted unique ids.
+def IdRanges(ids):
+    ids = np.unique(np.asarray(ids, dtype=np.int64))
+    if not len(ids):
+        return np.zeros((0, 2), dtype=np.int64)
+    breaks = np.nonzero(np.diff(ids) != 1)[0]
+    starts = np.concatenate([[0], breaks + 1])
+    ends = np.concatenate([breaks, [len(ids) - 1]])
+    return np.stack([ids[starts], ids[ends]], axis=1)
+
+
+# Open the deck for writing text, with gzip for a .gz file name
+def OpenDeck(path, compress=None):
+    if compress is None:
+        compress = path.endswith(".gz")
+    if compress:
+        return gzip.open(path, "wt", compresslevel=6, newline="\n")
+    return open(path, "w", newline="\n")
+
+
+class DeckWriter():
+    def __init__(self):
+        self.lines = 0
+
+    # Write the rows in chunks, each row is formatted with fmt. A chunk is
+    # formatted in one operation with the row format repeated.
+    def WriteRows(self, deck, fmt, rows):
+        for first in range(0, len(rows), CHUNK_SIZE):
+            chunk = rows[first:first + CHUNK_SIZE]
+            deck.write((fmt * len(chunk)) % tuple(chunk.ravel().tolist()))
+            self.lines += len(chunk)
+
+    # Ids, IDS_PER_LINE to a line
+    def WriteIds(self, deck, ids):
+        for first in range(0, len(ids), IDS_PER_LINE * CHUNK_SIZE):
+            chunk = ids[first:first + IDS_PER_LINE * CHUNK_SIZE]
+            lines = [", ".join(str(i) for i in chunk[k:k + IDS_PER_LINE]) for k in range(0, len(chunk), IDS_PER_LINE)]
+            deck.write("\n".join(lines) + "\n")
+            self.lines += len(lines)
+
+    # A node or element set, runs of three or more ids as GENERATE lines.
+    # The set holds the ids shifted by each of the shifts (the copies of the
+    # section in a revolved mesh), the shifted ids are written one shift at
+    # a time.
+    def WriteSet(self, deck, keyword, name, ids, shifts=(0,)):
+        ranges = IdRanges(ids)
+        if not len(ranges):
+            return
+        long_runs = ranges[:, 1] - ranges[:, 0] >= 2
+        if long_runs.any():
+            deck.write(f"*{keyword}, {keyword}={name}, GENERATE\n")
+            generate = np.column_stack([ranges[long_runs], np.ones(long_runs.sum(), dtype=np.int64)])
+            for shift in shifts:
+                self.WriteRows(deck, "%d, %d, %d\n", generate + np.array([shift, shift, 0]))
+        single = np.concatenate([np.arange(a, b + 1) for a, b in ranges[~long_runs]]) \
+            if (~long_runs).any() else np.zeros(0, dtype=np.int64)
+        if len(single):
+            deck.write(f"*{keyword}, {keyword}={name}\n")
+            for shift in shifts:
+                self.WriteIds(deck, single + shift)
@@ -0,0 +1,183 @@
+#!python
+"""
+    Streaming Abaqus input deck writer. The mesh is loaded once into bulk
+    arrays (mesh_arrays.py) and the deck is written section by section in
+    chunks of CHUNK_SIZE lines (abaqus_deck.py), so the deck is never built
+    in memory.
+      *NODE      all nodes of the faces and bars,
+      *ELEMENT   CGAX4H quads, CGAX3H triangles and SFMGAX1 bars (the
+                 solver element mapping of MeshTireSurfaces), only the
+                 elements of the blocks as with the built-in export,
+      *ELSET     one set per block (tire-1_Set-*, reinf-1_Set-Rebar-*),
+      *NSET      one set per nodeset (tire-1_*),
+      *SURFACE   one element based surface per sideset, the faces of the
+                 sideset sides are grouped by their Abaqus face S1..S4. A
+                 side between two faces adds both faces.
+    Runs of consecutive ids in the sets are written as GENERATE lines. A
+    file name ending in .gz is written with gzip. With an active part (see
+    part_scope.py) only the part is written and the part prefix is removed
+    from the set names.
+
+    Quads, triangles and bars are numbered separately in Cubit. When the id
+    ranges overlap the triangles and bars are offset past the quads.
+
+    Benchmark() compares the deck size and time with the built-in export.
+    Run it from the Cubit command line with
+        import abaqus_writer; abaqus_writer.Benchmark()
+"""
+import os
+import time
+
+import numpy as np
+
+import cubit
+
+import abaqus_deck
+import mesh_arrays
+import part_scope
+from abaqus_deck import OpenDeck
+from mesh_arrays import QUAD, TRI
+
+ELEMENT_TYPES = {QUAD: "CGAX4H", TRI: "CGAX3H", 2: "SFMGAX1"}
+
+
+class AbaqusWriter(abaqus_deck.DeckWriter):
+    def __init__(self):
+        super().__init__()
+        self.blocks = part_scope.Sets('block')
+        bar_edges = sorted(set(e for b in self.blocks for e in cubit.get_block_edges(b)))
+        self.mesh = mesh_arrays.MeshArrays.Load(include_free=True, bar_edges=bar_edges)
+        # only the elements of the blocks have a section, as with the built-in export
+        self.mesh.KeepFaces(self.BlockFaceRows())
+        self.face_rows = self.mesh.FaceRows()
+        self.NumberElements()
+
+    # Rows of the faces that belong to an exported block
+    def BlockFaceRows(self):
+        rows = self.mesh.FaceRows()
+        keep = set()
+        for block in self.blocks:
+            keep.update(rows[(QUAD, f)] for f in cubit.get_block_faces(block) if (QUAD, f) in rows)
+            keep.update(rows[(TRI, t)] for t in cubit.get_block_tris(block) if (TRI, t) in rows)
+        skipped = len(rows) - len(keep)
+        if skipped:
+            print(f"{skipped} faces are not in a block and are not written.")
+        return sorted(keep)
+
+    # Abaqus element id of every face row and bar row
+    def NumberElements(self):
+        quads = self.mesh.face_types == QUAD
+        tris = self.mesh.face_types == TRI
+        self.face_elements = self.mesh.face_ids.copy()
+        self.bar_elements = self.mesh.bar_ids.copy()
+        self.offset = False
+        quad_ids = self.face_elements[quads]
+        if np.isin(self.face_elements[tris], quad_ids).any():
+            self.face_elements[tris] += int(quad_ids.max())
+            self.offset = True
+        if np.isin(self.bar_elements, self.face_elements).any():
+            self.bar_elements += int(self.face_elements.max())
+            self.offset = True
+
+    def WriteNodes(self, deck):
+        deck.write("*NODE\n")
+        planar = not len(self.mesh.coords) or np.ptp(self.mesh.coords[:, 2]) == 0.0
+        columns = 2 if planar else 3
+        rows = np.column_stack([self.mesh.node_ids.astype(float), self.mesh.coords[:, :columns]])
+        self.WriteRows(deck, "%d, " + ", ".join(["%.15g"] * columns) + "\n", rows)
+
+    def WriteElements(self, deck):
+        for elem_type in (QUAD, TRI):
+            rows = np.nonzero(self.mesh.face_types == elem_type)[0]
+            if not len(rows):
+                continue
+            deck.write(f"*ELEMENT, TYPE={ELEMENT_TYPES[elem_type]}\n")
+            table = np.column_stack([self.face_elements[rows], self.mesh.face_nodes[rows, :elem_type]])
+            self.WriteRows(deck, ", ".join(["%d"] * (elem_type + 1)) + "\n", table)
+        if len(self.bar_elements):
+            deck.write(f"*ELEMENT, TYPE={ELEMENT_TYPES[2]}\n")
+            self.WriteRows(deck, "%d, %d, %d\n", np.column_stack([self.bar_elements, self.mesh.bar_nodes]))
+
+    # Abaqus element ids of the quads, triangles and bars of a block
+    def BlockElements(self, block):
+        faces = [self.face_rows.get((QUAD, f)) for f in cubit.get_block_faces(block)]
+        faces += [self.face_rows.get((TRI, t)) for t in cubit.get_block_tris(block)]
+        faces = np.array([f for f in faces if f is not None], dtype=np.int64)
+        bars = np.isin(self.mesh.bar_ids, cubit.get_block_edges(block))
+        return np.concatenate([self.face_elements[faces], self.bar_elements[bars]])
+
+    def WriteElementSets(self, deck):
+        for block in self.blocks:
+            name = part_scope.BaseName(cubit.get_exodus_entity_name('block', block) or f"Block{block}")
+            self.WriteSet(deck, "ELSET", name, self.BlockElements(block))
+
+    # Nodes of a nodeset that are written, the nodes of faces outside the blocks are left out
+    def NodesetNodes(self, nodeset):
+        return np.intersect1d(np.asarray(cubit.get_nodeset_nodes_inclusive(nodeset), dtype=np.int64),
+                              self.mesh.node_ids)
+
+    def WriteNodeSets(self, deck):
+        for nodeset in part_scope.Sets('nodeset'):
+            name = part_scope.BaseName(cubit.get_exodus_entity_name('nodeset', nodeset) or f"Nodeset{nodeset}")
+            self.WriteSet(deck, "NSET", name, self.NodesetNodes(nodeset))
+
+    # (element ids, face number 1..4) of the face sides on the sideset edges
+    def SidesetFaces(self, sideset):
+        edges = set(cubit.get_sideset_edges(sideset))
+        for curve in cubit.get_sideset_curves(sideset):
+            edges.update(cubit.parse_cubit_list('edge', f'in curve {curve}'))
+        if not edges:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        edge_nodes = np.array([cubit.get_connectivity('edge', e)[:2] for e in sorted(edges)], dtype=np.int64)
+        keys = np.unique(self.mesh.EdgeKey(edge_nodes[:, 0], edge_nodes[:, 1]))
+        nodes, faces, sides = self.mesh.FaceSides()
+        found = np.isin(self.mesh.EdgeKey(nodes[:, 0], nodes[:, 1]), keys)
+        return self.face_elements[faces[found]], sides[found].astype(np.int64) + 1
+
+    def WriteSurfaces(self, deck):
+        for sideset in part_scope.Sets('sideset'):
+            name = part_scope.BaseName(cubit.get_exodus_entity_name('sideset', sideset) or f"Surface{sideset}")
+            elements, face_numbers = self.SidesetFaces(sideset)
+            if not len(elements):
+                continue
+            surface_sets = []
+            for face_number in np.unique(face_numbers):
+                set_name = f"_{name}_S{face_number}"
+                self.WriteSet(deck, "ELSET", set_name, elements[face_numbers == face_number])
+                surface_sets.append((set_name, face_number))
+            deck.write(f"*SURFACE, TYPE=ELEMENT, NAME={name}\n")
+            deck.write("".join(f"{set_name}, S{face_number}\n" for set_name, face_number in surface_sets))
+
+    # Write the deck. Returns the number of data lines written.
+    def Write(self, path, compress=None):
+        self.lines = 0
+        with OpenDeck(path, compress) as deck:
+            deck.write("*HEADING\n")
+            deck.write("** Tire cross section written by abaqus_writer.py\n")
+            self.WriteNodes(deck)
+            self.WriteElements(deck)
+            self.WriteElementSets(deck)
+            self.WriteNodeSets(deck)
+            self.WriteSurfaces(deck)
+        if self.offset:
+            print("The triangle and bar ids overlap the quad ids, they were offset in the deck.")
+        return self.lines
+
+
+# Time the streaming writer against the built-in export and compare the deck sizes
+def Benchmark(directory=None):
+    directory = directory or os.getcwd()
+    results = []
+    start = time.perf_counter()
+    cubit.cmd(f'export abaqus "{os.path.join(directory, "benchmark_builtin.inp")}" overwrite')
+    results.append(("built-in export", time.perf_counter() - start, os.path.join(directory, "benchmark_builtin.inp")))
+    for name, compress in (("benchmark_stream.inp", False), ("benchmark_stream.inp.gz", True)):
+        path = os.path.join(directory, name)
+        start = time.perf_counter()
+        AbaqusWriter().Write(path, compress)
+        results.append((f"streaming writer{' gzip' if compress else ''}", time.perf_counter() - start, path))
+    print(f"{'writer':<24}{'time (s)':>10}{'size (kB)':>12}")
+    for name, seconds, path in results:
+        size = os.path.getsize(path) / 1024.0 if os.path.exists(path) else float('nan')
+        print(f"{name:<24}{seconds:>10.2f}{size:>12.1f}")
+    return results
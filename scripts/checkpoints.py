@@ -0,0 +1,121 @@
+#!python
+"""
+    Model checkpoints at the stage boundaries. The model is saved as a cub5
+    file in TIRE_CHECKPOINTS (default: tire_checkpoints in the temporary
+    directory) under the Cubit process id and the stage name, so the
+    sessions don't overwrite each other's checkpoints:
+      cutlines: before the automatic composites, the last state where cut
+                lines can be added,
+      mesh:     before meshing.
+    Restoring a checkpoint opens the file. Restoring the cutlines
+    checkpoint replaces the undo back to cut lines by reverse operations
+    (undo_for_cutlines.py) and keeps the composites that were created
+    manually before the checkpoint. The mesh checkpoint can be restored
+    from the Cubit command line with
+        import checkpoints; checkpoints.Restore('mesh')
+    The checkpoints are kept under TIRE_CHECKPOINTS_MB megabytes (default
+    1024), the least recently used are removed first. A checkpoint holds
+    the whole session, it is not restored while other parts have bodies
+    (see part_scope.py). The checkpoint also records a fingerprint of the
+    model (ModelFingerprint) and is only restored into the same model, a
+    tire opened or created after it keeps its own state. Create Tire
+    Surfaces starts a new model and removes the checkpoints.
+"""
+import json
+import os
+import tempfile
+import time
+
+import cubit
+
+import mesh_fingerprint
+import mesh_journal
+import part_scope
+import stage_cache
+
+CHECKPOINT_DIR = os.environ.get("TIRE_CHECKPOINTS", os.path.join(tempfile.gettempdir(), "tire_checkpoints"))
+CHECKPOINT_BUDGET = int(os.environ.get("TIRE_CHECKPOINTS_MB", "1024")) * 1024 * 1024
+STAGES = ("cutlines", "mesh")
+
+
+def Store():
+    return stage_cache.FileStore(CHECKPOINT_DIR, CHECKPOINT_BUDGET)
+
+
+def Key(stage):
+    return f"{os.getpid()}-{stage}"
+
+
+# The model the checkpoints belong to: the names of the material blocks and
+# the rounded area and bounding box of the half section surfaces (y < 0).
+# The stages after the cut lines (composites, mesh, boundary sets,
+# reflection, rebar) don't change it, another tire does.
+def ModelFingerprint():
+    surfaces = sorted(cubit.parse_cubit_list('surface', f'{part_scope.Within()} with y_coord < 0'))
+    if not surfaces:
+        return None
+    area = sum(sorted(cubit.get_surface_area(s) for s in surfaces))
+    bbox = cubit.get_total_bounding_box('surface', surfaces)
+    blocks = sorted(cubit.get_exodus_entity_name('block', b) or "" for b in part_scope.Sets('block'))
+    return mesh_fingerprint.Digest((round(area, mesh_fingerprint.PRECISION),
+                                    tuple(round(x, mesh_fingerprint.PRECISION) for x in bbox),
+                                    tuple(name for name in blocks if not name.startswith(part_scope.Name("reinf")))))
+
+
+# Save the model as the checkpoint of the stage. Returns the file or None.
+def Save(stage):
+    store = Store()
+    path = store.Path(Key(stage))
+    start = time.perf_counter()
+    try:
+        model = ModelFingerprint()
+        cubit.cmd(f'save cub5 "{path}" overwrite')
+    except Exception as e:
+        print(f"Unable to save the {stage} checkpoint: {e}")
+        return None
+    with open(os.path.splitext(path)[0] + ".json", "w") as f:
+        json.dump({"stage": stage, "model": model, "time": time.time(),
+                   "seconds": time.perf_counter() - start}, f)
+    store.Evict(keep=path)
+    return path
+
+
+# Open the checkpoint of the stage. Returns True when it was restored.
+def Restore(stage):
+    path = Store().Get(Key(stage))
+    if path is None:
+        return False
+    if not part_scope.OnlyPart():
+        print(f"The {stage} checkpoint is not restored, it would replace the other parts.")
+        return False
+    meta = os.path.splitext(path)[0] + ".json"
+    if not os.path.exists(meta):
+        return False
+    with open(meta) as f:
+        info = json.load(f)
+    try:
+        model = ModelFingerprint()
+    except Exception as e:
+        print(f"The {stage} checkpoint is not restored: {e}")
+        return False
+    if model is None or info.get("model") != model:
+        print(f"The {stage} checkpoint is not restored, it was taken from another model.")
+        return False
+    start = time.perf_counter()
+    cubit.cmd(f'open "{path}"')
+    # the session state refers to the replaced model
+    mesh_fingerprint.Reset()
+    mesh_journal.Clear()
+    taken = time.strftime('%H:%M:%S', time.localtime(info['time']))
+    print(f"Restored the {stage} checkpoint taken at {taken} in {time.perf_counter() - start:.2f}s.")
+    return True
+
+
+# Remove the checkpoints of this session, a new model was created
+def Invalidate():
+    store = Store()
+    for stage in STAGES:
+        path = store.Path(Key(stage))
+        for remove in (path, os.path.splitext(path)[0] + ".json"):
+            if os.path.exists(remove):
+                os.remove(remove)
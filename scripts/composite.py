@@ -14,6 +14,9 @@
 """
 import math
 
+import checkpoints
+import part_scope
+
 # Define a global variable and make sure that the automatically composited 
 # curves are always reset at the beginning of this routine. The global is
 # read in undo_for_cutlines.py. This is the only routine that should modify it.
@@ -77,8 +80,8 @@ class AutoComposite():
         cubit.cmd('undo group begin')
         processed = 0
 
-        # get all the curves in the model
-        all_curves = set(cubit.get_entities('curve'))
+        # get all the curves in the model (the active part)
+        all_curves = set(part_scope.Entities('curve'))
         num_curves = len(all_curves)
         while (all_curves):
             # find all the curves that are continuous to this curve and composite around it
@@ -145,6 +148,9 @@ class AutoComposite():
         cubit.cmd('undo group end')
 
 def main():
+    # the last state where cut lines can be added, see undo_for_cutlines.py
+    if not cubit.parse_cubit_list('surface', 'with is_meshed'):
+        checkpoints.Save('cutlines')
     composite = AutoComposite()
     composite.CreateAutoComposites()
 
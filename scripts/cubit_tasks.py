@@ -0,0 +1,247 @@
+#!python
+"""
+    Long toolbar operations without freezing Claro.
+    1) The pure Python analysis (NumPy arrays, chain building, quality,
+       ray casts) runs in a worker thread. It must not call Cubit, the
+       Cubit data is loaded on the main thread before the task starts. The
+       task reports its progress and checks for cancellation through the
+       TaskProgress object it is given.
+    2) The Cubit commands run on the main thread from a queue. A QTimer
+       processes the queue in slices of SLICE_SECONDS so the GUI keeps
+       drawing and the cancel button keeps working between the slices.
+    A cancelled command queue still closes its undo group, so the commands
+    that did run can be undone in one step.
+"""
+import threading
+import time
+
+from PySide6.QtCore import Qt, QTimer
+from PySide6.QtWidgets import QProgressDialog
+
+import cubit
+
+SLICE_SECONDS = 0.05
+POLL_MS = 50
+
+
+class Cancelled(Exception):
+    pass
+
+
+# Progress and cancellation shared between the worker thread and the GUI
+class TaskProgress():
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.cancelled = threading.Event()
+        self.done = 0
+        self.total = 0
+        self.message = ""
+
+    def Update(self, done, total=None, message=None):
+        with self.lock:
+            self.done = done
+            if total is not None:
+                self.total = total
+            if message is not None:
+                self.message = message
+        self.Check()
+
+    def Cancel(self):
+        self.cancelled.set()
+
+    # Raise Cancelled in the task when the user cancelled
+    def Check(self):
+        if self.cancelled.is_set():
+            raise Cancelled()
+
+    def State(self):
+        with self.lock:
+            return self.done, self.total, self.message
+
+
+# Run function(progress, *args) in a worker thread
+class BackgroundTask():
+    def __init__(self, function, *args):
+        self.function = function
+        self.args = args
+        self.progress = TaskProgress()
+        self.result = None
+        self.error = None
+        self.finished = threading.Event()
+        self.thread = threading.Thread(target=self.Run, daemon=True)
+
+    def Start(self):
+        self.thread.start()
+        return self
+
+    def Run(self):
+        try:
+            self.result = self.function(self.progress, *self.args)
+        except Cancelled:
+            pass
+        except Exception as e:
+            self.error = e
+        finally:
+            self.finished.set()
+
+
+# Cubit commands (strings or callables) run in time slices on the main thread
+class CommandQueue():
+    def __init__(self, commands, undo_group=True, begin=(), end=(), silent=True):
+        self.commands = list(commands)
+        self.undo_group = undo_group
+        self.begin = list(begin)
+        self.end = list(end)
+        self.silent = silent
+        self.position = 0
+        self.started = False
+        self.closed = False
+
+    def Run(self, command):
+        if callable(command):
+            command()
+        elif self.silent:
+            cubit.silent_cmd(command)
+        else:
+            cubit.cmd(command)
+
+    # Open the undo group and run the begin commands, Close() then finishes
+    # the queue even when it is cancelled before the first slice
+    def Start(self):
+        if self.started:
+            return
+        self.started = True
+        if self.undo_group:
+            cubit.cmd("undo group begin")
+        for command in self.begin:
+            cubit.cmd(command)
+
+    # Run commands until the slice is used up. Returns True when the queue is done.
+    def Step(self, slice_seconds=SLICE_SECONDS):
+        self.Start()
+        # at least one command per slice
+        deadline = time.perf_counter() + slice_seconds
+        while self.position < len(self.commands):
+            # advance first, a command that fails or is re-entered never runs twice
+            command = self.commands[self.position]
+            self.position += 1
+            self.Run(command)
+            if time.perf_counter() >= deadline:
+                break
+        if self.position >= len(self.commands):
+            self.Close()
+            return True
+        return False
+
+    # Finish the queue, also after a cancel or an error
+    def Close(self):
+        if self.closed or not self.started:
+            return
+        self.closed = True
+        for command in self.end:
+            if callable(command):
+                command()
+            else:
+                cubit.cmd(command)
+        if self.undo_group:
+            cubit.cmd("undo group end")
+
+
+# Progress dialog driving background tasks and command queues
+class ProgressRunner():
+    def __init__(self, parent, title):
+        self.dialog = QProgressDialog(title, "Cancel", 0, 100, parent)
+        self.dialog.setWindowTitle(title)
+        self.dialog.setWindowModality(Qt.WindowModality.WindowModal)
+        self.dialog.setMinimumDuration(500)
+        self.timer = QTimer()
+        self.timer.setInterval(POLL_MS)
+        self.job = None
+        self.then = None
+        self.cancelled = False
+        self.busy = False
+
+    def SetProgress(self, done, total, message):
+        if total:
+            self.dialog.setMaximum(total)
+            self.dialog.setValue(min(done, total))
+        if message:
+            self.dialog.setLabelText(message)
+
+    # Run function(progress, *args) in a thread, then(result) is called on
+    # the main thread unless the task was cancelled or failed
+    def Analyze(self, function, *args, then=None, failed=None):
+        self.job = BackgroundTask(function, *args).Start()
+        self.then = then
+        self.failed = failed
+        self.StartTimer(self.PollTask)
+
+    # Run the command queue in slices, then() is called when it is done
+    def Execute(self, queue, then=None):
+        self.job = queue
+        self.then = then
+        self.failed = None
+        queue.Start()
+        self.StartTimer(self.StepQueue)
+
+    def StartTimer(self, slot):
+        try:
+            self.timer.timeout.disconnect()
+        except (RuntimeError, TypeError):
+            pass
+        self.timer.timeout.connect(slot)
+        self.cancelled = False
+        self.dialog.setValue(0)
+        self.timer.start()
+
+    def PollTask(self):
+        task = self.job
+        if self.dialog.wasCanceled():
+            task.progress.Cancel()
+        self.SetProgress(*task.progress.State())
+        if not task.finished.is_set():
+            return
+        self.timer.stop()
+        self.dialog.reset()
+        if task.progress.cancelled.is_set():
+            self.cancelled = True
+            print("Cancelled.")
+        elif task.error is not None:
+            if self.failed:
+                self.failed(task.error)
+            else:
+                print(f"The task failed: {task.error}")
+        elif self.then:
+            self.then(task.result)
+
+    # The timer is stopped while a slice runs, a modal window opened by a
+    # command runs its own event loop that would otherwise step the queue again
+    def StepQueue(self):
+        if self.busy:
+            return
+        queue = self.job
+        if self.dialog.wasCanceled():
+            self.timer.stop()
+            queue.Close()
+            self.dialog.reset()
+            self.cancelled = True
+            print(f"Cancelled after {queue.position} of {len(queue.commands)} commands.")
+            return
+        self.timer.stop()
+        self.busy = True
+        try:
+            done = queue.Step()
+        except Exception as e:
+            queue.Close()
+            self.dialog.reset()
+            print(f"Command {queue.position} failed: {e}")
+            return
+        finally:
+            self.busy = False
+        self.SetProgress(queue.position, len(queue.commands), None)
+        if done:
+            self.dialog.reset()
+            if self.then:
+                self.then(queue)
+        else:
+            self.timer.start()
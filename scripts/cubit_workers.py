@@ -0,0 +1,110 @@
+#!python
+"""
+    Run meshing tasks in separate Cubit worker processes. The current model
+    is saved to a temporary cub5 file, each worker opens the file in its own
+    Cubit session (no graphics, no journal), runs a task from mesh_worker.py
+    and prints a JSON result. The workers are started from threads so the
+    number of concurrent workers follows the number of cores.
+
+    The worker needs a Python interpreter that can import the cubit module.
+    Set the TIRE_WORKER_PYTHON environment variable if the interpreter can't
+    be found next to the Cubit installation.
+"""
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import cubit
+
+RESULT_PREFIX = "TIRE_WORKER_RESULT "
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+# Find a python interpreter that can run the worker script
+def WorkerPython():
+    python = os.environ.get("TIRE_WORKER_PYTHON")
+    if python:
+        return python
+    if os.path.basename(sys.executable).lower().startswith("python"):
+        return sys.executable
+    cubit_dir = os.path.dirname(os.path.abspath(cubit.__file__))
+    for directory in (cubit_dir, os.path.join(cubit_dir, "python"), os.path.join(cubit_dir, "python", "bin")):
+        for name in ("python3", "python3.exe", "python", "python.exe"):
+            candidate = os.path.join(directory, name)
+            if os.path.isfile(candidate):
+                return candidate
+    raise RuntimeError("Unable to find a python interpreter for the worker processes. Set TIRE_WORKER_PYTHON.")
+
+
+def WorkerCount(tasks):
+    return max(1, min(len(tasks), os.cpu_count() or 1))
+
+
+# A temporary directory for the model snapshot and the task files, and the
+# worker processes that are running
+class WorkerSession():
+    def __init__(self):
+        self.directory = tempfile.mkdtemp(prefix="tire_workers_")
+        self.model = None
+        self.lock = threading.Lock()
+        self.processes = []
+        self.terminated = False
+
+    # Start a worker process unless the session was terminated. Returns the Popen or None.
+    def Start(self, args, env):
+        with self.lock:
+            if self.terminated:
+                return None
+            process = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, env=env)
+            self.processes.append(process)
+            return process
+
+    # Stop the running workers, the tasks that did not start yet are not started
+    def Terminate(self):
+        with self.lock:
+            self.terminated = True
+            for process in self.processes:
+                if process.poll() is None:
+                    process.terminate()
+
+    # Save the current model (geometry, mesh attributes and any mesh) for the workers
+    def SaveModel(self):
+        self.model = os.path.join(self.directory, "model.cub5")
+        cubit.cmd(f'save cub5 "{self.model}" overwrite')
+        return self.model
+
+    def Cleanup(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+# Run one task in a worker process and return the decoded result
+def RunTask(session, index, task):
+    task = dict(task, model=session.model)
+    task_file = os.path.join(session.directory, f"task_{index}.json")
+    with open(task_file, "w") as f:
+        json.dump(task, f)
+
+    env = dict(os.environ)
+    cubit_dir = os.path.dirname(os.path.abspath(cubit.__file__))
+    env["PYTHONPATH"] = os.pathsep.join([SCRIPT_DIR, cubit_dir, env.get("PYTHONPATH", "")])
+    process = session.Start([WorkerPython(), os.path.join(SCRIPT_DIR, "mesh_worker.py"), task_file], env)
+    if process is None:
+        return {"error": "cancelled"}
+    stdout, stderr = process.communicate()
+    for line in reversed(stdout.splitlines()):
+        if line.startswith(RESULT_PREFIX):
+            return json.loads(line[len(RESULT_PREFIX):])
+    return {"error": stderr.strip()[-500:] or f"worker exited with code {process.returncode}"}
+
+
+# Start the tasks on a thread pool. Returns the executor and the list of futures,
+# the caller polls the futures so that the GUI stays responsive.
+def StartTasks(session, tasks, max_workers=None):
+    executor = ThreadPoolExecutor(max_workers=max_workers or WorkerCount(tasks))
+    futures = [executor.submit(RunTask, session, i, task) for i, task in enumerate(tasks)]
+    return executor, futures
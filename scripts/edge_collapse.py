@@ -3,11 +3,17 @@ import numpy as np
 import sys
 
 from PySide6.QtCore import QMetaObject, Qt, QSize
-from PySide6.QtGui import QIcon
+from PySide6.QtGui import QIcon, QFontDatabase
 from PySide6.QtWidgets import QApplication, QDialog, QGridLayout, QLabel, QLineEdit, \
-    QDialogButtonBox, QPushButton, QHBoxLayout, QSpacerItem, QSizePolicy, QDockWidget
+    QDialogButtonBox, QPushButton, QHBoxLayout, QSpacerItem, QSizePolicy, QDockWidget, QPlainTextEdit, \
+    QSpinBox
 
 import cubit_utils
+import mesh_arrays
+import mesh_collapse
+import mesh_journal
+import mesh_quality
+import mesh_smooth
 import logging
 import os
 
@@ -36,11 +42,23 @@ class CollapseEdge(QDialog):
 
         self.zoomLayout = QHBoxLayout()
         self.badTriangle = QPushButton()
-        self.badTriangle.setText("Zoom to bad triangle")
+        self.badTriangle.setText("Zoom to worst element")
         self.zoomLayout.addWidget(self.badTriangle) 
         self.badTriangle.clicked.connect(self.ZoomToBadTriangle)
 
-        self.badTriangleLabel = QLabel(u"Bad Triangle: ")  
+        self.previousButton = QPushButton()
+        self.previousButton.setText("<")
+        self.previousButton.setToolTip("Zoom to the previous (worse) element")
+        self.zoomLayout.addWidget(self.previousButton)
+        self.previousButton.clicked.connect(self.ZoomToPrevious)
+
+        self.nextButton = QPushButton()
+        self.nextButton.setText(">")
+        self.nextButton.setToolTip("Zoom to the next (better) element")
+        self.zoomLayout.addWidget(self.nextButton)
+        self.nextButton.clicked.connect(self.ZoomToNext)
+
+        self.badTriangleLabel = QLabel(u"Bad Element: ")  
         self.zoomLayout.addWidget(self.badTriangleLabel) 
 
         self.badTriangleValue = QLabel("0")  
@@ -54,16 +72,67 @@ class CollapseEdge(QDialog):
         self.gridLayout.addLayout(self.zoomLayout, 0, 0, 1, 4)
         self.gridLayout.setColumnStretch(0, 1)
 
+        self.otherQualityValue = QLabel("")
+        self.gridLayout.addWidget(self.otherQualityValue, 1, 0, 1, 4)
+
         self.collapseEdgeLabel = QLabel("Select Edge to Collapse")
-        self.gridLayout.addWidget(self.collapseEdgeLabel, 1, 0)
+        self.gridLayout.addWidget(self.collapseEdgeLabel, 2, 0)
         self.collapseEdge = SelectLineEdit("Edge", self)
-        self.gridLayout.addWidget(self.collapseEdge, 1, 1)
+        self.gridLayout.addWidget(self.collapseEdge, 2, 1)
 
         self.edgeSelect = QPushButton()
         self.edgeSelect.setText("Add Selected Edge")
-        self.gridLayout.addWidget(self.edgeSelect, 1, 2) 
+        self.gridLayout.addWidget(self.edgeSelect, 2, 2) 
         self.edgeSelect.clicked.connect(self.GetSelectedEdge)
 
+        self.cleanupLabel = QLabel("Cleanup Threshold")
+        self.gridLayout.addWidget(self.cleanupLabel, 3, 0)
+        self.cleanupThreshold = QLineEdit()
+        self.cleanupThreshold.setText("%g" % mesh_quality.METRICS['scaled jacobian'][1])
+        self.cleanupThreshold.setToolTip("Triangles below this scaled Jacobian are cleaned up")
+        self.gridLayout.addWidget(self.cleanupThreshold, 3, 1)
+
+        self.cleanupButton = QPushButton()
+        self.cleanupButton.setText("Collapse Bad Triangles")
+        self.cleanupButton.setToolTip("Collapse the best edge of every bad triangle in one batch")
+        self.gridLayout.addWidget(self.cleanupButton, 3, 2)
+        self.cleanupButton.clicked.connect(self.DoCleanup)
+
+        self.histogramButton = QPushButton()
+        self.histogramButton.setText("Block Histograms")
+        self.gridLayout.addWidget(self.histogramButton, 4, 0)
+        self.histogramButton.clicked.connect(self.ShowHistograms)
+
+        self.recomputeButton = QPushButton()
+        self.recomputeButton.setText("Recompute Quality")
+        self.recomputeButton.setToolTip("Recompute the quality after the mesh was changed outside this dialog")
+        self.gridLayout.addWidget(self.recomputeButton, 4, 1)
+        self.recomputeButton.clicked.connect(self.RecomputeQuality)
+
+        self.smoothButton = QPushButton()
+        self.smoothButton.setText("Smooth Bad Elements")
+        self.smoothButton.setToolTip("Smooth the nodes around the elements below the cleanup threshold")
+        self.gridLayout.addWidget(self.smoothButton, 4, 2)
+        self.smoothButton.clicked.connect(self.DoSmooth)
+
+        self.undoLabel = QLabel("Collapses to Undo")
+        self.gridLayout.addWidget(self.undoLabel, 5, 0)
+        self.undoCount = QSpinBox()
+        self.undoCount.setMinimum(1)
+        self.undoCount.setMaximum(mesh_journal.MAX_ENTRIES)
+        self.gridLayout.addWidget(self.undoCount, 5, 1)
+        self.undoButton = QPushButton()
+        self.undoButton.setText("Undo Collapses")
+        self.undoButton.setToolTip("Undo the last collapses without going back to the cut lines")
+        self.gridLayout.addWidget(self.undoButton, 5, 2)
+        self.undoButton.clicked.connect(self.UndoCollapses)
+
+        self.histogramText = QPlainTextEdit()
+        self.histogramText.setReadOnly(True)
+        self.histogramText.setFont(QFontDatabase.systemFont(QFontDatabase.SystemFont.FixedFont))
+        self.histogramText.hide()
+        self.gridLayout.addWidget(self.histogramText, 6, 0, 1, 4)
+
         # 3. Update Dialog Button Enums
         QBtn = QDialogButtonBox.StandardButton.Ok | QDialogButtonBox.StandardButton.Apply | QDialogButtonBox.StandardButton.Cancel
         self.buttonBox = QDialogButtonBox(QBtn)
@@ -76,11 +145,15 @@ class CollapseEdge(QDialog):
 
         self.buttonBox.rejected.connect(self.reject)
 
-        self.gridLayout.addWidget(self.buttonBox, 2, 2)
+        self.gridLayout.addWidget(self.buttonBox, 7, 2)
 
         # 4. Update QSizePolicy enums and use QSize for QSpacerItem (optional, but cleaner)
         self.verticalSpacer = QSpacerItem(20, 40, QSizePolicy.Minimum, QSizePolicy.Expanding)
-        self.gridLayout.addItem(self.verticalSpacer, 3, 0, 1, 1)
+        self.gridLayout.addItem(self.verticalSpacer, 8, 0, 1, 1)
+
+        # the quality engine is computed on the first zoom and refreshed after each collapse
+        self.quality = None
+        self.position = 0
 
         self.setLayout(self.gridLayout)
     # init -- create GUI
@@ -119,36 +192,91 @@ class CollapseEdge(QDialog):
 
         return edges[0]
 
-    # Zoom to the bad triangle
+    # Compute the quality of the whole mesh once, later edits refresh it locally
+    def QualityEngine(self):
+        if self.quality is None:
+            self.quality = mesh_quality.QualityEngine()
+            self.quality.Compute()
+            self.position = 0
+        return self.quality
+
+    def RecomputeQuality(self):
+        self.quality = None
+        self.ZoomToBadTriangle()
+
+    # Zoom to the worst element
     def ZoomToBadTriangle(self):
+        self.position = 0
+        self.ZoomToPosition()
+
+    def ZoomToNext(self):
+        self.position += 1
+        self.ZoomToPosition()
+
+    def ZoomToPrevious(self):
+        self.position = max(0, self.position - 1)
+        self.ZoomToPosition()
+
+    # Zoom to the element at the current position of the ranked bad elements
+    def ZoomToPosition(self):
         try:
-            id_list = cubit.parse_cubit_list('tri', 'all')
-            if not id_list:
-                raise ValueError("No triangles found.")
-            # Assuming cubit.get_elem_quality_stats returns the minimum quality value at index 0 and element ID at index 4
-            quality_stats = cubit.get_elem_quality_stats('tri', id_list, 'scaled jacobian', 0.0, False, 0.0, 0.0, False)
-            if not quality_stats:
-                raise ValueError("Could not get triangle quality stats.")
-        
-            min_val = quality_stats[0]
-            tri_id = int(quality_stats[4])
+            engine = self.QualityEngine()
+            count = engine.Count()
+            self.position = max(0, min(self.position, count - 1))
+            element = engine.Element(self.position)
+            if element is None:
+                raise ValueError("No quads or triangles found.")
+            elem_type, elem_id, values = element
+            name = 'tri' if elem_type == mesh_arrays.TRI else 'face'
+
+            rank = f" ({self.position + 1} of {count})" if count else " (none below threshold)"
+            self.badTriangleValue.setText(f"{name} {elem_id}{rank}")
+            self.badQualityValue.setText(f"{values['scaled jacobian']:.3f}")
+            self.otherQualityValue.setText(f"Aspect Ratio: {values['aspect ratio']:.2f}   "
+                                           f"Skew: {values['skew']:.3f}   "
+                                           f"Minimum Angle: {values['minimum angle']:.1f}")
+
+            # Zoom to the bad element
+            cubit.cmd(f'zoom {name} {elem_id}')
+        except Exception as e:
+            cubit_utils.ErrorWindow(f"Error zooming to element. Error: {e}")
 
-            self.badTriangleValue.setText(str(tri_id))
-            self.badQualityValue.setText(f"{min_val:.3f}")
+    # Roll back the last collapses from the journal
+    def UndoCollapses(self):
+        count = self.undoCount.value()
+        if not mesh_journal.Count():
+            cubit_utils.ErrorWindow("There are no collapses to undo.")
+            return
+        try:
+            undone = mesh_journal.Rollback(count, self.quality)
+            print(f"Undid {undone} collapses, {mesh_journal.Count()} left in the journal.", flush=True)
+        except Exception as e:
+            cubit_utils.ErrorWindow(f"Error undoing collapses: {e}")
 
-            # Zoom to the bad triangle
-            cubit.cmd(f'zoom tri {tri_id}')
+    # Smooth the node patches around the elements below the cleanup threshold
+    def DoSmooth(self):
+        try:
+            threshold = float(self.cleanupThreshold.text())
+        except ValueError:
+            cubit_utils.ErrorWindow("The cleanup threshold must be a number.")
+            return
+        try:
+            report = mesh_smooth.SmoothBadElements(self.QualityEngine(), threshold)
+            print(report, flush=True)
+            self.histogramText.setPlainText(report)
+            self.histogramText.show()
+            self.ZoomToBadTriangle()
         except Exception as e:
-            cubit_utils.ErrorWindow(f"Error zooming to triangle. Error: {e}")
-
-    # remove the duplicate node from the connectivity.
-    def QuadToTriConnectivity(self, conn):
-        # Simplify this by using a python 3.7+ dict
-        new_conn = list(dict.fromkeys(conn))
-        if len(new_conn) != 3:
-          raise ValueError("More than one edge selected.")
-        return new_conn
-        
+            cubit_utils.ErrorWindow(f"Error smoothing the mesh: {e}")
+
+    # Show the scaled Jacobian histogram of every block
+    def ShowHistograms(self):
+        try:
+            self.histogramText.setPlainText(mesh_quality.HistogramReport(self.QualityEngine()))
+            self.histogramText.show()
+        except Exception as e:
+            cubit_utils.ErrorWindow(f"Error computing the block histograms. Error: {e}")
+
     # Collapse an edge between two 2D mesh entities
     def DoCollapseEdge(self):
         """
@@ -164,66 +292,37 @@ class CollapseEdge(QDialog):
             return
 
         try:
-            nodes = cubit.parse_cubit_list('node', f'in edge {edge}')
-            # 'is_merged' check is often for geometric entities, but used here on curves.
-            outside_nodes = cubit.parse_cubit_list('node', f'in edge {edge} in curve with not is_merged') 
-            primary_node = min(nodes)
-            secondary_node = max(nodes)
-
-            # We must merge to the outer node if there is one
-            if len(outside_nodes) == 1:
-                if primary_node != outside_nodes[0]:
-                    secondary_node, primary_node = primary_node, secondary_node
-            elif len(outside_nodes) == 0:
-                pass
-            else:
-                cubit_utils.ErrorWindow("More than one exterior node found. Cannot collapse edge.")
-                print("More than one exterior node found. Cannot collapse edge.", flush=True)
-                return
-
-            tris = cubit.parse_cubit_list('tri', f'in edge {edge}')
-            quads = cubit.parse_cubit_list('face', f'in edge {edge}')
-
-            # these commands are not undoable and they don't account for
-            # all the 3D cases so they are behind a developer flag
-            cubit.cmd('set dev on')
+            collapse = mesh_collapse.EdgeCollapse(edge)
+        except ValueError as e:
+            cubit_utils.ErrorWindow(str(e))
+            print(e, flush=True)
+            return
 
-            # The merge commands merges the secondary node into the primary node
-            cubit.cmd(f'merge node {secondary_node} {primary_node}')
-    
-            # there could have been multiple tris on the edge, delete them all
-            for tri in tris:
-                cubit.cmd(f'delete tri {tri}')
-                print(f'delete tri {tri}', flush=True)
-
-            # I don't think the user would want to collapse multiple quads, but 
-            # handle it just in case.
-            print('before QuadToTriConnectivity for loop', flush=True)
-            for quad in quads:
-                conn = cubit.get_connectivity('face', quad)
-                owner = cubit.get_geometric_owner('face', str(quad))
-                owner_string = ''
-                if owner:
-                    owner_string = "owner " + owner[0]
-                # Get the connectivity of the quad and remove the merged node
-                try:
-                    # find and remove the duplicate node after merging
-                    tri_conn = self.QuadToTriConnectivity(conn)
-                  
-                    cubit.cmd(f'delete face {quad}')
-                    cubit.cmd(f'create tri node {tri_conn[0]} {tri_conn[1]} {tri_conn[2]} {owner_string}')
-                except Exception as e:
-                    print(f"Error creating triangle from quad: {e}", flush=True)
-                    cubit_utils.ErrorWindow(f"Error creating triangle from quad: {e}", e)
-                    return
-
-            cubit.cmd('set dev off')
+        try:
+            # the quality of the elements around the collapsed edge is updated
+            mesh_collapse.ApplyCollapses([collapse], self.quality)
 
             # clear the selected edge in the GUI
             self.collapseEdge.clear()
 
         except Exception as e:
-            cubit_utils.ErrorWindow(f"Error collapsing edge: {e}", e)
+            cubit_utils.ErrorWindow(f"Error collapsing edge: {e}")
+
+    # Collapse the edges of all triangles below the threshold
+    def DoCleanup(self):
+        try:
+            threshold = float(self.cleanupThreshold.text())
+        except ValueError:
+            cubit_utils.ErrorWindow("The cleanup threshold must be a number.")
+            return
+        try:
+            report = mesh_collapse.CleanupBadTriangles(self.QualityEngine(), threshold)
+            print(report, flush=True)
+            self.histogramText.setPlainText(report)
+            self.histogramText.show()
+            self.ZoomToBadTriangle()
+        except Exception as e:
+            cubit_utils.ErrorWindow(f"Error cleaning up bad triangles: {e}")
 
 
 def main():
@@ -1,12 +1,16 @@
 #!python
 import numpy as np
 import sys
+import time
 from cubit_utils import *
+import cubit_tasks
+import mesh_arrays
+import rebar_chains
 
 # 1. Update Imports to PySide6
 from PySide6.QtCore import QMetaObject, Qt
 from PySide6.QtWidgets import QApplication, QDialog, QGridLayout, QLabel, \
-                       QLineEdit, QDialogButtonBox, QPushButton, QMessageBox
+                       QLineEdit, QDialogButtonBox, QPushButton, QMessageBox, QSpinBox, QCheckBox
 
 #
 # Draw rebar block edge orientation.
@@ -14,7 +18,7 @@ from PySide6.QtWidgets import QApplication, QDialog, QGridLayout, QLabel, \
 class TireRebarDirection(QDialog):
     def __init__(self, parent):
         super().__init__(parent)
-        self.resize(239, 150)
+        self.resize(239, 180)
         self.setWindowTitle("Draw Rebar Blocks")
         self.setObjectName("TireDrawRebar")
 
@@ -32,6 +36,15 @@ class TireRebarDirection(QDialog):
         self.rebarScaleLineEdit = QLineEdit()
         self.gridLayout.addWidget(self.rebarScaleLineEdit, 1, 1)
         self.rebarScaleLineEdit.setText("1.0")
+        # level of detail, large models draw every k-th edge or one arrow per chain
+        self.everyLabel = QLabel(u"Draw Every k-th Edge:")
+        self.gridLayout.addWidget(self.everyLabel, 2, 0)
+        self.everySpinBox = QSpinBox()
+        self.everySpinBox.setRange(1, 1000)
+        self.everySpinBox.setValue(1)
+        self.gridLayout.addWidget(self.everySpinBox, 2, 1)
+        self.perChainCheckBox = QCheckBox("One Arrow per Chain")
+        self.gridLayout.addWidget(self.perChainCheckBox, 2, 2)
 
         # 2. Update Dialog Button Enums
         QBtn = QDialogButtonBox.StandardButton.Ok | QDialogButtonBox.StandardButton.Cancel
@@ -41,7 +54,12 @@ class TireRebarDirection(QDialog):
         self.buttonBox.accepted.connect(self.accept)
         self.buttonBox.rejected.connect(self.reject)
 
-        self.gridLayout.addWidget(self.buttonBox, 2, 1)
+        self.gridLayout.addWidget(self.buttonBox, 3, 1)
+        self.verifyButton = QPushButton()
+        self.verifyButton.setAutoDefault(False)
+        self.verifyButton.setText("Verify Chains")
+        self.gridLayout.addWidget(self.verifyButton, 3, 0)
+        self.verifyButton.clicked.connect(self.VerifyChains)
         self.setLayout(self.gridLayout)
         QMetaObject.connectSlotsByName(self)
         # Assuming cubit object is available globally/in scope
@@ -88,18 +106,65 @@ class TireRebarDirection(QDialog):
 
         # 3. Update Qt.WaitCursor to PySide6 Enum syntax
         claro.setCursor(Qt.CursorShape.WaitCursor)
-        
-        for block_id in block_ids:
-            edges = cubit.get_block_edges(block_id)
-            for edge in edges:
-                conn = cubit.get_connectivity('edge', edge)
-                loc1 = np.array(cubit.get_nodal_coordinates(conn[0]))
-                loc2 = np.array(cubit.get_nodal_coordinates(conn[1]))
-                dir = loc2 - loc1
-                length = np.linalg.norm(dir) * scale
-                cubit.silent_cmd(f'draw axis direction {dir[0]} {dir[1]} {dir[2]} origin node {conn[0]} length {length}')
-        
+
+        # load the bars of all blocks at once and compute the arrows in one pass
+        block_edges = [e for b in block_ids for e in cubit.get_block_edges(b)]
+        mesh = mesh_arrays.MeshArrays.Load([], bar_edges=block_edges)
+        rows = rebar_chains.ArrowRows(mesh.bar_nodes, self.everySpinBox.value(), self.perChainCheckBox.isChecked())
+        points = mesh.coords[mesh.NodeIndex(mesh.bar_nodes[rows])]
+        directions = points[:, 1] - points[:, 0]
+        lengths = np.linalg.norm(directions, axis=1) * scale
+        origins = mesh.bar_nodes[rows, 0]
+
         claro.unsetCursor()
+
+        # draw the arrows in time slices with one graphics update at the end
+        commands = [f'draw axis direction {dx} {dy} {dz} origin node {node} length {length}'
+                    for (dx, dy, dz), node, length in zip(directions, origins, lengths)]
+        queue = cubit_tasks.CommandQueue(commands, undo_group=False,
+                                         begin=['graphics autoflush off'], end=['graphics autoflush on'])
+        self.runner = cubit_tasks.ProgressRunner(claro, "Drawing rebar directions")
+        self.runner.Execute(queue, then=lambda q: print(f"Drew {len(rows)} of {len(mesh.bar_ids)} rebar edge directions."))
+
+    # Check the order and sense of the rebar chains (rebar_chains.py) and
+    # offer to renumber the chains that don't run clockwise
+    def VerifyChains(self):
+        self.StartVerification(self.GetRebarLineEdit() or None)
+
+    # After a fix the chains are checked again and no further fix is offered
+    def StartVerification(self, block_ids, after_fix=False):
+        try:
+            verifier = rebar_chains.ChainVerifier(block_ids)
+        except Exception as e:
+            ErrorWindow(f"Unable to verify the rebar chains: {e}")
+            return
+        # the chains are checked in a worker thread, the results are shown on the main thread
+        self.verify_start = time.perf_counter()
+        self.runner = cubit_tasks.ProgressRunner(claro, "Verifying rebar chains")
+        self.runner.Analyze(verifier.Run, then=lambda consistent: self.ShowVerification(verifier, consistent, after_fix),
+                            failed=lambda e: ErrorWindow(f"Unable to verify the rebar chains: {e}"))
+
+    def ShowVerification(self, verifier, consistent, after_fix=False):
+        print(verifier.Report())
+        print(f"Verified {len(verifier.blocks)} rebar blocks in {time.perf_counter() - self.verify_start:.2f}s.")
+        if consistent:
+            print("All rebar chains are continuous and run clockwise.")
+            return
+        fixable = verifier.FixableBlocks()
+        if fixable and after_fix:
+            WarningWindow(f"{len(fixable)} rebar blocks still have reversed or unordered chains after renumbering, "
+                          "see the command line output.")
+        elif fixable:
+            result = QuestionWindow(f"{len(fixable)} rebar blocks have reversed or unordered chains. Renumber them clockwise?")
+            if result == QMessageBox.StandardButton.Yes:
+                error_blocks = verifier.Fix()
+                if error_blocks:
+                    WarningWindow(f"Unable to renumber the following blocks: {' '.join(str(b) for b in error_blocks)}")
+                # the renumbered chains are loaded and checked again
+                self.StartVerification(verifier.blocks, after_fix=True)
+                return
+        if any(r['breaks'] or r['branches'] for r in verifier.results.values()):
+            WarningWindow("Some rebar chains are broken or branch, see the command line output.")
             
 def main():
     # 'claro' must be defined in the calling scope
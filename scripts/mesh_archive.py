@@ -0,0 +1,193 @@
+#!python
+"""
+    Binary mesh archive for the downstream tools (post-processing, mapping,
+    3D generation) so they don't have to reopen Cubit or parse the deck.
+
+    Layout, all integers little endian:
+      magic      8 bytes  b"TIREMSH\0"
+      version    uint32
+      toc size   uint32   bytes of the table of contents
+      toc        JSON     {"arrays": {name: [dtype, shape, offset]}, "names": {...}}
+      arrays     each one starts on a 64 byte boundary
+
+    The arrays hold the nodes, the faces and bars (with the element ids of
+    the Abaqus deck, see abaqus_writer.py), the block, nodeset and sideset
+    membership in CSR form (<set>_offsets into <set>_members), the rebar
+    chains as node paths in CSR form and the node pair table of the
+    reflection. The reader maps the arrays with np.memmap, nothing is read
+    until it is used.
+
+    Run this file with python to check a write/read round trip.
+"""
+import json
+import os
+import struct
+import sys
+
+import numpy as np
+
+MAGIC = b"TIREMSH\0"
+VERSION = 1
+ALIGNMENT = 64
+HEADER = struct.Struct("<8sII")
+
+
+def Align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+# CSR form of a list of id lists. Returns (offsets, members).
+def ToCSR(groups):
+    groups = [np.asarray(g, dtype=np.int64).ravel() for g in groups]
+    offsets = np.zeros(len(groups) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(g) for g in groups])
+    members = np.concatenate(groups) if groups else np.zeros(0, dtype=np.int64)
+    return offsets, members.astype(np.int64)
+
+
+# Write the arrays and the names of the blocks and sets to an archive
+def WriteArchive(path, arrays, names=None):
+    arrays = {k: np.ascontiguousarray(v) for k, v in arrays.items()}
+    toc = {"arrays": {}, "names": names or {}}
+    # the offsets depend on the toc size, lay out again until the toc fits
+    toc_size = 0
+    while True:
+        offset = Align(HEADER.size + toc_size)
+        for name, array in arrays.items():
+            toc["arrays"][name] = [array.dtype.str, list(array.shape), offset]
+            offset = Align(offset + array.nbytes)
+        encoded = json.dumps(toc).encode("utf-8")
+        if len(encoded) <= toc_size:
+            break
+        toc_size = len(encoded) + 256
+    encoded = encoded.ljust(toc_size, b" ")
+    with open(path, "wb") as archive:
+        archive.write(HEADER.pack(MAGIC, VERSION, toc_size))
+        archive.write(encoded)
+        for name, array in arrays.items():
+            archive.seek(toc["arrays"][name][2])
+            archive.write(array.tobytes())
+    return path
+
+
+class MeshArchive():
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as archive:
+            magic, version, toc_size = HEADER.unpack(archive.read(HEADER.size))
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not a mesh archive.")
+            if version > VERSION:
+                raise ValueError(f"{path} has archive version {version}, this reader supports {VERSION}.")
+            toc = json.loads(archive.read(toc_size).decode("utf-8"))
+        self.version = version
+        self.names = toc["names"]
+        self.layout = toc["arrays"]
+        self.arrays = {}
+
+    def __contains__(self, name):
+        return name in self.layout
+
+    # The array mapped from the file, read only
+    def __getitem__(self, name):
+        if name not in self.arrays:
+            dtype, shape, offset = self.layout[name]
+            if int(np.prod(shape)) == 0:
+                self.arrays[name] = np.zeros(shape, dtype=dtype)
+            else:
+                self.arrays[name] = np.memmap(self.path, dtype=dtype, mode="r", offset=offset, shape=tuple(shape))
+        return self.arrays[name]
+
+    # Members of the i-th group of a CSR set ("blocks", "nodesets", "sidesets", "chains")
+    def Group(self, kind, index):
+        offsets = self[f"{kind}_offsets"]
+        return self[f"{kind}_members"][offsets[index]:offsets[index + 1]]
+
+    # Members of a named block, nodeset or sideset
+    def Named(self, kind, name):
+        return self.Group(kind, self.names[kind].index(name))
+
+    # Coordinates of node ids
+    def Coordinates(self, node_ids):
+        return self["coords"][np.searchsorted(self["node_ids"], node_ids)]
+
+
+# Collect the model from Cubit and write the archive
+def ExportArchive(path, node_pair_file=None):
+    # the readers run without Cubit, only the export needs it
+    import cubit
+    import abaqus_writer
+    import mesh_reflect
+    import part_scope
+    import rebar_chains
+
+    writer = abaqus_writer.AbaqusWriter()
+    mesh = writer.mesh
+    blocks = writer.blocks
+    block_names = [part_scope.BaseName(cubit.get_exodus_entity_name('block', b) or f"Block{b}") for b in blocks]
+    nodesets = part_scope.Sets('nodeset')
+    sidesets = part_scope.Sets('sideset')
+    sides = [writer.SidesetFaces(s) for s in sidesets]
+
+    chains, chain_blocks = [], []
+    for block in blocks:
+        rows = np.isin(mesh.bar_ids, cubit.get_block_edges(block))
+        for path_nodes, _ in rebar_chains.Chains(mesh.bar_nodes[rows]):
+            chains.append(path_nodes)
+            chain_blocks.append(block)
+
+    arrays = {
+        "node_ids": mesh.node_ids, "coords": mesh.coords,
+        "face_ids": writer.face_elements, "face_types": mesh.face_types,
+        "face_nodes": mesh.face_nodes, "face_surface": mesh.face_surface,
+        "bar_ids": writer.bar_elements, "bar_nodes": mesh.bar_nodes,
+        "block_ids": np.array(blocks, dtype=np.int64),
+        "nodeset_ids": np.array(nodesets, dtype=np.int64),
+        "sideset_ids": np.array(sidesets, dtype=np.int64),
+        "chain_blocks": np.array(chain_blocks, dtype=np.int64),
+    }
+    arrays["blocks_offsets"], arrays["blocks_members"] = ToCSR([writer.BlockElements(b) for b in blocks])
+    arrays["nodesets_offsets"], arrays["nodesets_members"] = \
+        ToCSR([writer.NodesetNodes(n) for n in nodesets])
+    # sideset members are (element id, face number) pairs
+    arrays["sidesets_offsets"], members = ToCSR([np.column_stack(s) for s in sides])
+    arrays["sidesets_members"] = members.reshape(-1, 2)
+    arrays["sidesets_offsets"] //= 2
+    arrays["chains_offsets"], arrays["chains_members"] = ToCSR(chains)
+    node_pair_file = node_pair_file or os.path.join(os.getcwd(), mesh_reflect.NODE_PAIR_FILE)
+    if os.path.exists(node_pair_file):
+        arrays["node_pairs"] = np.loadtxt(node_pair_file, delimiter=",", skiprows=1, dtype=np.int64).reshape(-1, 2)
+
+    names = {"blocks": block_names,
+             "nodesets": [part_scope.BaseName(cubit.get_exodus_entity_name('nodeset', n) or f"Nodeset{n}") for n in nodesets],
+             "sidesets": [part_scope.BaseName(cubit.get_exodus_entity_name('sideset', s) or f"Surface{s}") for s in sidesets]}
+    return WriteArchive(path, arrays, names)
+
+
+# Write a small archive, read it back and compare every array
+def RoundTripCheck(path):
+    rng = np.random.default_rng(0)
+    offsets, members = ToCSR([[1, 2, 3], [], [7, 9]])
+    arrays = {"node_ids": np.arange(1, 101, dtype=np.int64), "coords": rng.random((100, 3)),
+              "face_types": np.full(30, 4, dtype=np.int8), "face_nodes": rng.integers(1, 101, (30, 4)),
+              "blocks_offsets": offsets, "blocks_members": members, "empty": np.zeros((0, 2), dtype=np.int64)}
+    WriteArchive(path, arrays, {"blocks": ["a", "b", "c"]})
+    archive = MeshArchive(path)
+    for name, array in arrays.items():
+        read = archive[name]
+        assert read.dtype == array.dtype and read.shape == array.shape and np.array_equal(read, array), name
+        assert archive.layout[name][2] % ALIGNMENT == 0, name
+    assert list(archive.Named("blocks", "c")) == [7, 9]
+    assert len(archive.Named("blocks", "b")) == 0
+    assert np.allclose(archive.Coordinates([5, 1]), arrays["coords"][[4, 0]])
+    return True
+
+
+if __name__ == "__main__":
+    check_path = sys.argv[1] if len(sys.argv) > 1 else "mesh_archive_check.tmsh"
+    try:
+        RoundTripCheck(check_path)
+        print(f"Round trip of {check_path} passed.")
+    finally:
+        if os.path.exists(check_path):
+            os.remove(check_path)
@@ -0,0 +1,222 @@
+#!python
+"""
+    Bulk mesh arrays. One pass of Cubit queries loads the element
+    connectivity and the node coordinates into NumPy arrays so the mesh
+    tools can work on whole meshes at once instead of issuing a Cubit query
+    for every entity.
+
+    Quads and triangles are stored together in one (n, 4) face array. A
+    triangle has -1 in the last column. Cubit numbers quads and triangles
+    separately so a face is identified by its type (4 or 3) and its id.
+"""
+import numpy as np
+
+import cubit
+
+import part_scope
+
+QUAD = 4
+TRI = 3
+
+# local node pairs of the sides of quads and triangles, in Abaqus side order
+QUAD_SIDES = ((0, 1), (1, 2), (2, 3), (3, 0))
+TRI_SIDES = ((0, 1), (1, 2), (2, 0))
+
+
+class MeshArrays():
+    def __init__(self):
+        self.node_ids = np.zeros(0, dtype=np.int64)
+        self.coords = np.zeros((0, 3))
+        self.face_ids = np.zeros(0, dtype=np.int64)
+        self.face_types = np.zeros(0, dtype=np.int8)
+        self.face_nodes = np.zeros((0, 4), dtype=np.int64)
+        self.face_surface = np.zeros(0, dtype=np.int64)
+        self.bar_ids = np.zeros(0, dtype=np.int64)
+        self.bar_nodes = np.zeros((0, 2), dtype=np.int64)
+
+    # Load the quads and triangles of the surfaces (the surfaces of the active
+    # part by default, see part_scope.py). With include_free the faces that
+    # are not owned by a surface are added with surface 0. Bar elements are
+    # loaded from the given edge ids. Without coordinates only the node ids
+    # are loaded, for queries on the connectivity alone.
+    @classmethod
+    def Load(cls, surfaces=None, include_free=False, bar_edges=(), coordinates=True):
+        mesh = cls()
+        if surfaces is None:
+            surfaces = part_scope.Entities('surface')
+        ids, types, nodes, owners = [], [], [], []
+        owned = {QUAD: set(), TRI: set()}
+        for surf in surfaces:
+            for elem_type, elem_ids in ((QUAD, cubit.get_surface_quads(surf)), (TRI, cubit.get_surface_tris(surf))):
+                for elem in elem_ids:
+                    ids.append(elem)
+                    types.append(elem_type)
+                    nodes.append(FaceConnectivity(elem_type, elem))
+                    owners.append(surf)
+                owned[elem_type].update(elem_ids)
+        if include_free:
+            for elem_type, name in ((QUAD, 'face'), (TRI, 'tri')):
+                for elem in part_scope.Elements(name):
+                    if elem not in owned[elem_type]:
+                        ids.append(elem)
+                        types.append(elem_type)
+                        nodes.append(FaceConnectivity(elem_type, elem))
+                        owners.append(0)
+
+        if ids:
+            mesh.face_ids = np.array(ids, dtype=np.int64)
+            mesh.face_types = np.array(types, dtype=np.int8)
+            mesh.face_nodes = np.array(nodes, dtype=np.int64)
+            mesh.face_surface = np.array(owners, dtype=np.int64)
+        mesh.LoadBars(bar_edges)
+        mesh.LoadNodes(coordinates)
+        return mesh
+
+    def LoadBars(self, bar_edges):
+        bar_edges = list(bar_edges)
+        if bar_edges:
+            self.bar_ids = np.array(bar_edges, dtype=np.int64)
+            self.bar_nodes = np.array([cubit.get_connectivity('edge', e)[:2] for e in bar_edges], dtype=np.int64)
+
+    # Load the coordinates of every node used by the faces and bars
+    def LoadNodes(self, coordinates=True):
+        used = np.concatenate([self.face_nodes.ravel(), self.bar_nodes.ravel()])
+        self.node_ids = np.unique(used[used >= 0])
+        if not coordinates:
+            return
+        self.coords = np.array([cubit.get_nodal_coordinates(int(n)) for n in self.node_ids]).reshape(-1, 3)
+
+    # Reload the coordinates of the given nodes after they were moved
+    def RefreshNodes(self, node_ids):
+        node_ids = np.asarray(node_ids, dtype=np.int64)
+        index = self.NodeIndex(node_ids)
+        self.coords[index] = np.array([cubit.get_nodal_coordinates(int(n)) for n in node_ids]).reshape(-1, 3)
+
+    # Row of each (type, id) face, dead faces are left out
+    def FaceRows(self):
+        live = np.nonzero(self.face_types > 0)[0]
+        return {(int(self.face_types[i]), int(self.face_ids[i])): int(i) for i in live}
+
+    # Update the arrays after a local edit. The removed faces, given as
+    # (type, id), are marked dead (type 0) and the added faces are appended
+    # with their connectivity, owner and node coordinates loaded from Cubit.
+    # Returns the rows of the added faces.
+    def UpdateFaces(self, removed=(), added=()):
+        rows = self.FaceRows()
+        for face in removed:
+            row = rows.get(tuple(face))
+            if row is not None:
+                self.face_types[row] = 0
+        added = [tuple(f) for f in added]
+        if not added:
+            return np.zeros(0, dtype=np.int64)
+
+        start = len(self.face_ids)
+        self.face_ids = np.concatenate([self.face_ids, np.array([f[1] for f in added], dtype=np.int64)])
+        self.face_types = np.concatenate([self.face_types, np.array([f[0] for f in added], dtype=np.int8)])
+        new_nodes = np.array([FaceConnectivity(t, i) for t, i in added], dtype=np.int64).reshape(-1, 4)
+        self.face_nodes = np.concatenate([self.face_nodes, new_nodes])
+        self.face_surface = np.concatenate([self.face_surface, np.array([FaceOwner(t, i) for t, i in added],
+                                                                        dtype=np.int64)])
+        self.AddNodes(new_nodes.ravel())
+        return np.arange(start, len(self.face_ids))
+
+    # Keep only the given face rows, the nodes no longer used by a face or a
+    # bar are dropped
+    def KeepFaces(self, rows):
+        rows = np.asarray(rows, dtype=np.int64)
+        self.face_ids = self.face_ids[rows]
+        self.face_types = self.face_types[rows]
+        self.face_nodes = self.face_nodes[rows]
+        self.face_surface = self.face_surface[rows]
+        used = np.concatenate([self.face_nodes.ravel(), self.bar_nodes.ravel()])
+        keep = np.isin(self.node_ids, used)
+        self.node_ids = self.node_ids[keep]
+        self.coords = self.coords[keep]
+
+    # Add any of the given node ids that are not loaded yet
+    def AddNodes(self, node_ids):
+        node_ids = np.unique(np.asarray(node_ids, dtype=np.int64))
+        missing = np.setdiff1d(node_ids[node_ids >= 0], self.node_ids)
+        if not len(missing):
+            return
+        coords = np.array([cubit.get_nodal_coordinates(int(n)) for n in missing]).reshape(-1, 3)
+        all_ids = np.concatenate([self.node_ids, missing])
+        order = np.argsort(all_ids)
+        self.node_ids = all_ids[order]
+        self.coords = np.concatenate([self.coords, coords])[order]
+
+    # Index into node_ids/coords of the given node ids, -1 stays -1
+    def NodeIndex(self, node_ids):
+        node_ids = np.asarray(node_ids, dtype=np.int64)
+        index = np.searchsorted(self.node_ids, node_ids)
+        return np.where(node_ids < 0, -1, index)
+
+    # Face connectivity as node indices, triangles keep -1 in the last column
+    def FaceIndex(self):
+        return self.NodeIndex(self.face_nodes)
+
+    # Integer key of an undirected edge between two node ids
+    def EdgeKey(self, a, b):
+        base = int(self.node_ids.max()) + 1 if len(self.node_ids) else 1
+        a = np.asarray(a, dtype=np.int64)
+        b = np.asarray(b, dtype=np.int64)
+        return np.minimum(a, b) * base + np.maximum(a, b)
+
+    # All face sides. Returns (nodes (k, 2) in face orientation, face index (k,), side (k,))
+    def FaceSides(self):
+        nodes, faces, sides = [], [], []
+        for elem_type, local_sides in ((QUAD, QUAD_SIDES), (TRI, TRI_SIDES)):
+            face_index = np.nonzero(self.face_types == elem_type)[0]
+            for side, (i, j) in enumerate(local_sides):
+                nodes.append(np.stack([self.face_nodes[face_index, i], self.face_nodes[face_index, j]], axis=1))
+                faces.append(face_index)
+                sides.append(np.full(len(face_index), side, dtype=np.int8))
+        if not nodes:
+            return np.zeros((0, 2), dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int8)
+        return np.concatenate(nodes), np.concatenate(faces), np.concatenate(sides)
+
+    # The sides used by only one face. Returns the same tuple as FaceSides.
+    def BoundarySides(self):
+        nodes, faces, sides = self.FaceSides()
+        keys = self.EdgeKey(nodes[:, 0], nodes[:, 1])
+        _, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+        single = counts[inverse] == 1
+        return nodes[single], faces[single], sides[single]
+
+
+# A stage that only loads the faces owned by surfaces was started on a mirrored mesh
+class MirroredMesh(Exception):
+    pass
+
+
+# Number of quads and triangles of the active part that are not owned by a
+# surface, the faces created by mirroring the mesh (mesh_reflect.py)
+def FreeFaceCount():
+    owned = sum(len(cubit.get_surface_quads(s)) + len(cubit.get_surface_tris(s))
+                for s in part_scope.Entities('surface'))
+    return len(part_scope.Elements('face')) + len(part_scope.Elements('tri')) - owned
+
+
+# Stop a stage that works on the surface meshes of the half section
+def RefuseMirrored(stage):
+    if FreeFaceCount():
+        raise MirroredMesh(f"{stage} needs the mesh of the half section, run it before mirroring the mesh.")
+
+
+# The surface that owns a face, 0 for a free face
+def FaceOwner(elem_type, elem):
+    try:
+        owner = cubit.get_geometric_owner('face' if elem_type == QUAD else 'tri', str(elem))
+        if owner and owner[0].startswith('surface'):
+            return int(owner[0].split()[1])
+    except Exception:
+        pass
+    return 0
+
+
+# Connectivity of a quad or triangle padded to four nodes
+def FaceConnectivity(elem_type, elem):
+    if elem_type == QUAD:
+        return list(cubit.get_connectivity('face', elem))[:4]
+    return list(cubit.get_connectivity('tri', elem))[:3] + [-1]
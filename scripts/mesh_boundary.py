@@ -0,0 +1,166 @@
+#!python
+"""
+    Boundary sets from the exterior boundary of the mesh. The face sides
+    used by only one face (mesh_arrays.py) are extracted once and split
+    into the segments of the tire section:
+      symmetry: both nodes within SYMMETRY_TOLERANCE of y = 0,
+      inside:   from the tip node to the symmetry plane on the side that
+                a ray from the section centre in -y hits first,
+      outside:  the rest of the boundary that is not symmetry or inside,
+      tip:      the sides in the surfaces at the tip vertex that are not
+                above the tip vertex,
+      tread:    the sides of the surface that a ray from the section centre
+                in +x hits last.
+    The sidesets are created from whole curves where a segment covers a
+    curve and from mesh edges otherwise.
+"""
+import numpy as np
+
+import cubit
+
+import mesh_arrays
+import part_scope
+
+SYMMETRY_TOLERANCE = 0.006
+
+
+class ExteriorBoundary():
+    def __init__(self, surfaces=None):
+        if surfaces is None:
+            mesh_arrays.RefuseMirrored("Creating the boundary sets from the mesh")
+        self.mesh = mesh_arrays.MeshArrays.Load(surfaces)
+        self.nodes, faces, _ = self.mesh.BoundarySides()
+        self.surfaces = self.mesh.face_surface[faces]
+        self.points = self.mesh.coords[self.mesh.NodeIndex(self.nodes)]
+        self.segments = {}
+        self.LoadEdges()
+
+    # The mesh edge and curve of each boundary side, -1 where there is none
+    def LoadEdges(self):
+        keys = self.mesh.EdgeKey(self.nodes[:, 0], self.nodes[:, 1])
+        edge_keys, edge_ids, edge_curves = [], [], []
+        for curve in cubit.parse_cubit_list('curve', f'{part_scope.Within()} with num_parents=1'):
+            for edge in cubit.parse_cubit_list('edge', f'in curve {curve}'):
+                a, b = cubit.get_connectivity('edge', edge)[:2]
+                edge_keys.append(self.mesh.EdgeKey(a, b))
+                edge_ids.append(edge)
+                edge_curves.append(curve)
+        self.edges = np.full(len(keys), -1, dtype=np.int64)
+        self.curves = np.full(len(keys), -1, dtype=np.int64)
+        if edge_keys:
+            edge_keys = np.array(edge_keys, dtype=np.int64)
+            order = np.argsort(edge_keys)
+            position = np.clip(np.searchsorted(edge_keys[order], keys), 0, len(order) - 1)
+            found = edge_keys[order][position] == keys
+            self.edges[found] = np.array(edge_ids)[order][position[found]]
+            self.curves[found] = np.array(edge_curves)[order][position[found]]
+        self.curve_edge_counts = dict(zip(*np.unique(np.array(edge_curves, dtype=np.int64), return_counts=True)))
+
+    # Index of the side that a ray from origin along +x or -y crosses first (or last)
+    def RayHit(self, origin, axis, last=False):
+        p0, p1 = self.points[:, 0], self.points[:, 1]
+        across = 1 - axis
+        lo = np.minimum(p0[:, across], p1[:, across])
+        hi = np.maximum(p0[:, across], p1[:, across])
+        crossing = np.nonzero((lo <= origin[across]) & (origin[across] <= hi) & (hi > lo))[0]
+        t = (origin[across] - p0[crossing, across]) / (p1[crossing, across] - p0[crossing, across])
+        hit = p0[crossing, axis] + t * (p1[crossing, axis] - p0[crossing, axis])
+        # +x for the tread, -y for the inside
+        distance = hit - origin[axis] if axis == 0 else origin[axis] - hit
+        ahead = distance > 0.0
+        if not ahead.any():
+            raise ValueError("The ray from the section centre does not hit the mesh boundary.")
+        crossing, distance = crossing[ahead], distance[ahead]
+        return int(crossing[np.argmax(distance) if last else np.argmin(distance)])
+
+    # Walk the boundary from the tip node in both directions. Returns the side
+    # indices reached in each direction, the symmetry sides stop the walk.
+    def WalkFromTip(self, tip_node, symmetry):
+        node_sides = {}
+        for i in np.nonzero(~symmetry)[0]:
+            for node in self.nodes[i]:
+                node_sides.setdefault(int(node), []).append(int(i))
+        start = node_sides.get(tip_node, [])
+        if len(start) != 2:
+            raise ValueError(f"Node {tip_node} of the tip vertex is not on the exterior mesh boundary.")
+
+        directions = []
+        for side in start:
+            visited = []
+            node = tip_node
+            while side is not None and side not in visited:
+                visited.append(side)
+                a, b = (int(n) for n in self.nodes[side])
+                node = b if a == node else a
+                following = [s for s in node_sides.get(node, []) if s != side]
+                side = following[0] if len(following) == 1 and node != tip_node else None
+            directions.append(np.array(visited, dtype=np.int64))
+        return directions
+
+    # Split the boundary into its segments, one boolean mask per segment
+    def Split(self, tip_vertex):
+        y = self.points[:, :, 1]
+        symmetry = (y > -SYMMETRY_TOLERANCE).all(axis=1)
+
+        bbox = cubit.get_total_bounding_box("body", part_scope.Bodies())
+        center = np.array([(bbox[0] + bbox[1]) / 2, (bbox[3] + bbox[4]) / 2, 0.0])
+
+        tip_node = cubit.parse_cubit_list('node', f'in vertex {tip_vertex}')[0]
+        tip_y = cubit.get_center_point('vertex', tip_vertex)[1]
+        first, second = self.WalkFromTip(tip_node, symmetry)
+        inside_hit = self.RayHit(center, 1)
+        inside = np.zeros(len(self.nodes), dtype=bool)
+        if inside_hit in set(first.tolist()):
+            inside[first] = True
+        elif inside_hit in set(second.tolist()):
+            inside[second] = True
+        else:
+            raise ValueError("The inside of the tire is not connected to the tip vertex.")
+
+        tip_surfaces = cubit.parse_cubit_list('surface', f'in vertex {tip_vertex}')
+        midpoint_y = y.mean(axis=1)
+        tip = np.isin(self.surfaces, tip_surfaces) & (midpoint_y <= tip_y) & ~symmetry
+
+        tread_surface = self.surfaces[self.RayHit(center, 0, last=True)]
+        tread = (self.surfaces == tread_surface) & ~symmetry
+
+        self.tip_node = tip_node
+        self.segments = {'symmetry': symmetry, 'inside': inside, 'outside': ~symmetry & ~inside,
+                         'tip': tip, 'tread': tread}
+        return self.segments
+
+    # Node ids of the sides in a segment
+    def SegmentNodes(self, segment):
+        return np.unique(self.nodes[self.segments[segment]])
+
+    # The curves covered by a segment and the edges of the partly covered curves
+    def SegmentCurvesAndEdges(self, segment):
+        mask = self.segments[segment] & (self.edges >= 0)
+        curves, counts = np.unique(self.curves[mask], return_counts=True)
+        whole = [int(c) for c, n in zip(curves, counts) if self.curve_edge_counts.get(c) == n]
+        partial = mask & ~np.isin(self.curves, whole)
+        return whole, [int(e) for e in self.edges[partial]]
+
+
+def CreateNodeset(name, nodes):
+    nodes = [int(n) for n in nodes]
+    if not nodes:
+        print(f"No nodes found for nodeset {name}")
+        return None
+    nodeset_id = cubit.get_next_nodeset_id()
+    cubit.silent_cmd(f"nodeset {nodeset_id} add node {cubit.string_from_id_list(nodes)}")
+    cubit.cmd(f'nodeset {nodeset_id} name "{name}"')
+    return nodeset_id
+
+
+def CreateSideset(name, curves, edges):
+    if not curves and not edges:
+        print(f"No sides found for sideset {name}")
+        return None
+    sideset_id = cubit.get_next_sideset_id()
+    if curves:
+        cubit.silent_cmd(f"sideset {sideset_id} add curve {cubit.string_from_id_list(curves)}")
+    if edges:
+        cubit.silent_cmd(f"sideset {sideset_id} add edge {cubit.string_from_id_list(edges)}")
+    cubit.cmd(f'sideset {sideset_id} name "{name}"')
+    return sideset_id
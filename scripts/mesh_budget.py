@@ -0,0 +1,158 @@
+#!python
+"""
+    Predict the number of elements in the tire cross-section before
+    meshing and solve for the mesh size that meets an element budget.
+    The geometry metrics (surface areas, curve lengths and fixed curve
+    intervals) are gathered once with Cubit queries. After that the
+    predictions are simple arithmetic and can be repeated every time
+    the mesh size changes.
+
+    Mapped surfaces are predicted as two elements through the thickness
+    (see TireMesh.SetMappableSurfaces). Paved surfaces are predicted from
+    the area and the number of intervals on the boundary. Tripave needs an
+    even number of boundary intervals to be all quads, so a surface with
+    an odd interval count is predicted to have at least one triangle.
+"""
+import math
+
+import cubit
+
+import part_scope
+
+
+# The geometry metrics needed to predict the element count of one surface.
+class SurfaceMetrics():
+    def __init__(self, surface, area, curves):
+        self.surface = surface
+        self.area = area
+        # list of (curve id, curve length, hard intervals or 0)
+        self.curves = curves
+        self.perimeter = sum(c[1] for c in curves)
+
+
+# The number of intervals on a curve if they were fixed with a hard
+# interval count (for example the mapped short sides), otherwise 0.
+def HardIntervals(curve):
+    try:
+        if cubit.get_mesh_interval_firmness('curve', curve).upper() == 'HARD':
+            return cubit.get_mesh_intervals('curve', curve)
+    except Exception as e:
+        print(f"Unable to get interval firmness on curve {curve}:", e)
+    return 0
+
+
+# Gather the metrics for the given surfaces. Curves shared between
+# surfaces are only queried once.
+def GatherSurfaceMetrics(surfaces):
+    curve_cache = {}
+    metrics = {}
+    for surf in surfaces:
+        curves = []
+        for curve in cubit.get_relatives('surface', surf, 'curve'):
+            if curve not in curve_cache:
+                curve_cache[curve] = (curve, cubit.get_curve_length(curve), HardIntervals(curve))
+            curves.append(curve_cache[curve])
+        metrics[surf] = SurfaceMetrics(surf, cubit.get_surface_area(surf), curves)
+    return metrics
+
+
+# Number of intervals cubit will put on a curve of the given length
+def CurveIntervals(length, hard_intervals, size):
+    if hard_intervals > 0:
+        return hard_intervals
+    return max(1, int(round(length / size)))
+
+
+# Predict the (quads, tris) in one surface for the given mesh size. Curves
+# with an entry in curve_sizes ({curve: size}) use that size instead.
+def PredictSurface(metric, size, mapped=False, curve_sizes=None):
+    if mapped:
+        # Treat the surface as a rectangle with the same area and perimeter.
+        # The short side is always set to two intervals for rebar.
+        half_perimeter = metric.perimeter / 2.0
+        discriminant = max(half_perimeter * half_perimeter - 4.0 * metric.area, 0.0)
+        long_side = (half_perimeter + math.sqrt(discriminant)) / 2.0
+        return 2 * max(1, int(round(long_side / size))), 0
+
+    curve_sizes = curve_sizes or {}
+    boundary_intervals = sum(CurveIntervals(c[1], c[2], curve_sizes.get(c[0], size)) for c in metric.curves)
+    tris = boundary_intervals % 2
+    # a thin surface is controlled by the boundary, a thick surface by the area
+    elements = max(metric.area / (size * size), (boundary_intervals - 2) / 2.0)
+    quads = max(0, int(round(elements)) - tris)
+    return quads, tris
+
+
+# Predict the element count of all surfaces. The size may be a single
+# value or a dictionary of surface id to size. Returns
+# ({surface: (quads, tris)}, total quads, total tris)
+def PredictElementCount(metrics, size, mapped_surfaces=(), curve_sizes=None):
+    mapped_surfaces = set(mapped_surfaces)
+    per_surface = {}
+    total_quads = 0
+    total_tris = 0
+    for surf, metric in metrics.items():
+        surf_size = size.get(surf) if isinstance(size, dict) else size
+        quads, tris = PredictSurface(metric, surf_size, surf in mapped_surfaces, curve_sizes)
+        per_surface[surf] = (quads, tris)
+        total_quads += quads
+        total_tris += tris
+    return per_surface, total_quads, total_tris
+
+
+# Find the scale factor applied to the sizes that meets the element budget.
+# The element count decreases with the mesh size so a bisection on the log
+# of the scale converges quickly. The returned scale never exceeds the budget.
+def SolveScaleForBudget(count_function, budget, iterations=60):
+    low = math.log(1.0e-4)
+    high = math.log(1.0e+4)
+    if count_function(math.exp(high)) > budget:
+        return math.exp(high)
+    for _ in range(iterations):
+        middle = (low + high) / 2.0
+        if count_function(math.exp(middle)) > budget:
+            low = middle
+        else:
+            high = middle
+    return math.exp(high)
+
+
+# Solve for the single mesh size that meets the element budget
+def SolveSizeForBudget(metrics, budget, mapped_surfaces=()):
+    def count(size):
+        _, quads, tris = PredictElementCount(metrics, size, mapped_surfaces)
+        return quads + tris
+    return SolveScaleForBudget(count, budget)
+
+
+# Solve for a size for each block that meets the element budget. The
+# ratio between the block sizes in base_sizes ({block: size}) is kept and
+# all sizes are scaled by the same factor. block_surfaces is {block: [surfaces]}.
+def SolveBlockSizesForBudget(metrics, block_surfaces, base_sizes, budget, mapped_surfaces=()):
+    def surface_sizes(scale):
+        sizes = {}
+        for block, surfaces in block_surfaces.items():
+            for surf in surfaces:
+                sizes[surf] = base_sizes[block] * scale
+        return sizes
+
+    block_metrics = {s: metrics[s] for s in surface_sizes(1.0) if s in metrics}
+
+    def count(scale):
+        _, quads, tris = PredictElementCount(block_metrics, surface_sizes(scale), mapped_surfaces)
+        return quads + tris
+
+    scale = SolveScaleForBudget(count, budget)
+    return {block: size * scale for block, size in base_sizes.items()}
+
+
+# Get the surfaces in each block of the active part, {block: [surfaces]}
+def BlockSurfaces():
+    block_surfaces = {}
+    for block in part_scope.Sets('block'):
+        surfaces = cubit.parse_cubit_list('surface', f'in block {block}')
+        if not surfaces:
+            surfaces = cubit.parse_cubit_list('surface', f'in volume in block {block}')
+        if surfaces:
+            block_surfaces[block] = list(surfaces)
+    return block_surfaces
@@ -0,0 +1,310 @@
+#!python
+"""
+    Edge collapse of bad triangles. An edge collapse merges the removed
+    node into the kept node, deletes the triangles on the edge and turns the
+    quads on the edge into triangles. The node on an exterior curve (a curve
+    that is not merged) is always kept and an edge with two exterior nodes is
+    never collapsed.
+
+    Automatic cleanup
+    1) Every edge of every triangle below the threshold is a candidate, in
+       both directions when neither node is on a curve.
+    2) The elements around each candidate are rebuilt with the merged node
+       and their scaled Jacobian is predicted in one NumPy pass
+       (mesh_quality.py). A candidate is kept if the predicted minimum is
+       better than the current minimum of the same elements.
+    3) The best candidates whose neighbourhoods don't overlap are applied
+       together in one developer mode block, then the quality index is
+       refreshed and the next pass starts from the remaining bad triangles.
+"""
+import numpy as np
+
+import cubit
+
+import mesh_journal
+import mesh_quality
+from mesh_arrays import QUAD, TRI
+
+MAX_PASSES = 5
+
+
+# One edge collapse. quads maps each quad on the edge to the triangle
+# connectivity it becomes, changed are the other (type, id) faces at the
+# removed node.
+class Collapse():
+    def __init__(self, keep, remove, tris, quads, owners, changed, score=None, before=None):
+        self.keep = keep
+        self.remove = remove
+        self.tris = tris
+        self.quads = quads
+        self.owners = owners
+        self.changed = changed
+        self.score = score
+        self.before = before
+
+
+def ExteriorNodes():
+    return set(cubit.parse_cubit_list('node', 'in curve with not is_merged'))
+
+
+def CurveNodes():
+    return set(cubit.parse_cubit_list('node', 'in curve all'))
+
+
+# The allowed (keep, remove) directions of the edge between nodes a and b
+def CollapseDirections(a, b, exterior, curve_nodes):
+    on_exterior = [n for n in (a, b) if n in exterior]
+    if len(on_exterior) == 2:
+        return []
+    if len(on_exterior) == 1:
+        keep = on_exterior[0]
+        return [(keep, b if keep == a else a)]
+    on_curve = [n for n in (a, b) if n in curve_nodes]
+    if len(on_curve) == 2:
+        return []
+    if len(on_curve) == 1:
+        keep = on_curve[0]
+        return [(keep, b if keep == a else a)]
+    return [(a, b), (b, a)]
+
+
+# The collapse of a user-picked edge with the rule of the collapse dialog:
+# merge into the exterior node if there is one, otherwise into the lowest id
+def EdgeCollapse(edge):
+    nodes = cubit.parse_cubit_list('node', f'in edge {edge}')
+    outside_nodes = cubit.parse_cubit_list('node', f'in edge {edge} in curve with not is_merged')
+    primary_node = min(nodes)
+    secondary_node = max(nodes)
+
+    # We must merge to the outer node if there is one
+    if len(outside_nodes) == 1:
+        if primary_node != outside_nodes[0]:
+            secondary_node, primary_node = primary_node, secondary_node
+    elif len(outside_nodes) > 1:
+        raise ValueError("More than one exterior node found. Cannot collapse edge.")
+
+    tris = cubit.parse_cubit_list('tri', f'in edge {edge}')
+    quads = {}
+    owners = {}
+    for quad in cubit.parse_cubit_list('face', f'in edge {edge}'):
+        conn = [primary_node if n == secondary_node else n for n in cubit.get_connectivity('face', quad)]
+        tri_conn = list(dict.fromkeys(conn))
+        if len(tri_conn) != 3:
+            raise ValueError(f"Quad {quad} does not become a triangle.")
+        quads[quad] = tri_conn
+        owner = cubit.get_geometric_owner('face', str(quad))
+        owners[quad] = owner[0] if owner else None
+    changed = [(QUAD, q) for q in cubit.parse_cubit_list('face', f'in node {secondary_node}') if q not in quads]
+    changed += [(TRI, t) for t in cubit.parse_cubit_list('tri', f'in node {secondary_node}') if t not in tris]
+    return Collapse(primary_node, secondary_node, tris, quads, owners, changed)
+
+
+# Apply the collapses in one developer mode block. The nodes are merged first,
+# then the triangles on the edges are deleted and the quads on the edges are
+# replaced by triangles. Each collapse is recorded in the journal
+# (mesh_journal.py) so it can be rolled back. The quality engine, if given,
+# is refreshed. Returns the ids of the new triangles.
+def ApplyCollapses(collapses, engine=None):
+    if not collapses:
+        return []
+    tris = [t for c in collapses for t in c.tris]
+    quads = [q for c in collapses for q in c.quads]
+    entries = [mesh_journal.Capture(c) for c in collapses]
+    new_tris = []
+
+    # these commands are not undoable and they don't account for
+    # all the 3D cases so they are behind a developer flag
+    cubit.cmd('set dev on')
+    try:
+        for c in collapses:
+            # The merge commands merges the secondary node into the primary node
+            cubit.silent_cmd(f'merge node {c.remove} {c.keep}')
+        if tris:
+            cubit.silent_cmd(f'delete tri {cubit.string_from_id_list(tris)}')
+        if quads:
+            cubit.silent_cmd(f'delete face {cubit.string_from_id_list(quads)}')
+        for c, entry in zip(collapses, entries):
+            created = []
+            for quad, conn in c.quads.items():
+                owner = c.owners.get(quad)
+                owner_string = f"owner {owner}" if owner else ""
+                cubit.silent_cmd(f'create tri node {conn[0]} {conn[1]} {conn[2]} {owner_string}')
+                created.append(cubit.get_last_id('tri'))
+            mesh_journal.Record(entry, created)
+            new_tris += created
+    finally:
+        cubit.cmd('set dev off')
+
+    if engine is not None:
+        removed = [(TRI, t) for t in tris] + [(QUAD, q) for q in quads]
+        changed = [face for c in collapses for face in c.changed]
+        engine.Refresh(removed=removed, added=[(TRI, t) for t in new_tris], changed=changed)
+    return new_tris
+
+
+class CollapsePlanner():
+    def __init__(self, engine, threshold=mesh_quality.METRICS['scaled jacobian'][1]):
+        self.engine = engine
+        self.threshold = threshold
+        self.exterior = ExteriorNodes()
+        self.curve_nodes = CurveNodes()
+
+    # node id -> rows of the live faces that use it
+    def NodeFaces(self):
+        mesh = self.engine.mesh
+        live = mesh.face_types > 0
+        rows = np.repeat(np.arange(len(mesh.face_ids)), 4)
+        nodes = mesh.face_nodes.ravel()
+        keep = (nodes >= 0) & np.repeat(live, 4)
+        rows, nodes = rows[keep], nodes[keep]
+        order = np.argsort(nodes, kind='stable')
+        nodes, rows = nodes[order], rows[order]
+        unique, starts = np.unique(nodes, return_index=True)
+        ends = np.append(starts[1:], len(nodes))
+        return {int(n): rows[s:e] for n, s, e in zip(unique, starts, ends)}
+
+    def FaceNodes(self, row):
+        nodes = self.engine.mesh.face_nodes[row]
+        return [int(n) for n in nodes if n >= 0]
+
+    # True if a and b are neighbours in the face (not diagonal in a quad)
+    def IsSide(self, nodes, a, b):
+        i, j = nodes.index(a), nodes.index(b)
+        return (i - j) % len(nodes) in (1, len(nodes) - 1)
+
+    # Build a candidate collapse. Returns (collapse, predicted faces) or None
+    # if the collapse is not valid.
+    def Candidate(self, keep, remove, node_faces):
+        mesh = self.engine.mesh
+        remove_rows = [int(r) for r in node_faces.get(remove, [])]
+        keep_rows = set(int(r) for r in node_faces.get(keep, []))
+        tris, quads, owners, changed, predicted = [], {}, {}, [], []
+        edge_nodes = set()
+        for row in remove_rows:
+            nodes = self.FaceNodes(row)
+            elem_type, elem = int(mesh.face_types[row]), int(mesh.face_ids[row])
+            if row in keep_rows:
+                if not self.IsSide(nodes, keep, remove):
+                    return None
+                edge_nodes.update(nodes)
+                if elem_type == TRI:
+                    tris.append(elem)
+                else:
+                    tri_conn = [n for n in nodes if n != remove]
+                    quads[elem] = tri_conn
+                    surf = int(mesh.face_surface[row])
+                    owners[elem] = f"surface {surf}" if surf else None
+                    predicted.append((TRI, tri_conn, surf))
+            else:
+                changed.append((elem_type, elem))
+                predicted.append((elem_type, [keep if n == remove else n for n in nodes],
+                                  int(mesh.face_surface[row])))
+
+        # the only common neighbours of the two nodes may be the nodes of the faces on the edge
+        def Neighbours(node, rows):
+            neighbours = set()
+            for row in rows:
+                nodes = self.FaceNodes(row)
+                i = nodes.index(node)
+                neighbours.update((nodes[i - 1], nodes[(i + 1) % len(nodes)]))
+            return neighbours
+        common = Neighbours(keep, keep_rows) & Neighbours(remove, remove_rows)
+        if not common <= edge_nodes:
+            return None
+
+        before = np.nanmin(self.engine.values['scaled jacobian'][remove_rows]) if remove_rows else np.nan
+        return Collapse(keep, remove, tris, quads, owners, changed, before=before), predicted
+
+    # Predict the minimum scaled Jacobian of each candidate in one pass per element type
+    def Predict(self, candidates):
+        mesh = self.engine.mesh
+        default = np.array([0.0, 0.0, 1.0])
+        scores = np.full(len(candidates), np.inf)
+        for elem_type in (QUAD, TRI):
+            owners, nodes, surfaces = [], [], []
+            for i, (_, predicted) in enumerate(candidates):
+                for face_type, face_nodes, surf in predicted:
+                    if face_type == elem_type:
+                        owners.append(i)
+                        nodes.append(face_nodes)
+                        surfaces.append(surf)
+            if not owners:
+                continue
+            index = mesh.NodeIndex(np.array(nodes, dtype=np.int64))
+            normals = np.array([self.engine.normals.get(s, default) for s in surfaces])
+            quality = mesh_quality.CornerQuality(mesh.coords[index], normals)['scaled jacobian']
+            np.minimum.at(scores, np.array(owners), quality)
+        for (collapse, _), score in zip(candidates, scores):
+            collapse.score = float(score)
+
+    # The bad triangles and the best non-overlapping collapses that improve them
+    def Plan(self):
+        mesh = self.engine.mesh
+        values = self.engine.values['scaled jacobian']
+        with np.errstate(invalid='ignore'):
+            bad = np.nonzero((mesh.face_types == TRI) & (values < self.threshold))[0]
+        node_faces = self.NodeFaces()
+
+        candidates = []
+        seen = set()
+        for row in bad:
+            nodes = self.FaceNodes(row)
+            for i in range(3):
+                a, b = nodes[i], nodes[(i + 1) % 3]
+                for keep, remove in CollapseDirections(a, b, self.exterior, self.curve_nodes):
+                    if (keep, remove) in seen:
+                        continue
+                    seen.add((keep, remove))
+                    candidate = self.Candidate(keep, remove, node_faces)
+                    if candidate is not None:
+                        candidates.append(candidate)
+        if not candidates:
+            return []
+        self.Predict(candidates)
+
+        # best improvement first, a collapse locks every node around both of its nodes
+        improving = [c for c, _ in candidates if c.score > 0.0 and c.score > c.before]
+        improving.sort(key=lambda c: c.score - c.before, reverse=True)
+        locked = set()
+        selected = []
+        for collapse in improving:
+            rows = np.concatenate([node_faces.get(collapse.keep, []), node_faces.get(collapse.remove, [])])
+            patch = set(n for row in rows for n in self.FaceNodes(int(row)))
+            if patch & locked:
+                continue
+            locked.update(patch)
+            selected.append(collapse)
+        return selected
+
+
+# Minimum scaled Jacobian and count of triangles below the threshold
+def TriangleSummary(engine, threshold):
+    values = engine.values['scaled jacobian'][engine.mesh.face_types == TRI]
+    values = values[~np.isnan(values)]
+    if not len(values):
+        return None, 0
+    return float(values.min()), int((values < threshold).sum())
+
+
+# Collapse the bad triangles in passes until no collapse improves the mesh.
+# Returns a text report with the quality before and after.
+def CleanupBadTriangles(engine, threshold=mesh_quality.METRICS['scaled jacobian'][1], max_passes=MAX_PASSES):
+    before_min, before_count = TriangleSummary(engine, threshold)
+    planner = CollapsePlanner(engine, threshold)
+    total = 0
+    passes = 0
+    for _ in range(max_passes):
+        collapses = planner.Plan()
+        if not collapses:
+            break
+        ApplyCollapses(collapses, engine)
+        total += len(collapses)
+        passes += 1
+    engine.Rank()
+    after_min, after_count = TriangleSummary(engine, threshold)
+
+    def Quality(value):
+        return "-" if value is None else f"{value:.3f}"
+    return (f"Collapsed {total} edges in {passes} passes.\n"
+            f"Triangles below {threshold:g}: {before_count} before, {after_count} after.\n"
+            f"Minimum triangle scaled Jacobian: {Quality(before_min)} before, {Quality(after_min)} after.")
@@ -0,0 +1,223 @@
+#!python
+"""
+    Mesh groups of surfaces concurrently in Cubit worker processes and
+    stitch the result back into the live model.
+    1) Mesh the curves of the surfaces in the live model. This fixes the
+       nodes on the shared curves, the interfaces between the groups.
+    2) Partition the surfaces into groups with about the same predicted
+       element count.
+    3) Save the model and mesh each group in a worker (see cubit_workers.py).
+       The saved curve nodes keep their ids in the worker sessions.
+    4) Write the interior nodes of the worker meshes to a journal of create
+       commands and play it back in the live model, one command instead of
+       two API calls per node. The ids of the new nodes are read back in
+       one query, then the faces are created from a second journal. The
+       faces reuse the live curve nodes so the mesh is conformal by
+       construction. When the stitch fails, the created nodes and faces
+       are deleted before the surfaces are meshed serially.
+    5) Verify the result, including the faces of the meshed neighbours. The
+       only open face sides may be on exterior curves or on curves shared
+       with a surface that is not meshed, an open side on any other curve
+       is a non-conformal interface.
+
+    Benchmark() meshes the surfaces serially and with increasing worker
+    counts and prints the speedup. Run it from the Cubit command line with
+        import mesh_distributed; mesh_distributed.Benchmark()
+"""
+import os
+import time
+
+import numpy as np
+
+import cubit
+
+import cubit_workers
+import mesh_arrays
+import mesh_budget
+import part_scope
+
+
+# Split the surfaces into groups of about equal predicted element count
+# (largest first, each surface goes to the lightest group).
+def PartitionSurfaces(surfaces, group_count):
+    metrics = mesh_budget.GatherSurfaceMetrics(surfaces)
+    weights = {}
+    for surf, metric in metrics.items():
+        quads, tris = mesh_budget.PredictSurface(metric, cubit.get_mesh_size('surface', surf))
+        weights[surf] = quads + tris
+    groups = [[] for _ in range(max(1, min(group_count, len(surfaces))))]
+    loads = [0] * len(groups)
+    for surf in sorted(surfaces, key=lambda s: -weights[s]):
+        lightest = loads.index(min(loads))
+        groups[lightest].append(surf)
+        loads[lightest] += weights[surf]
+    return groups
+
+
+# Mesh all curves of the surfaces so that the shared curves are fixed
+def MeshCurves(surfaces):
+    curves = set()
+    for surf in surfaces:
+        curves.update(cubit.get_relatives('surface', surf, 'curve'))
+    if curves:
+        cubit.cmd(f'mesh curve {cubit.string_from_id_list(sorted(curves))}')
+
+
+# Delete the mesh entities created after last_ids was recorded
+def DeleteCreated(last_ids):
+    for kind in ('face', 'tri', 'node'):
+        first, last = last_ids[kind] + 1, cubit.get_last_id(kind)
+        if last >= first:
+            cubit.silent_cmd(f'delete {kind} {first} to {last}')
+
+
+# Play back the create commands in a journal
+def PlayJournal(path, lines):
+    with open(path, "w") as journal:
+        journal.write("".join(lines))
+    cubit.silent_cmd(f'playback "{path}"')
+
+
+# Create the interior nodes and the faces meshed by the workers with two
+# journals in the directory. meshed is {surface: {'nodes': [[worker id, x, y, z], ...],
+# 'faces': [[n1, n2, n3, n4 or -1], ...]}}, the curve nodes keep their ids.
+# The ids of the created nodes are read back before the faces are created.
+# On an error everything created is deleted again.
+def StitchSurfaces(meshed, directory):
+    last_ids = {kind: cubit.get_last_id(kind) for kind in ('node', 'face', 'tri')}
+    try:
+        lines = [f'create node location {x!r} {y!r} {z!r} owner surface {surface}\n'
+                 for surface, result in meshed.items() for _, x, y, z in result['nodes']]
+        PlayJournal(os.path.join(directory, "stitch_nodes.jou"), lines)
+        first, last = last_ids['node'] + 1, cubit.get_last_id('node')
+        created = cubit.parse_cubit_list('node', f'{first} to {last}') if last >= first else []
+        if len(created) != len(lines):
+            raise RuntimeError(f"Created {len(created)} of the {len(lines)} stitched nodes.")
+
+        # the created ids are in the order of the create commands
+        created = iter(sorted(created))
+        lines = []
+        face_count = 0
+        for surface, result in meshed.items():
+            node_map = {node: next(created) for node, _, _, _ in result['nodes']}
+            for face in result['faces']:
+                conn = " ".join(str(node_map.get(n, n)) for n in face if n >= 0)
+                elem_type = 'face' if face[3] >= 0 else 'tri'
+                lines.append(f'create {elem_type} node {conn} owner surface {surface}\n')
+            face_count += len(result['faces'])
+        PlayJournal(os.path.join(directory, "stitch_faces.jou"), lines)
+        created_faces = sum(cubit.get_last_id(kind) - last_ids[kind] for kind in ('face', 'tri'))
+        if created_faces != face_count:
+            raise RuntimeError(f"Created {created_faces} of the {face_count} stitched faces.")
+    except Exception:
+        DeleteCreated(last_ids)
+        raise
+
+
+# Open face sides of the surfaces that are not on an exterior curve or on a
+# curve shared with a surface that is not meshed. The faces of the meshed
+# neighbours are loaded too, so the curves shared with them are checked.
+# Returns a list of (surface, node, node), an empty list means the mesh is conformal.
+def VerifyConformity(surfaces):
+    neighbours = set()
+    open_nodes = set()
+    for surf in surfaces:
+        for curve in cubit.get_relatives('surface', surf, 'curve'):
+            parents = cubit.get_relatives('curve', curve, 'surface')
+            others = [p for p in parents if p != surf]
+            if not others or not all(cubit.is_meshed('surface', p) for p in others):
+                open_nodes.update(cubit.parse_cubit_list('node', f'in curve {curve}'))
+            neighbours.update(p for p in others if p not in surfaces)
+    neighbours = [p for p in sorted(neighbours) if cubit.is_meshed('surface', p)]
+    mesh = mesh_arrays.MeshArrays.Load(list(surfaces) + neighbours)
+    nodes, faces, _ = mesh.BoundarySides()
+    checked = np.isin(mesh.face_surface[faces], np.array(list(surfaces), dtype=np.int64))
+    allowed = np.isin(nodes, np.array(sorted(open_nodes), dtype=np.int64)).all(axis=1)
+    bad = np.nonzero(checked & ~allowed)[0]
+    return [(int(mesh.face_surface[faces[i]]), int(nodes[i, 0]), int(nodes[i, 1])) for i in bad]
+
+
+class DistributedMesher():
+    def __init__(self, surfaces, workers=None):
+        self.surfaces = list(surfaces)
+        self.workers = workers or os.cpu_count() or 1
+        self.failed = []
+        self.non_conformal = []
+        self.times = {}
+
+    def Run(self):
+        mesh_arrays.RefuseMirrored("Distributed meshing")
+        start = time.perf_counter()
+        MeshCurves(self.surfaces)
+        groups = PartitionSurfaces(self.surfaces, self.workers)
+        self.times['curves'] = time.perf_counter() - start
+
+        session = cubit_workers.WorkerSession()
+        try:
+            session.SaveModel()
+            tasks = [{'type': 'mesh_group', 'surfaces': group} for group in groups]
+            executor, futures = cubit_workers.StartTasks(session, tasks, max_workers=len(groups))
+            results = [f.result() for f in futures]
+            executor.shutdown()
+            self.times['workers'] = time.perf_counter() - start - self.times['curves']
+
+            stitch_start = time.perf_counter()
+            meshed = {}
+            for group, result in zip(groups, results):
+                if 'error' in result:
+                    print(f"Worker for surfaces {group} failed: {result['error']}")
+                meshed.update({int(s): r for s, r in result.get('surfaces', {}).items()})
+            meshed = {s: meshed[s] for s in self.surfaces if s in meshed}
+            cubit.cmd('set dev on')
+            try:
+                StitchSurfaces(meshed, session.directory)
+            finally:
+                cubit.cmd('set dev off')
+        finally:
+            session.Cleanup()
+        self.failed = [s for s in self.surfaces if s not in meshed]
+        self.times['stitch'] = time.perf_counter() - stitch_start
+
+        verify_start = time.perf_counter()
+        self.non_conformal = VerifyConformity([s for s in self.surfaces if s in meshed])
+        self.times['verify'] = time.perf_counter() - verify_start
+        self.times['total'] = time.perf_counter() - start
+        return self.failed
+
+    def Report(self):
+        lines = [f"Distributed meshing of {len(self.surfaces)} surfaces on {self.workers} workers: "
+                 + ", ".join(f"{k} {v:.2f}s" for k, v in self.times.items())]
+        if self.failed:
+            lines.append(f"    Surfaces not meshed by the workers: {' '.join(str(s) for s in self.failed)}")
+        if self.non_conformal:
+            lines.append(f"    {len(self.non_conformal)} non-conformal sides, for example surface "
+                         f"{self.non_conformal[0][0]} nodes {self.non_conformal[0][1]} {self.non_conformal[0][2]}")
+        else:
+            lines.append("    Conformity verified.")
+        return "\n".join(lines)
+
+
+# Compare serial meshing with distributed meshing on increasing worker counts
+def Benchmark(surfaces=None, worker_counts=None):
+    surfaces = list(surfaces or part_scope.Entities('surface'))
+    surface_str = cubit.string_from_id_list(surfaces)
+    if worker_counts is None:
+        worker_counts = [n for n in (1, 2, 4, 8, 16, 32) if n <= (os.cpu_count() or 1)]
+
+    cubit.cmd(f'delete mesh surface {surface_str} propagate')
+    start = time.perf_counter()
+    cubit.cmd(f'mesh surface {surface_str}')
+    serial = time.perf_counter() - start
+    elements = len(cubit.parse_cubit_list('face', 'all')) + len(cubit.parse_cubit_list('tri', 'all'))
+
+    lines = [f"{elements} elements, serial mesh {serial:.2f}s",
+             f"{'workers':>8} {'seconds':>9} {'speedup':>8} {'meshing':>8} {'stitch':>8}"]
+    for count in worker_counts:
+        cubit.cmd(f'delete mesh surface {surface_str} propagate')
+        mesher = DistributedMesher(surfaces, count)
+        mesher.Run()
+        lines.append(f"{count:>8} {mesher.times['total']:>9.2f} {serial / mesher.times['total']:>8.2f} "
+                     f"{mesher.times['workers']:>8.2f} {mesher.times['stitch']:>8.2f}")
+    report = "\n".join(lines)
+    print(report)
+    return report
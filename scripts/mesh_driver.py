@@ -0,0 +1,199 @@
+#!python
+"""
+    Mesh the tire surfaces one at a time so that failures and poor quality
+    are found per surface instead of for "mesh surface all".
+
+    1) Order the surfaces so that mapped (rebar) surfaces are meshed first
+       and the remaining surfaces follow through shared curves. A surface
+       is then meshed after the neighbours that fix the intervals on its
+       curves.
+    2) Mesh each surface and record the minimum scaled Jacobian.
+    3) Retry only the surfaces that failed or are below the quality threshold
+       with alternate schemes and smaller local sizes until the time budget
+       is used. Mapped surfaces keep the map scheme since the rebar requires
+       two elements through the thickness, only their size is adjusted.
+    4) Report the outcome and the time for every surface.
+"""
+import time
+from collections import deque
+
+import cubit
+
+FALLBACK_SCHEMES = ['tripave', 'pave', 'triadvance', 'submap']
+SIZE_FACTORS = [1.0, 0.75, 0.5]
+QUALITY_THRESHOLD = 0.2
+TIME_BUDGET = 60.0
+
+
+# Minimum scaled Jacobian of the quads and tris in the surface, None if not meshed
+def SurfaceMinQuality(surface):
+    min_quality = None
+    for elem_type, ids in (('quad', cubit.get_surface_quads(surface)), ('tri', cubit.get_surface_tris(surface))):
+        if not ids:
+            continue
+        stats = cubit.get_elem_quality_stats(elem_type, ids, 'scaled jacobian', 0.0, False, 0.0, 0.0, False)
+        if min_quality is None or stats[0] < min_quality:
+            min_quality = stats[0]
+    return min_quality
+
+
+# The outcome of meshing one surface
+class SurfaceResult():
+    def __init__(self, surface, scheme, size):
+        self.surface = surface
+        self.scheme = scheme
+        self.size = size
+        self.status = 'failed'
+        self.attempts = 0
+        self.min_quality = None
+        self.seconds = 0.0
+
+    def Row(self):
+        quality = "-" if self.min_quality is None else f"{self.min_quality:.3f}"
+        return f"{self.surface:>8} {self.status:<13} {self.scheme:<10} {self.size:>9.4g} " \
+               f"{self.attempts:>8} {quality:>8} {self.seconds:>8.2f}"
+
+
+class MeshDriver():
+    def __init__(self, surfaces, quality_threshold=QUALITY_THRESHOLD, time_budget=TIME_BUDGET):
+        self.surfaces = list(surfaces)
+        self.quality_threshold = quality_threshold
+        self.time_budget = time_budget
+        self.deadline = None
+        self.results = {}
+
+    # Mapped surfaces first, then a breadth first walk through the shared curves
+    def MeshOrder(self):
+        surface_curves = {s: set(cubit.get_relatives('surface', s, 'curve')) for s in self.surfaces}
+        curve_surfaces = {}
+        for surf, curves in surface_curves.items():
+            for curve in curves:
+                curve_surfaces.setdefault(curve, []).append(surf)
+
+        seeds = [s for s in self.surfaces if cubit.get_mesh_scheme('surface', s) == 'map']
+        # start disconnected groups at the smallest surface
+        remaining = sorted(self.surfaces, key=lambda s: cubit.get_surface_area(s))
+        order = []
+        visited = set()
+        queue = deque(seeds)
+        while queue or len(visited) < len(self.surfaces):
+            if not queue:
+                queue.append(next(s for s in remaining if s not in visited))
+            surf = queue.popleft()
+            if surf in visited:
+                continue
+            visited.add(surf)
+            order.append(surf)
+            for curve in sorted(surface_curves[surf]):
+                queue.extend(s for s in curve_surfaces[curve] if s not in visited)
+        return order
+
+    def MinQuality(self, surface):
+        return SurfaceMinQuality(surface)
+
+    # Mesh one surface with the given scheme and size. Returns the min quality
+    # or None if the surface did not mesh.
+    def MeshSurface(self, surface, scheme, size):
+        if cubit.is_meshed('surface', surface):
+            cubit.cmd(f'delete mesh surface {surface} propagate')
+        cubit.cmd(f'surface {surface} scheme {scheme}')
+        cubit.cmd(f'surface {surface} size {size}')
+        try:
+            cubit.cmd(f'mesh surface {surface}')
+        except Exception as e:
+            print(f"Unable to mesh surface {surface}:", e)
+        if not cubit.is_meshed('surface', surface):
+            return None
+        return self.MinQuality(surface)
+
+    def Acceptable(self, min_quality):
+        return min_quality is not None and min_quality >= self.quality_threshold
+
+    # The first pass meshes every surface with the scheme and size already set
+    def FirstPass(self, surface):
+        result = SurfaceResult(surface, cubit.get_mesh_scheme('surface', surface),
+                               cubit.get_mesh_size('surface', surface))
+        start = time.perf_counter()
+        try:
+            cubit.cmd(f'mesh surface {surface}')
+        except Exception as e:
+            print(f"Unable to mesh surface {surface}:", e)
+        result.attempts = 1
+        if cubit.is_meshed('surface', surface):
+            result.min_quality = self.MinQuality(surface)
+            result.status = 'meshed' if self.Acceptable(result.min_quality) else 'poor quality'
+        result.seconds = time.perf_counter() - start
+        return result
+
+    # Alternate (scheme, size) settings for a surface, in the order they are tried
+    def Alternatives(self, result):
+        if result.scheme == 'map':
+            schemes = ['map']
+        else:
+            schemes = [result.scheme] + [s for s in FALLBACK_SCHEMES if s != result.scheme]
+        return [(scheme, result.size * factor) for factor in SIZE_FACTORS for scheme in schemes
+                if (scheme, factor) != (result.scheme, 1.0)]
+
+    # Retry a surface until it meshes with acceptable quality or the time runs out.
+    # The best settings found are left on the surface.
+    def Recover(self, result, deadline):
+        start = time.perf_counter()
+        original = (result.scheme, result.size)
+        best = last = (result.min_quality, result.scheme, result.size)
+        for scheme, size in self.Alternatives(result):
+            if time.perf_counter() > deadline:
+                break
+            result.attempts += 1
+            last = (self.MeshSurface(result.surface, scheme, size), scheme, size)
+            if last[0] is not None and (best[0] is None or last[0] > best[0]):
+                best = last
+            if self.Acceptable(last[0]):
+                break
+
+        if best[0] is not None and last is not best:
+            # a later attempt replaced the best mesh, put it back
+            best = (self.MeshSurface(result.surface, best[1], best[2]), best[1], best[2])
+
+        result.min_quality, result.scheme, result.size = best
+        if self.Acceptable(result.min_quality):
+            result.status = 'meshed' if (result.scheme, result.size) == original else 'recovered'
+        elif result.min_quality is not None:
+            result.status = 'poor quality'
+        else:
+            result.status = 'failed'
+        result.seconds += time.perf_counter() - start
+
+    def MeshFirst(self, surface):
+        self.results[surface] = self.FirstPass(surface)
+
+    def StartRecovery(self):
+        self.deadline = time.perf_counter() + self.time_budget
+
+    def RecoverSurface(self, surface):
+        result = self.results[surface]
+        if result.status == 'meshed':
+            return
+        if time.perf_counter() > self.deadline:
+            print(f"Mesh recovery time budget of {self.time_budget}s used, surface {surface} not retried.")
+            return
+        self.Recover(result, self.deadline)
+
+    # The first pass and the recovery of every surface as separate steps, so
+    # a cubit_tasks.CommandQueue can run them in time slices
+    def Steps(self):
+        order = self.MeshOrder()
+        return [lambda s=s: self.MeshFirst(s) for s in order] + [self.StartRecovery] + \
+            [lambda s=s: self.RecoverSurface(s) for s in order]
+
+    def Run(self):
+        for step in self.Steps():
+            step()
+        return self.results
+
+    def Problems(self):
+        return [r for r in self.results.values() if r.status in ('failed', 'poor quality')]
+
+    def Report(self):
+        lines = [f"{'surface':>8} {'status':<13} {'scheme':<10} {'size':>9} {'attempts':>8} {'min SJ':>8} {'seconds':>8}"]
+        lines += [r.Row() for r in self.results.values()]
+        return "\n".join(lines)
@@ -0,0 +1,112 @@
+#!python
+"""
+    Fingerprint the geometry, meshing scheme and intervals of each surface
+    so that only the surfaces that changed since they were last meshed are
+    remeshed. Moving one cut line or blunting one tangency then only pays
+    for remeshing the surfaces involved.
+
+    A surface is remeshed when
+    1) it is not meshed,
+    2) its own fingerprint (scheme, size, area and vertex locations) changed, or
+    3) one of its curves changed (length, end points, size or hard intervals). This
+       also pulls in the neighbours that share the curve, since their mesh
+       must match the new intervals on the shared curve.
+
+    The fingerprints of the last mesh are kept for the Cubit session in this
+    module. They are only a cache, a surface without a stored fingerprint is
+    always remeshed.
+"""
+import hashlib
+
+import cubit
+
+import mesh_budget
+
+# digits kept when rounding lengths and coordinates for the fingerprints
+PRECISION = 8
+
+# surface id -> fingerprint and curve id -> fingerprint of the current mesh
+meshed_surface_fingerprints = {}
+meshed_curve_fingerprints = {}
+
+
+def Digest(values):
+    return hashlib.sha1(repr(values).encode()).hexdigest()
+
+
+def RoundedCoordinates(vertices):
+    return tuple(tuple(round(x, PRECISION) for x in cubit.get_center_point('vertex', v)) for v in sorted(vertices))
+
+
+# The curve fingerprint includes the hard intervals and the curve size. Soft
+# intervals without a curve size follow the surface size which is part of
+# the surface fingerprint.
+def CurveFingerprint(curve):
+    vertices = cubit.get_relatives('curve', curve, 'vertex')
+    return Digest((curve, round(cubit.get_curve_length(curve), PRECISION),
+                   RoundedCoordinates(vertices), mesh_budget.HardIntervals(curve),
+                   round(cubit.get_mesh_size('curve', curve), PRECISION)))
+
+
+def SurfaceFingerprint(surface, curves):
+    vertices = cubit.get_relatives('surface', surface, 'vertex')
+    return Digest((surface, cubit.get_mesh_scheme('surface', surface),
+                   round(cubit.get_mesh_size('surface', surface), PRECISION),
+                   round(cubit.get_surface_area(surface), PRECISION),
+                   RoundedCoordinates(vertices), tuple(sorted(curves))))
+
+
+# Compute the fingerprints of the surfaces and their curves.
+# Returns ({surface: fingerprint}, {curve: fingerprint}, {surface: [curves]})
+def ComputeFingerprints(surfaces):
+    surface_curves = {}
+    curve_fingerprints = {}
+    surface_fingerprints = {}
+    for surf in surfaces:
+        curves = list(cubit.get_relatives('surface', surf, 'curve'))
+        surface_curves[surf] = curves
+        for curve in curves:
+            if curve not in curve_fingerprints:
+                curve_fingerprints[curve] = CurveFingerprint(curve)
+        surface_fingerprints[surf] = SurfaceFingerprint(surf, curves)
+    return surface_fingerprints, curve_fingerprints, surface_curves
+
+
+# Find the surfaces that must be remeshed. Returns the sorted list of
+# surfaces and the fingerprints to record once they are meshed.
+def ChangedSurfaces(surfaces):
+    surface_fingerprints, curve_fingerprints, surface_curves = ComputeFingerprints(surfaces)
+    changed_curves = set(c for c, fp in curve_fingerprints.items() if meshed_curve_fingerprints.get(c) != fp)
+
+    changed = []
+    for surf in surfaces:
+        if not cubit.is_meshed('surface', surf) or \
+           meshed_surface_fingerprints.get(surf) != surface_fingerprints[surf] or \
+           changed_curves.intersection(surface_curves[surf]):
+            changed.append(surf)
+    return sorted(changed), (surface_fingerprints, curve_fingerprints)
+
+
+# Store the fingerprints of the surfaces that are now meshed
+def RecordMeshed(fingerprints):
+    surface_fingerprints, curve_fingerprints = fingerprints
+    meshed_surface_fingerprints.clear()
+    meshed_curve_fingerprints.clear()
+    for surf, fp in surface_fingerprints.items():
+        if cubit.is_meshed('surface', surf):
+            meshed_surface_fingerprints[surf] = fp
+    meshed_curve_fingerprints.update(curve_fingerprints)
+
+
+# Forget all fingerprints, the next mesh will remesh every surface
+def Reset():
+    meshed_surface_fingerprints.clear()
+    meshed_curve_fingerprints.clear()
+
+
+# Number of elements in the given surfaces
+def SurfaceElementCount(surfaces):
+    count = 0
+    for surf in surfaces:
+        count += len(cubit.get_surface_quads(surf)) + len(cubit.get_surface_tris(surf))
+    return count
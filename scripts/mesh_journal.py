@@ -0,0 +1,141 @@
+#!python
+"""
+    Journal of the developer mode edge collapses (mesh_collapse.py). The
+    merge node, delete and create commands are not undoable, so each collapse
+    records what it removed and created:
+      - the merged (removed) node, its location and geometric owner,
+      - the faces at the removed node before the merge, with their
+        connectivity and owner,
+      - the triangles it created.
+    Rollback() undoes the last collapses in place, newest first, in one
+    developer mode block: the created triangles and the changed faces are
+    deleted, the node is created again and the original faces are created
+    again. Recreated entities get new ids, the old ids are mapped to the new
+    ones so older entries stay valid.
+
+    The journal lives in the module so it persists for the Cubit session.
+    It is cleared when the mesh is recreated.
+"""
+from collections import deque
+
+import cubit
+
+from mesh_arrays import QUAD, TRI, FaceConnectivity
+
+MAX_ENTRIES = 1000
+
+journal = deque(maxlen=MAX_ENTRIES)
+node_map = {}
+face_map = {}
+
+
+# One collapse. faces are (type, id, connectivity, owner, removed) tuples,
+# the faces that were not removed only lost the merged node.
+class CollapseEntry():
+    __slots__ = ('node', 'location', 'owner', 'faces', 'created')
+
+    def __init__(self, node, location, owner, faces):
+        self.node = node
+        self.location = location
+        self.owner = owner
+        self.faces = faces
+        self.created = ()
+
+
+def Owner(entity_type, entity_id):
+    owner = cubit.get_geometric_owner(entity_type, str(entity_id))
+    return owner[0] if owner else None
+
+
+# Record the state touched by a collapse, before it is applied
+def Capture(collapse):
+    faces = []
+    for tri in collapse.tris:
+        faces.append((TRI, tri, tuple(FaceConnectivity(TRI, tri)), Owner('tri', tri), True))
+    for quad in collapse.quads:
+        faces.append((QUAD, quad, tuple(FaceConnectivity(QUAD, quad)), Owner('face', quad), True))
+    for elem_type, elem in collapse.changed:
+        name = 'face' if elem_type == QUAD else 'tri'
+        faces.append((elem_type, elem, tuple(FaceConnectivity(elem_type, elem)), Owner(name, elem), False))
+    return CollapseEntry(collapse.remove, tuple(cubit.get_nodal_coordinates(collapse.remove)),
+                         Owner('node', collapse.remove), tuple(faces))
+
+
+def Record(entry, created):
+    entry.created = tuple(created)
+    journal.append(entry)
+
+
+def Clear():
+    journal.clear()
+    node_map.clear()
+    face_map.clear()
+
+
+def Count():
+    return len(journal)
+
+
+# The current id of a node or face that may have been recreated by a rollback
+def CurrentNode(node):
+    while node in node_map:
+        node = node_map[node]
+    return node
+
+
+def CurrentFace(elem_type, elem):
+    while (elem_type, elem) in face_map:
+        elem = face_map[(elem_type, elem)]
+    return elem
+
+
+def DeleteFaces(faces):
+    for elem_type, name in ((QUAD, 'face'), (TRI, 'tri')):
+        ids = [elem for t, elem in faces if t == elem_type]
+        if ids:
+            cubit.silent_cmd(f'delete {name} {cubit.string_from_id_list(ids)}')
+
+
+# Undo one collapse. Returns (removed faces, added faces) as (type, id) lists.
+def RollbackEntry(entry):
+    removed = [(TRI, CurrentFace(TRI, t)) for t in entry.created]
+    removed += [(t, CurrentFace(t, elem)) for t, elem, _, _, was_removed in entry.faces if not was_removed]
+    DeleteFaces(removed)
+
+    owner = f"owner {entry.owner}" if entry.owner else ""
+    x, y, z = entry.location
+    cubit.silent_cmd(f'create node location {x} {y} {z} {owner}')
+    node_map[entry.node] = cubit.get_last_id('node')
+
+    added = []
+    for elem_type, elem, conn, face_owner, _ in entry.faces:
+        nodes = " ".join(str(CurrentNode(n)) for n in conn if n >= 0)
+        name = 'face' if elem_type == QUAD else 'tri'
+        owner = f"owner {face_owner}" if face_owner else ""
+        cubit.silent_cmd(f'create {name} node {nodes} {owner}')
+        new_id = cubit.get_last_id(name)
+        face_map[(elem_type, elem)] = new_id
+        added.append((elem_type, new_id))
+    return removed, added
+
+
+# Undo the last count collapses, newest first. The quality engine, if given,
+# is refreshed. Returns the number of collapses undone.
+def Rollback(count=1, engine=None):
+    count = min(count, len(journal))
+    if count <= 0:
+        return 0
+    removed, added = [], []
+    cubit.cmd('set dev on')
+    try:
+        for _ in range(count):
+            entry_removed, entry_added = RollbackEntry(journal.pop())
+            removed += entry_removed
+            added += entry_added
+    finally:
+        cubit.cmd('set dev off')
+    if engine is not None:
+        # a face created and then deleted again by an older entry is not in the mesh
+        removed_set = set(removed)
+        engine.Refresh(removed=removed, added=[f for f in added if f not in removed_set])
+    return count
@@ -0,0 +1,266 @@
+#!python
+"""
+    Vectorized mesh quality. The quality of every quad and triangle is
+    computed in one NumPy pass over the bulk connectivity of mesh_arrays.py
+    instead of a Cubit quality query per click.
+    1) Scaled Jacobian: the corner Jacobians relative to the surface normal,
+       divided by the lengths of the two corner edges (scaled by 2/sqrt(3)
+       for triangles so the equilateral triangle is 1).
+    2) Aspect ratio: longest edge times the sum of the edge lengths divided by
+       4 times the area (4 sqrt(3) times the area for triangles), 1 is ideal.
+    3) Skew: cosine of the angle between the principal axes of a quad, 0 for
+       triangles.
+    4) Minimum angle: the smallest corner angle in degrees.
+
+    QualityEngine keeps a ranked index of the elements worse than a threshold.
+    After a local edit Refresh() recomputes only the elements that were added,
+    changed or have moved nodes and updates the index in place.
+"""
+import bisect
+
+import numpy as np
+
+import cubit
+
+import mesh_arrays
+from mesh_arrays import QUAD, TRI
+
+# metric name -> (lower values are worse, default threshold)
+METRICS = {'scaled jacobian': (True, 0.2),
+           'aspect ratio': (False, 5.0),
+           'skew': (False, 0.5),
+           'minimum angle': (True, 20.0)}
+
+HISTOGRAM_BINS = {'scaled jacobian': [-1.0, 0.0, 0.2, 0.4, 0.6, 0.8, 1.0],
+                  'aspect ratio': [1.0, 1.5, 2.0, 3.0, 5.0, 10.0, np.inf],
+                  'skew': [0.0, 0.1, 0.2, 0.3, 0.5, 0.7, 1.0],
+                  'minimum angle': [0.0, 10.0, 20.0, 30.0, 45.0, 60.0, 90.0]}
+
+
+# Signed area vector of each face (k, 3) from the corner points (k, n, 3)
+def AreaVectors(points):
+    return 0.5 * np.cross(points, np.roll(points, -1, axis=1)).sum(axis=1)
+
+
+# The quality metrics of corner points (k, n, 3) of faces with n corners.
+# normals (k, 3) are the unit surface normals used for the sign of the Jacobian.
+def CornerQuality(points, normals):
+    n = points.shape[1]
+    next_edge = np.roll(points, -1, axis=1) - points
+    prev_edge = np.roll(points, 1, axis=1) - points
+    next_len = np.linalg.norm(next_edge, axis=2)
+    prev_len = np.linalg.norm(prev_edge, axis=2)
+    length_product = next_len * prev_len
+    with np.errstate(divide='ignore', invalid='ignore'):
+        jacobian = np.einsum('kij,kj->ki', np.cross(next_edge, prev_edge), normals)
+        scaled = np.where(length_product > 0.0, jacobian / length_product, -1.0)
+        if n == 3:
+            scaled = scaled * (2.0 / np.sqrt(3.0))
+        cosines = np.where(length_product > 0.0, (next_edge * prev_edge).sum(axis=2) / length_product, 1.0)
+        angles = np.degrees(np.arccos(np.clip(cosines, -1.0, 1.0)))
+
+        area = np.abs(np.einsum('kj,kj->k', AreaVectors(points), normals))
+        factor = 4.0 if n == 4 else 4.0 * np.sqrt(3.0)
+        aspect = np.where(area > 0.0, next_len.max(axis=1) * next_len.sum(axis=1) / (factor * area), np.inf)
+
+        if n == 4:
+            axis1 = (points[:, 1] - points[:, 0]) + (points[:, 2] - points[:, 3])
+            axis2 = (points[:, 2] - points[:, 1]) + (points[:, 3] - points[:, 0])
+            norms = np.linalg.norm(axis1, axis=1) * np.linalg.norm(axis2, axis=1)
+            skew = np.where(norms > 0.0, np.abs((axis1 * axis2).sum(axis=1)) / norms, 1.0)
+        else:
+            skew = np.zeros(len(points))
+    return {'scaled jacobian': np.clip(scaled.min(axis=1), -1.0, 1.0),
+            'aspect ratio': aspect,
+            'skew': skew,
+            'minimum angle': angles.min(axis=1)}
+
+
+# Unit normal of each surface, the sum of the area vectors of its faces so
+# that an inverted element gets a negative Jacobian. Returns {surface: normal}.
+def SurfaceNormals(mesh):
+    index = mesh.FaceIndex()
+    live = np.nonzero(mesh.face_types > 0)[0]
+    corners = np.where(index[live] < 0, index[live, 2:3], index[live])
+    area = AreaVectors(mesh.coords[corners])
+    surfaces, inverse = np.unique(mesh.face_surface[live], return_inverse=True)
+    total = np.zeros((len(surfaces), 3))
+    np.add.at(total, inverse, area)
+    normals = {}
+    for surf, vector in zip(surfaces, total):
+        length = np.linalg.norm(vector)
+        normals[int(surf)] = vector / length if length > 0.0 else np.array([0.0, 0.0, 1.0])
+    return normals
+
+
+# The metrics of the given face rows. Returns {metric: array} aligned with rows,
+# dead faces get nan.
+def FaceQuality(mesh, rows, normals):
+    rows = np.asarray(rows, dtype=np.int64)
+    values = {name: np.full(len(rows), np.nan) for name in METRICS}
+    default = np.array([0.0, 0.0, 1.0])
+    for elem_type in (QUAD, TRI):
+        subset = np.nonzero(mesh.face_types[rows] == elem_type)[0]
+        if not len(subset):
+            continue
+        index = mesh.NodeIndex(mesh.face_nodes[rows[subset], :elem_type])
+        face_normals = np.array([normals.get(int(s), default) for s in mesh.face_surface[rows[subset]]])
+        quality = CornerQuality(mesh.coords[index], face_normals)
+        for name in METRICS:
+            values[name][subset] = quality[name]
+    return values
+
+
+class QualityEngine():
+    def __init__(self, surfaces=None, metric='scaled jacobian', threshold=None):
+        self.surfaces = surfaces
+        self.metric = metric
+        self.threshold = METRICS[metric][1] if threshold is None else threshold
+        self.mesh = None
+        self.values = {}
+        self.normals = {}
+        self.ranked = []
+        self.keys = {}
+        self.rows = {}
+
+    # Load the mesh and compute the quality of every face
+    def Compute(self):
+        self.mesh = mesh_arrays.MeshArrays.Load(self.surfaces, include_free=self.surfaces is None)
+        self.normals = SurfaceNormals(self.mesh)
+        self.values = FaceQuality(self.mesh, np.arange(len(self.mesh.face_ids)), self.normals)
+        self.rows = self.mesh.FaceRows()
+        self.Rank()
+
+    # Sort key of a value, the worst element comes first
+    def Key(self, value):
+        return value if METRICS[self.metric][0] else -value
+
+    def IsBad(self, value):
+        if np.isnan(value):
+            return False
+        return value < self.threshold if METRICS[self.metric][0] else value > self.threshold
+
+    # Build the ranked index of the bad elements for the current metric and threshold
+    def Rank(self, metric=None, threshold=None):
+        if metric is not None:
+            self.metric = metric
+            self.threshold = METRICS[metric][1] if threshold is None else threshold
+        elif threshold is not None:
+            self.threshold = threshold
+        values = self.values[self.metric]
+        lower_is_worse = METRICS[self.metric][0]
+        with np.errstate(invalid='ignore'):
+            bad = np.nonzero(values < self.threshold if lower_is_worse else values > self.threshold)[0]
+        keys = values[bad] if lower_is_worse else -values[bad]
+        order = np.argsort(keys, kind='stable')
+        self.ranked = [(float(keys[i]), int(bad[i])) for i in order]
+        self.keys = {row: key for key, row in self.ranked}
+
+    def Count(self):
+        return len(self.ranked)
+
+    # The element at a position of the ranked index as (type, id, {metric: value}).
+    # Without bad elements position 0 is the worst element of the mesh.
+    def Element(self, position):
+        if self.ranked:
+            row = self.ranked[max(0, min(position, len(self.ranked) - 1))][1]
+        else:
+            values = self.values[self.metric]
+            if not len(values) or np.all(np.isnan(values)):
+                return None
+            row = int(np.nanargmin(values) if METRICS[self.metric][0] else np.nanargmax(values))
+        return (int(self.mesh.face_types[row]), int(self.mesh.face_ids[row]),
+                {name: float(self.values[name][row]) for name in METRICS})
+
+    # Position of an element in the ranked index, None if it isn't bad
+    def Position(self, elem_type, elem):
+        row = self.rows.get((elem_type, elem))
+        if row is None or row not in self.keys:
+            return None
+        return bisect.bisect_left(self.ranked, (self.keys[row], row))
+
+    # Update after a local edit. removed, added and changed are lists of
+    # (type, id), changed faces kept their id but not their connectivity.
+    # moved_nodes are nodes with new coordinates.
+    def Refresh(self, removed=(), added=(), changed=(), moved_nodes=()):
+        mesh = self.mesh
+        for face in removed:
+            row = self.rows.pop(tuple(face), None)
+            if row is not None:
+                self.Unrank(row)
+        added_rows = mesh.UpdateFaces(removed, added)
+        for row in added_rows:
+            self.rows[(int(mesh.face_types[row]), int(mesh.face_ids[row]))] = int(row)
+
+        rows = set(int(r) for r in added_rows)
+        for face in changed:
+            row = self.rows.get(tuple(face))
+            if row is not None:
+                mesh.face_nodes[row] = mesh_arrays.FaceConnectivity(*face)
+                rows.add(row)
+        mesh.AddNodes(mesh.face_nodes[sorted(rows)].ravel() if rows else [])
+        if len(moved_nodes):
+            mesh.RefreshNodes(moved_nodes)
+            uses = np.isin(mesh.face_nodes, np.asarray(moved_nodes, dtype=np.int64)).any(axis=1)
+            rows.update(int(r) for r in np.nonzero(uses & (mesh.face_types > 0))[0])
+        rows = np.array(sorted(rows), dtype=np.int64)
+
+        grow = len(mesh.face_ids) - len(self.values[self.metric])
+        if grow > 0:
+            for name in METRICS:
+                self.values[name] = np.concatenate([self.values[name], np.full(grow, np.nan)])
+        # the dead rows keep no value so they never rank again
+        dead = np.nonzero(mesh.face_types == 0)[0]
+        for name in METRICS:
+            self.values[name][dead] = np.nan
+        if not len(rows):
+            return
+        quality = FaceQuality(mesh, rows, self.normals)
+        for name in METRICS:
+            self.values[name][rows] = quality[name]
+        for row in rows:
+            row = int(row)
+            self.Unrank(row)
+            value = self.values[self.metric][row]
+            if self.IsBad(value):
+                key = float(self.Key(value))
+                bisect.insort(self.ranked, (key, row))
+                self.keys[row] = key
+
+    def Unrank(self, row):
+        key = self.keys.pop(row, None)
+        if key is not None:
+            position = bisect.bisect_left(self.ranked, (key, row))
+            if position < len(self.ranked) and self.ranked[position] == (key, row):
+                del self.ranked[position]
+
+    # Histogram of the metric for every block. Returns (bin edges, {block: counts}).
+    def BlockHistograms(self, metric=None, bins=None):
+        metric = metric or self.metric
+        bins = np.asarray(bins if bins is not None else HISTOGRAM_BINS[metric], dtype=float)
+        values = self.values[metric]
+        histograms = {}
+        for block in cubit.get_block_id_list():
+            rows = [self.rows.get((QUAD, f)) for f in cubit.get_block_faces(block)]
+            rows += [self.rows.get((TRI, t)) for t in cubit.get_block_tris(block)]
+            rows = np.array([r for r in rows if r is not None], dtype=np.int64)
+            if not len(rows):
+                continue
+            block_values = values[rows]
+            block_values = np.clip(block_values[~np.isnan(block_values)], bins[0], bins[-1])
+            histograms[block] = np.histogram(block_values, bins=bins)[0]
+        return bins, histograms
+
+
+# Text table of the block histograms
+def HistogramReport(engine, metric=None):
+    metric = metric or engine.metric
+    bins, histograms = engine.BlockHistograms(metric)
+    labels = [f"{lo:g}-{hi:g}" for lo, hi in zip(bins[:-1], bins[1:])]
+    width = max(8, max(len(label) for label in labels) + 1)
+    lines = [f"{metric} by block",
+             f"{'block':<24}" + "".join(f"{label:>{width}}" for label in labels)]
+    for block, counts in histograms.items():
+        name = cubit.get_exodus_entity_name('block', block) or f"block {block}"
+        lines.append(f"{name[:23]:<24}" + "".join(f"{c:>{width}}" for c in counts))
+    return "\n".join(lines)
@@ -0,0 +1,219 @@
+#!python
+"""
+    Recombine the triangles of a quad dominant mesh into quads.
+    1) Find the candidates from the bulk connectivity (mesh_arrays.py):
+       a) two triangles that share a side become one quad,
+       b) a triangle, a quad and a triangle on the opposite side of the quad
+          become two quads (the best of the three ways to split the hexagon).
+       Both elements must be in the same surface.
+    2) Compute the scaled Jacobian of every candidate quad in one NumPy pass
+       (mesh_quality.py). Candidates below MIN_QUALITY are dropped.
+    3) Pick the candidates with a maximum weight matching of the triangles,
+       networkx is used when it is available, otherwise a greedy matching.
+    4) Delete the matched elements and create the quads in their owning
+       surfaces in one developer mode block.
+"""
+import time
+
+import numpy as np
+
+import cubit
+
+import mesh_arrays
+import mesh_quality
+import part_scope
+from mesh_arrays import QUAD, TRI
+
+try:
+    import networkx
+except ImportError:
+    networkx = None
+
+MIN_QUALITY = 0.3
+
+
+# One recombination. tris and quads are the removed element rows,
+# new_quads the node ids of the created quads.
+class Candidate():
+    def __init__(self, tris, quads, new_quads, surface, quality):
+        self.tris = tris
+        self.quads = quads
+        self.new_quads = new_quads
+        self.surface = surface
+        self.quality = quality
+
+
+# The neighbour of every face side. Returns (neighbour row, neighbour side),
+# both (n, 4) with -1 where there is no neighbour.
+def SideNeighbours(mesh):
+    nodes, faces, sides = mesh.FaceSides()
+    neighbour = np.full((len(mesh.face_ids), 4), -1, dtype=np.int64)
+    neighbour_side = np.full((len(mesh.face_ids), 4), -1, dtype=np.int64)
+    keys = mesh.EdgeKey(nodes[:, 0], nodes[:, 1])
+    order = np.argsort(keys, kind='stable')
+    keys = keys[order]
+    pairs = np.nonzero(keys[1:] == keys[:-1])[0]
+    first, second = order[pairs], order[pairs + 1]
+    neighbour[faces[first], sides[first]] = faces[second]
+    neighbour_side[faces[first], sides[first]] = sides[second]
+    neighbour[faces[second], sides[second]] = faces[first]
+    neighbour_side[faces[second], sides[second]] = sides[first]
+    return neighbour, neighbour_side
+
+
+# Scaled Jacobian of quads given as node ids (k, 4)
+def QuadQuality(mesh, quads, surfaces, normals):
+    if not len(quads):
+        return np.zeros(0)
+    default = np.array([0.0, 0.0, 1.0])
+    face_normals = np.array([normals.get(int(s), default) for s in surfaces])
+    points = mesh.coords[mesh.NodeIndex(quads)]
+    return mesh_quality.CornerQuality(points, face_normals)['scaled jacobian']
+
+
+# Two triangles that share a side
+def TrianglePairs(mesh, neighbour, neighbour_side, normals):
+    rows, sides = np.nonzero(neighbour[:, :3] >= 0)
+    other = neighbour[rows, sides]
+    other_side = neighbour_side[rows, sides]
+    keep = (mesh.face_types[rows] == TRI) & (mesh.face_types[other] == TRI) & (rows < other) \
+        & (mesh.face_surface[rows] == mesh.face_surface[other])
+    rows, sides, other, other_side = rows[keep], sides[keep], other[keep], other_side[keep]
+
+    # triangle (a, b, c) on side a-b and (b, a, d) give the quad (a, d, b, c)
+    a = mesh.face_nodes[rows, sides]
+    b = mesh.face_nodes[rows, (sides + 1) % 3]
+    c = mesh.face_nodes[rows, (sides + 2) % 3]
+    d = mesh.face_nodes[other, (other_side + 2) % 3]
+    quads = np.stack([a, d, b, c], axis=1)
+    quality = QuadQuality(mesh, quads, mesh.face_surface[rows], normals)
+    return [Candidate([int(r), int(o)], [], [list(map(int, q))], int(mesh.face_surface[r]), float(s))
+            for r, o, q, s in zip(rows, other, quads, quality)]
+
+
+# A triangle, a quad and a triangle on the opposite side of the quad
+def TriangleQuadChains(mesh, neighbour, normals):
+    candidates = []
+    for side in (0, 1):
+        quads = np.nonzero(mesh.face_types == QUAD)[0]
+        tri1 = neighbour[quads, side]
+        tri2 = neighbour[quads, side + 2]
+        keep = (tri1 >= 0) & (tri2 >= 0)
+        quads, tri1, tri2 = quads[keep], tri1[keep], tri2[keep]
+        surface = mesh.face_surface[quads]
+        keep = (mesh.face_types[tri1] == TRI) & (mesh.face_types[tri2] == TRI) \
+            & (mesh.face_surface[tri1] == surface) & (mesh.face_surface[tri2] == surface)
+        quads, tri1, tri2, surface = quads[keep], tri1[keep], tri2[keep], surface[keep]
+        if not len(quads):
+            continue
+
+        q = mesh.face_nodes[quads]
+        corners = [q[:, (side + i) % 4] for i in range(4)]
+        apex1 = ApexNodes(mesh, tri1, corners[0], corners[1])
+        apex2 = ApexNodes(mesh, tri2, corners[2], corners[3])
+        hexagon = np.stack([corners[0], apex1, corners[1], corners[2], apex2, corners[3]], axis=1)
+
+        # split the hexagon through one of its three pairs of opposite corners
+        best_quality = np.full(len(quads), -np.inf)
+        best_split = np.zeros((len(quads), 2, 4), dtype=np.int64)
+        for k in range(3):
+            first = hexagon[:, [(k + i) % 6 for i in range(4)]]
+            second = hexagon[:, [(k + 3 + i) % 6 for i in range(4)]]
+            quality = np.minimum(QuadQuality(mesh, first, surface, normals),
+                                 QuadQuality(mesh, second, surface, normals))
+            better = quality > best_quality
+            best_quality[better] = quality[better]
+            best_split[better, 0] = first[better]
+            best_split[better, 1] = second[better]
+
+        for i in range(len(quads)):
+            candidates.append(Candidate([int(tri1[i]), int(tri2[i])], [int(quads[i])],
+                                        [list(map(int, best_split[i, 0])), list(map(int, best_split[i, 1]))],
+                                        int(surface[i]), float(best_quality[i])))
+    return candidates
+
+
+# The triangle node that is not on the side a-b
+def ApexNodes(mesh, tris, a, b):
+    nodes = mesh.face_nodes[tris, :3]
+    apex = np.where((nodes != a[:, None]) & (nodes != b[:, None]), nodes, -1)
+    return apex.max(axis=1)
+
+
+# Pick candidates so that every triangle and quad is used at most once.
+# The weight favours the number of removed triangles, then the quality.
+def MatchCandidates(candidates):
+    candidates = [c for c in candidates if c.quality >= MIN_QUALITY]
+    best = {}
+    for c in candidates:
+        key = tuple(sorted(c.tris))
+        if key not in best or c.quality > best[key].quality:
+            best[key] = c
+
+    if networkx is not None:
+        graph = networkx.Graph()
+        for (t1, t2), c in best.items():
+            graph.add_edge(t1, t2, weight=1.0 + c.quality)
+        matching = networkx.max_weight_matching(graph)
+        matched = [best[tuple(sorted(pair))] for pair in matching]
+    else:
+        matched = []
+        used = set()
+        for c in sorted(best.values(), key=lambda c: c.quality, reverse=True):
+            if not used.intersection(c.tris):
+                used.update(c.tris)
+                matched.append(c)
+
+    # the matching is on the triangles, a quad of a chain may only be used once
+    selected = []
+    used_quads = set()
+    for c in sorted(matched, key=lambda c: c.quality, reverse=True):
+        if not used_quads.intersection(c.quads):
+            used_quads.update(c.quads)
+            selected.append(c)
+    return selected
+
+
+# Delete the recombined elements and create the new quads in one developer mode block
+def ApplyRecombination(mesh, selected):
+    tris = [int(mesh.face_ids[r]) for c in selected for r in c.tris]
+    quads = [int(mesh.face_ids[r]) for c in selected for r in c.quads]
+    cubit.cmd('set dev on')
+    try:
+        if tris:
+            cubit.silent_cmd(f'delete tri {cubit.string_from_id_list(tris)}')
+        if quads:
+            cubit.silent_cmd(f'delete face {cubit.string_from_id_list(quads)}')
+        for c in selected:
+            owner = f"owner surface {c.surface}" if c.surface else ""
+            for quad in c.new_quads:
+                cubit.silent_cmd(f'create face node {" ".join(str(n) for n in quad)} {owner}')
+    finally:
+        cubit.cmd('set dev off')
+
+
+def TriangleCount(surfaces):
+    return sum(len(cubit.get_surface_tris(s)) for s in surfaces)
+
+
+# Recombine the triangles of the surfaces. Returns a text report.
+def Recombine(surfaces=None):
+    start = time.perf_counter()
+    mesh_arrays.RefuseMirrored("Recombining the triangles")
+    surfaces = list(surfaces if surfaces is not None else part_scope.Entities('surface'))
+    before = TriangleCount(surfaces)
+    if not before:
+        return "No triangles to recombine."
+
+    mesh = mesh_arrays.MeshArrays.Load(surfaces)
+    normals = mesh_quality.SurfaceNormals(mesh)
+    neighbour, neighbour_side = SideNeighbours(mesh)
+    candidates = TrianglePairs(mesh, neighbour, neighbour_side, normals)
+    candidates += TriangleQuadChains(mesh, neighbour, normals)
+    selected = MatchCandidates(candidates)
+    ApplyRecombination(mesh, selected)
+
+    after = TriangleCount(surfaces)
+    matching = "maximum weight" if networkx is not None else "greedy"
+    return (f"Recombined {len(selected)} triangle groups into quads ({matching} matching) "
+            f"in {time.perf_counter() - start:.2f}s. Triangles: {before} before, {after} after.")
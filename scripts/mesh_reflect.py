@@ -0,0 +1,260 @@
+#!python
+"""
+    Mirror the meshed half section about the XZ plane at the mesh level,
+    without copying the geometry and merging.
+    1) Load the faces of all surfaces and the bar elements of the blocks
+       (mesh_arrays.py). The nodes on the symmetry boundary (the boundary
+       sides within the merge tolerance of the geometric reflection of
+       y = 0) are reused, every other node gets a mirrored node at
+       (x, -y, z). The mirror stops when a vertex at the symmetry plane is
+       not on that boundary.
+    2) Create the mirrored elements with reversed orientation, a quad
+       (a, b, c, d) becomes (a', d', c', b') and a triangle (a, b, c) becomes
+       (a', c', b'), so the mirrored elements keep a positive Jacobian.
+    3) Add the mirrored elements to the block of their original, one block
+       per material holds both halves as with the geometric reflection.
+       Only the left/right oriented rebar blocks (LEFT_RIGHT_BLOCKS) are
+       split, the mirrored bars go to a "-left" block. Nodesets and
+       sidesets get the mirrored nodes and edges.
+    4) Renumber the rebar blocks (rebar_renumber.py) so the mirrored chains
+       also run clockwise, as Create Rebar does after a geometric reflection.
+    5) Write the node pair table (original node, mirrored node) for
+       symmetry constraints. The renumbering changes the ids, the pairs are
+       matched by their coordinates afterwards.
+    The mirrored elements are not owned by a surface, Create Rebar can't
+    find them. The rebar has to be created before the mesh is mirrored. The
+    mesh boundary sets, the recombination and the distributed meshing
+    refuse a mirrored mesh (mesh_arrays.RefuseMirrored).
+"""
+import os
+from math import floor, log10
+
+import numpy as np
+
+import cubit
+
+import mesh_arrays
+import part_scope
+import rebar_renumber
+from mesh_arrays import QUAD, TRI
+
+NODE_PAIR_FILE = "tire-1_node_pairs.csv"
+MATCH_TOLERANCE = 1e-6
+
+
+# The block name without a previous left/right suffix
+def BaseName(name):
+    for suffix in ("-left", "-right"):
+        name = name.replace(suffix, "")
+    return name
+
+
+# The rebar blocks of the active part
+def RebarBlocks():
+    return list(cubit.parse_cubit_list('block', f'with name "{part_scope.Name("reinf*")}"'))
+
+
+# The vertices of the curves at the symmetry plane. AutoCAD doesn't create
+# them at y == 0, they are found within twice the largest y of the vertices.
+def SymmetryVertices():
+    y_max = cubit.get_total_bounding_box("vertex", part_scope.Entities("vertex"))[4]
+    curves = cubit.parse_cubit_list("curve", f"{part_scope.Within()} with y_coord > {-2.0*y_max} and y_coord < {2.0*y_max}")
+    if not curves:
+        return []
+    return list(cubit.parse_cubit_list("vertex", f"in curve {cubit.string_from_id_list(curves)}"))
+
+
+# The merge tolerance for a gap of the symmetry vertices: the nearest power
+# of 10 above twice the gap (.0073 goes to .01), at least the Cubit merge tolerance
+def MergeTolerance(gap):
+    tolerance = cubit.get_merge_tolerance()
+    if gap > 0.0:
+        tolerance = max(tolerance, 10 ** (floor(log10(gap * 2.0)) + 1))
+    return tolerance
+
+
+# Ids of the nodes at the points, matched within MATCH_TOLERANCE. -1 where
+# no node was found.
+def NodesAt(points):
+    mesh = mesh_arrays.MeshArrays.Load(include_free=True)
+    cells = {}
+    for index, cell in enumerate(map(tuple, np.floor(mesh.coords / MATCH_TOLERANCE).astype(np.int64).tolist())):
+        cells.setdefault(cell, []).append(index)
+    # the own cell first, a point next to a cell border is in a neighbour
+    neighbours = sorted(((i, j, k) for i in (-1, 0, 1) for j in (-1, 0, 1) for k in (-1, 0, 1)),
+                        key=lambda offset: sum(map(abs, offset)))
+    ids = np.full(len(points), -1, dtype=np.int64)
+    for row, (point, cell) in enumerate(zip(points, np.floor(points / MATCH_TOLERANCE).astype(np.int64).tolist())):
+        for offset in neighbours:
+            found = [index for index in cells.get(tuple(c + o for c, o in zip(cell, offset)), ())
+                     if np.abs(mesh.coords[index] - point).max() <= MATCH_TOLERANCE]
+            if found:
+                ids[row] = mesh.node_ids[found[0]]
+                break
+    return ids
+
+
+class MeshMirror():
+    def __init__(self):
+        self.blocks = part_scope.Sets('block')
+        bar_edges = sorted(set(e for b in self.blocks for e in cubit.get_block_edges(b)))
+        self.mesh = mesh_arrays.MeshArrays.Load(bar_edges=bar_edges)
+        self.node_map = {}
+        self.face_map = {}
+        self.bar_map = {}
+        self.error_blocks = []
+        self.renamed = {}
+        self.new_blocks = []
+        self.last_ids = {}
+
+    # Node ids on the symmetry boundary, the boundary sides within the merge
+    # tolerance of the geometric reflection. Every vertex at the symmetry
+    # plane must be on it, otherwise the halves would not be connected there.
+    def SymmetryNodes(self):
+        vertices = SymmetryVertices()
+        gap = abs(cubit.get_total_bounding_box("vertex", vertices)[3]) if vertices else 0.0
+        tolerance = MergeTolerance(gap)
+        nodes, _, _ = self.mesh.BoundarySides()
+        y = self.mesh.coords[self.mesh.NodeIndex(nodes)][:, :, 1]
+        symmetry = np.unique(nodes[(y > -tolerance).all(axis=1)])
+        for vertex in vertices:
+            vertex_nodes = cubit.parse_cubit_list('node', f'in vertex {vertex}')
+            if vertex_nodes and not np.isin(vertex_nodes, symmetry).all():
+                raise ValueError(f"Vertex {vertex} at the symmetry plane is not on the mesh boundary "
+                                 f"within the merge tolerance {tolerance:g} of y = 0.")
+        return symmetry
+
+    def CreateNodes(self):
+        symmetry = set(int(n) for n in self.SymmetryNodes())
+        mirrored = self.mesh.coords * np.array([1.0, -1.0, 1.0])
+        for node, (x, y, z) in zip(self.mesh.node_ids, mirrored):
+            node = int(node)
+            if node in symmetry:
+                self.node_map[node] = node
+            else:
+                cubit.silent_cmd(f'create node location {x:.15g} {y:.15g} {z:.15g}')
+                self.node_map[node] = cubit.get_last_id('node')
+
+    # The mirrored faces with reversed orientation and the mirrored bars
+    def CreateElements(self):
+        for row in range(len(self.mesh.face_ids)):
+            elem_type = int(self.mesh.face_types[row])
+            nodes = [self.node_map[int(n)] for n in self.mesh.face_nodes[row, :elem_type]]
+            nodes = [nodes[0]] + nodes[:0:-1]
+            name = 'face' if elem_type == QUAD else 'tri'
+            cubit.silent_cmd(f'create {name} node {" ".join(str(n) for n in nodes)}')
+            self.face_map[(elem_type, int(self.mesh.face_ids[row]))] = cubit.get_last_id(name)
+        for edge, (a, b) in zip(self.mesh.bar_ids, self.mesh.bar_nodes):
+            cubit.silent_cmd(f'create edge node {self.node_map[int(a)]} {self.node_map[int(b)]}')
+            self.bar_map[int(edge)] = cubit.get_last_id('edge')
+
+    # Add the mirrored elements to the block of their original. The mirrored
+    # bars of the left/right rebar blocks go to a new "-left" block.
+    def MirrorBlocks(self):
+        left_right = set(map(part_scope.Name, rebar_renumber.LEFT_RIGHT_BLOCKS))
+        for block in self.blocks:
+            quads = [self.face_map[(QUAD, f)] for f in cubit.get_block_faces(block) if (QUAD, f) in self.face_map]
+            tris = [self.face_map[(TRI, t)] for t in cubit.get_block_tris(block) if (TRI, t) in self.face_map]
+            bars = [self.bar_map[e] for e in cubit.get_block_edges(block) if e in self.bar_map]
+            target = block
+            name = BaseName(cubit.get_exodus_entity_name('block', block) or "")
+            if bars and name in left_right:
+                self.renamed[block] = cubit.get_exodus_entity_name('block', block)
+                cubit.cmd(f'block {block} name "{name}-right"')
+                target = cubit.get_next_block_id()
+                self.new_blocks.append(target)
+            for entity, ids in (('face', quads), ('tri', tris), ('edge', bars)):
+                if ids:
+                    cubit.silent_cmd(f'block {target} add {entity} {cubit.string_from_id_list(ids)}')
+            if target != block:
+                cubit.cmd(f'block {target} name "{name}-left"')
+                element_type = cubit.get_block_element_type(block)
+                if element_type:
+                    cubit.cmd(f'block {target} element type {element_type}')
+
+    # Add the mirrored nodes and edges to the nodesets and sidesets
+    def MirrorSets(self):
+        for nodeset in part_scope.Sets('nodeset'):
+            nodes = [self.node_map[n] for n in cubit.get_nodeset_nodes_inclusive(nodeset)
+                     if n in self.node_map and self.node_map[n] != n]
+            if nodes:
+                cubit.silent_cmd(f'nodeset {nodeset} add node {cubit.string_from_id_list(nodes)}')
+        missing = 0
+        for sideset in part_scope.Sets('sideset'):
+            edges = []
+            for edge in cubit.get_sideset_edges(sideset):
+                nodes = cubit.get_connectivity('edge', edge)[:2]
+                a, b = (self.node_map.get(n) for n in nodes)
+                if (a, b) == tuple(nodes):
+                    # an edge on the symmetry plane is its own mirror
+                    continue
+                found = set(cubit.parse_cubit_list('edge', f'in node {a}')) & \
+                    set(cubit.parse_cubit_list('edge', f'in node {b}')) if a and b else set()
+                found.discard(edge)
+                if found:
+                    edges.append(found.pop())
+                else:
+                    missing += 1
+            if edges:
+                cubit.silent_cmd(f'sideset {sideset} add edge {cubit.string_from_id_list(edges)}')
+        if missing:
+            print(f"{missing} sideset edges could not be mirrored.")
+
+    # Coordinates of the original and the mirrored node of every pair
+    def PairPoints(self):
+        nodes = np.array(sorted(self.node_map), dtype=np.int64)
+        points = self.mesh.coords[self.mesh.NodeIndex(nodes)]
+        symmetry = np.array([self.node_map[int(n)] == n for n in nodes], dtype=bool)
+        mirrored = np.where(symmetry[:, None], points, points * np.array([1.0, -1.0, 1.0]))
+        return points, mirrored
+
+    # Write the node pair table with the current ids, symmetry nodes are
+    # paired with themselves
+    def WriteNodePairs(self, path, points, mirrored):
+        pairs = np.stack([NodesAt(points), NodesAt(mirrored)], axis=1)
+        missing = (pairs < 0).any(axis=1)
+        if missing.any():
+            print(f"{missing.sum()} node pairs were not found after the renumbering.")
+        np.savetxt(path, pairs[~missing], fmt="%d", delimiter=",", header="node,mirrored_node", comments="")
+        return path
+
+    # Delete the elements and nodes created so far. The creation commands
+    # run in developer mode and can't be undone, the created ids are above
+    # the last ids before the mirror.
+    def Rollback(self):
+        for block, name in self.renamed.items():
+            cubit.cmd(f'block {block} name "{name}"')
+        for block in self.new_blocks:
+            if cubit.entity_exists('block', block):
+                cubit.cmd(f'delete block {block}')
+        for kind in ('face', 'tri', 'edge', 'node'):
+            first, last = self.last_ids[kind] + 1, cubit.get_last_id(kind)
+            if last >= first:
+                cubit.silent_cmd(f'delete {kind} {first} to {last}')
+        print("Removed the mirrored mesh.")
+
+    def Run(self, pair_file=None):
+        pair_file = pair_file or os.path.join(os.getcwd(), NODE_PAIR_FILE)
+        self.last_ids = {kind: cubit.get_last_id(kind) for kind in ('node', 'face', 'tri', 'edge')}
+        try:
+            cubit.cmd('graphics autoflush off')
+            cubit.cmd('set dev on')
+            try:
+                self.CreateNodes()
+                self.CreateElements()
+            finally:
+                cubit.cmd('set dev off')
+                cubit.cmd('graphics autoflush on')
+            self.MirrorBlocks()
+            self.MirrorSets()
+        except Exception:
+            self.Rollback()
+            raise
+        points, mirrored = self.PairPoints()
+        self.error_blocks = rebar_renumber.RebarRenumber().Run()
+        self.WriteNodePairs(pair_file, points, mirrored)
+        reused = sum(1 for n, m in self.node_map.items() if n == m)
+        print(f"Mirrored {len(self.face_map)} faces and {len(self.bar_map)} bars, "
+              f"created {len(self.node_map) - reused} nodes and reused {reused} symmetry nodes.")
+        print(f"Node pair table written to {pair_file}")
+        return pair_file
@@ -0,0 +1,191 @@
+#!python
+"""
+    Curvature and thickness adaptive mesh sizes for the tire surfaces.
+    A uniform size has to be small enough for the thinnest gum layer and
+    the bead region, which over refines the tread and sidewall. Instead
+    1) sample points along every boundary curve and compute the local
+       curvature from the turning angle between samples. A curve gets a size
+       that turns at most ANGLE_PER_ELEMENT per element.
+    2) estimate the local thickness of every surface. Each sample on a curve
+       is paired with the nearest sample on the curves across the surface
+       (curves that don't share a vertex with it). That distance is twice the
+       medial (inscribed circle) radius. Surfaces where every curve touches
+       every other curve fall back to 2 * area / perimeter.
+    3) a curve size is the smallest of the base size, the curvature size and
+       the thickness of the surfaces next to it, but not below the minimum
+       size. A surface size is the smallest of the base size and its thickness.
+    Curves with hard intervals (the two element mapped sides) are not changed.
+"""
+import math
+
+import numpy as np
+
+import cubit
+import mesh_budget
+import mesh_driver
+
+ANGLE_PER_ELEMENT = math.radians(15.0)
+ELEMENTS_THROUGH_THICKNESS = 1.0
+MIN_SAMPLES = 5
+MAX_SAMPLES = 200
+
+# curves that were given an adaptive size, so they can be reset to a uniform size
+adapted_curves = set()
+
+
+class SizingEngine():
+    def __init__(self, surfaces, base_size, min_size):
+        self.surfaces = list(surfaces)
+        self.base_size = base_size
+        self.min_size = min(min_size, base_size)
+        self.curve_sizes = {}
+        self.surface_sizes = {}
+        self.surface_thickness = {}
+
+    # sample points along every curve in the surfaces, {curve: (n, 3) array}
+    def SampleCurves(self):
+        self.surface_curves = {s: list(cubit.get_relatives('surface', s, 'curve')) for s in self.surfaces}
+        self.curve_vertices = {}
+        samples = {}
+        for curves in self.surface_curves.values():
+            for curve in curves:
+                if curve in samples:
+                    continue
+                self.curve_vertices[curve] = set(cubit.get_relatives('curve', curve, 'vertex'))
+                count = int(cubit.get_curve_length(curve) / self.min_size) + 1
+                count = min(max(count, MIN_SAMPLES), MAX_SAMPLES)
+                curve_obj = cubit.curve(curve)
+                samples[curve] = np.array([curve_obj.position_from_fraction(f) for f in np.linspace(0.0, 1.0, count)])
+        return samples
+
+    # The size that keeps the turning angle per element below ANGLE_PER_ELEMENT
+    # at the point of maximum curvature.
+    def CurvatureSize(self, points):
+        segments = np.diff(points, axis=0)
+        lengths = np.linalg.norm(segments, axis=1)
+        if len(segments) < 2 or np.any(lengths <= 0.0):
+            return math.inf
+        cosine = np.einsum('ij,ij->i', segments[:-1], segments[1:]) / (lengths[:-1] * lengths[1:])
+        turning = np.arccos(np.clip(cosine, -1.0, 1.0))
+        curvature = turning / (0.5 * (lengths[:-1] + lengths[1:]))
+        max_curvature = curvature.max()
+        if max_curvature <= 1.0e-12:
+            return math.inf
+        return ANGLE_PER_ELEMENT / max_curvature
+
+    # The local thickness next to each curve of each surface,
+    # {(surface, curve): thickness}, and the thickness of each surface.
+    def Thickness(self, samples):
+        local = {}
+        for surf, curves in self.surface_curves.items():
+            for curve in curves:
+                opposite = [c for c in curves if c != curve and not (self.curve_vertices[c] & self.curve_vertices[curve])]
+                if not opposite:
+                    continue
+                other = np.vstack([samples[c] for c in opposite])
+                distance = np.linalg.norm(samples[curve][:, None, :] - other[None, :, :], axis=2).min(axis=1)
+                local[(surf, curve)] = distance.min()
+
+            surface_local = [t for (s, c), t in local.items() if s == surf]
+            if surface_local:
+                self.surface_thickness[surf] = min(surface_local)
+            else:
+                perimeter = sum(cubit.get_curve_length(c) for c in curves)
+                self.surface_thickness[surf] = 2.0 * cubit.get_surface_area(surf) / perimeter
+        return local
+
+    def Clamp(self, size):
+        return min(max(size, self.min_size), self.base_size)
+
+    # Compute the curve and surface sizes
+    def Compute(self):
+        samples = self.SampleCurves()
+        local = self.Thickness(samples)
+        for surf, curves in self.surface_curves.items():
+            self.surface_sizes[surf] = self.Clamp(self.surface_thickness[surf] / ELEMENTS_THROUGH_THICKNESS)
+            for curve in curves:
+                thickness = local.get((surf, curve), self.surface_thickness[surf])
+                size = min(self.CurvatureSize(samples[curve]), thickness / ELEMENTS_THROUGH_THICKNESS)
+                self.curve_sizes[curve] = self.Clamp(min(size, self.curve_sizes.get(curve, math.inf)))
+        return self.curve_sizes, self.surface_sizes
+
+    # Set the sizes in Cubit. Entities with the same size share one command.
+    def Apply(self):
+        for entity_type, sizes in (('surface', self.surface_sizes), ('curve', self.curve_sizes)):
+            by_size = {}
+            for entity, size in sizes.items():
+                if entity_type == 'curve' and mesh_budget.HardIntervals(entity):
+                    continue
+                by_size.setdefault(float(f"{size:.4g}"), []).append(entity)
+            for size, entities in by_size.items():
+                cubit.cmd(f'{entity_type} {cubit.string_from_id_list(entities)} size {size}')
+                if entity_type == 'curve':
+                    adapted_curves.update(entities)
+
+    # The uniform size needed to resolve the thinnest surface
+    def UniformSize(self):
+        return min(self.surface_sizes.values())
+
+    # Predicted element counts (quads + tris) for the uniform and adaptive sizes
+    def PredictedCounts(self, mapped_surfaces=()):
+        metrics = mesh_budget.GatherSurfaceMetrics(self.surfaces)
+        _, quads, tris = mesh_budget.PredictElementCount(metrics, self.UniformSize(), mapped_surfaces)
+        uniform = quads + tris
+        _, quads, tris = mesh_budget.PredictElementCount(metrics, self.surface_sizes, mapped_surfaces, self.curve_sizes)
+        return uniform, quads + tris
+
+    # Mesh the surfaces with the uniform size and return the statistics.
+    # The mesh is deleted and the adaptive sizes are set again afterwards.
+    def MeshUniformBaseline(self, surfaces):
+        size = self.UniformSize()
+        surface_str = cubit.string_from_id_list(surfaces)
+        cubit.cmd(f'surface {surface_str} size {size}')
+        curves = [c for c in adapted_curves if not mesh_budget.HardIntervals(c)]
+        if curves:
+            cubit.cmd(f'curve {cubit.string_from_id_list(curves)} size {size}')
+        try:
+            cubit.cmd(f'mesh surface {surface_str}')
+        except Exception as e:
+            print("Unable to mesh the uniform baseline:", e)
+        stats = MeshStatistics(surfaces)
+        cubit.cmd(f'delete mesh surface {surface_str} propagate')
+        self.Apply()
+        return stats
+
+
+# Reset the curves that were given an adaptive size back to the uniform size
+def ResetAdaptiveSizes(size):
+    curves = [c for c in adapted_curves if cubit.entity_exists('curve', c) and not mesh_budget.HardIntervals(c)]
+    if curves:
+        cubit.cmd(f'curve {cubit.string_from_id_list(curves)} size {size}')
+    adapted_curves.clear()
+
+
+# (elements, tris, minimum scaled Jacobian) of the mesh on the surfaces
+def MeshStatistics(surfaces):
+    elements = 0
+    tris = 0
+    min_quality = None
+    for surf in surfaces:
+        surface_tris = len(cubit.get_surface_tris(surf))
+        elements += len(cubit.get_surface_quads(surf)) + surface_tris
+        tris += surface_tris
+        quality = mesh_driver.SurfaceMinQuality(surf)
+        if quality is not None and (min_quality is None or quality < min_quality):
+            min_quality = quality
+    return elements, tris, min_quality
+
+
+# A table comparing the uniform baseline to the adaptive mesh. The statistics
+# are the tuples from MeshStatistics, the baseline may be None if it was not meshed.
+def Report(engine, predicted, baseline, adaptive):
+    def quality(stats):
+        return "-" if stats is None or stats[2] is None else f"{stats[2]:.3f}"
+
+    lines = [f"{'':<22} {'uniform':>12} {'adaptive':>12}",
+             f"{'size':<22} {engine.UniformSize():>12.4g} {engine.min_size:>5.4g}-{engine.base_size:<6.4g}",
+             f"{'predicted elements':<22} {predicted[0]:>12} {predicted[1]:>12}"]
+    lines.append(f"{'meshed elements':<22} {baseline[0] if baseline else '-':>12} {adaptive[0]:>12}")
+    lines.append(f"{'triangles':<22} {baseline[1] if baseline else '-':>12} {adaptive[1]:>12}")
+    lines.append(f"{'min scaled Jacobian':<22} {quality(baseline):>12} {quality(adaptive):>12}")
+    return "\n".join(lines)
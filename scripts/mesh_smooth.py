@@ -0,0 +1,216 @@
+#!python
+"""
+    Quality constrained Laplacian smoothing of a node patch, for example
+    the neighbourhood of an edge collapse or of a cluster of bad elements.
+    1) The patch is the faces around the seed nodes, grown by a number of
+       rings. Only the nodes whose faces are all in the patch move, the nodes
+       on the patch border stay fixed.
+    2) Each iteration moves the nodes part way to the average of their
+       neighbours in one NumPy pass. Nodes on a curve only move along the
+       curve tangent at their start position and are projected onto the
+       curve once after the last iteration, nodes on a vertex don't move.
+    3) The scaled Jacobian of the patch faces is recomputed
+       (mesh_quality.py) and a node whose worst face got worse goes back to
+       its previous position.
+    4) The new positions are written to Cubit at the end, the nodes with the
+       same displacement share one move command and the commands are played
+       back from one journal.
+"""
+import os
+import tempfile
+
+import numpy as np
+
+import cubit
+
+import mesh_quality
+
+ITERATIONS = 20
+RELAXATION = 0.5
+RINGS = 2
+
+
+# Rows of the live faces that use any of the nodes
+def FacesOfNodes(mesh, nodes):
+    nodes = np.asarray(sorted(nodes), dtype=np.int64)
+    return np.nonzero(np.isin(mesh.face_nodes, nodes).any(axis=1) & (mesh.face_types > 0))[0]
+
+
+# The faces around the seed nodes grown by rings of faces. Returns the face rows.
+def PatchFaces(mesh, seed_nodes, rings=RINGS):
+    nodes = set(int(n) for n in seed_nodes)
+    rows = FacesOfNodes(mesh, nodes)
+    for _ in range(rings):
+        nodes.update(int(n) for n in mesh.face_nodes[rows].ravel() if n >= 0)
+        rows = FacesOfNodes(mesh, nodes)
+    return rows
+
+
+# The geometric owner of a node as (type, id), for example ('curve', 3)
+def NodeOwner(node):
+    try:
+        owner = cubit.get_geometric_owner('node', str(node))
+        if owner:
+            name, owner_id = owner[0].split()
+            return name, int(owner_id)
+    except Exception:
+        pass
+    return None, 0
+
+
+class Smoother():
+    def __init__(self, engine, seed_nodes, rings=RINGS, iterations=ITERATIONS, relaxation=RELAXATION):
+        self.engine = engine
+        self.mesh = engine.mesh
+        self.iterations = iterations
+        self.relaxation = relaxation
+        self.rows = PatchFaces(self.mesh, seed_nodes, rings)
+        self.moved = {}
+
+        # the nodes that only belong to patch faces may move
+        patch_nodes = np.unique(self.mesh.face_nodes[self.rows])
+        patch_nodes = patch_nodes[patch_nodes >= 0]
+        outside = np.setdiff1d(FacesOfNodes(self.mesh, patch_nodes), self.rows)
+        self.nodes = np.setdiff1d(patch_nodes, self.mesh.face_nodes[outside].ravel())
+
+        self.curves = {}
+        movable = []
+        for node in self.nodes:
+            owner_type, owner_id = NodeOwner(int(node))
+            if owner_type == 'vertex':
+                continue
+            if owner_type == 'curve':
+                self.curves[int(node)] = owner_id
+            movable.append(node)
+        self.nodes = np.array(movable, dtype=np.int64)
+
+    # Neighbour node index pairs along the sides of the patch faces
+    def Edges(self):
+        index = self.mesh.NodeIndex(self.mesh.face_nodes[self.rows])
+        pairs = []
+        for elem_type, count in ((mesh_quality.QUAD, 4), (mesh_quality.TRI, 3)):
+            faces = index[self.mesh.face_types[self.rows] == elem_type]
+            for i in range(count):
+                pairs.append(np.stack([faces[:, i], faces[:, (i + 1) % count]], axis=1))
+        pairs = np.concatenate(pairs)
+        pairs = np.concatenate([pairs, pairs[:, ::-1]])
+        return np.unique(pairs, axis=0)
+
+    # Minimum scaled Jacobian of the faces at every node index of the patch
+    def NodeQuality(self):
+        quality = mesh_quality.FaceQuality(self.mesh, self.rows, self.engine.normals)['scaled jacobian']
+        index = self.mesh.NodeIndex(self.mesh.face_nodes[self.rows])
+        node_quality = np.full(len(self.mesh.node_ids), np.inf)
+        for column in range(4):
+            valid = index[:, column] >= 0
+            np.minimum.at(node_quality, index[valid, column], quality[valid])
+        return node_quality
+
+    # Move the node back onto its curve
+    def Project(self, index, position):
+        node = int(self.mesh.node_ids[index])
+        return np.array(cubit.curve(self.curves[node]).closest_point(list(position)))
+
+    # Unit tangent of the curve at the node
+    def Tangent(self, index, position):
+        node = int(self.mesh.node_ids[index])
+        tangent = np.array(cubit.curve(self.curves[node]).tangent(list(position)), dtype=float)
+        return tangent / max(np.linalg.norm(tangent), 1e-300)
+
+    # Smooth the patch in memory. Returns the number of nodes that moved.
+    def Run(self):
+        if not len(self.nodes):
+            return 0
+        coords = self.mesh.coords
+        original = coords.copy()
+        movable = self.mesh.NodeIndex(self.nodes)
+        edges = self.Edges()
+        edges = edges[np.isin(edges[:, 0], movable)]
+        counts = np.bincount(edges[:, 0], minlength=len(coords))
+        curve_index = np.array([i for i in movable if int(self.mesh.node_ids[i]) in self.curves], dtype=np.int64)
+        tangents = np.array([self.Tangent(i, coords[i]) for i in curve_index]).reshape(-1, 3)
+
+        try:
+            quality = self.NodeQuality()
+            for _ in range(self.iterations):
+                sums = np.zeros_like(coords)
+                np.add.at(sums, edges[:, 0], coords[edges[:, 1]])
+                previous = coords[movable].copy()
+                curve_previous = coords[curve_index].copy()
+                target = sums[movable] / np.maximum(counts[movable], 1)[:, None]
+                coords[movable] = previous + self.relaxation * (target - previous)
+                # the curve nodes keep the component along their tangent
+                step = ((coords[curve_index] - curve_previous) * tangents).sum(axis=1)
+                coords[curve_index] = curve_previous + step[:, None] * tangents
+
+                # a node whose worst face got worse keeps its previous position
+                new_quality = self.NodeQuality()
+                worse = new_quality[movable] < quality[movable] - 1e-9
+                coords[movable[worse]] = previous[worse]
+                if worse.any():
+                    new_quality = self.NodeQuality()
+                quality = new_quality
+                if np.abs(coords[movable] - previous).max() < 1e-9:
+                    break
+
+            # onto the curves once, a curve node whose worst face got worse
+            # goes back to its start position on the curve
+            if len(curve_index):
+                coords[curve_index] = np.array([self.Project(i, coords[i]) for i in curve_index])
+                worse = self.NodeQuality()[curve_index] < quality[curve_index] - 1e-9
+                coords[curve_index[worse]] = original[curve_index[worse]]
+            deltas = coords[movable] - original[movable]
+        finally:
+            # Cubit keeps the real positions until they are written
+            self.mesh.coords = original
+        moved = np.linalg.norm(deltas, axis=1) > 1e-12
+        self.moved = {int(self.mesh.node_ids[i]): d for i, d in zip(movable[moved], deltas[moved])}
+        return len(self.moved)
+
+    # One move command per displacement, the nodes with the same displacement share it
+    def MoveCommands(self):
+        groups = {}
+        for node, (dx, dy, dz) in self.moved.items():
+            groups.setdefault(f'x {dx:.15g} y {dy:.15g} z {dz:.15g}', []).append(node)
+        return [f'node {cubit.string_from_id_list(nodes)} move {move}\n' for move, nodes in groups.items()]
+
+    # Write the new node positions to Cubit with one journal playback and refresh the quality
+    def WriteBack(self):
+        if not self.moved:
+            return
+        handle, path = tempfile.mkstemp(prefix="tire_smooth_", suffix=".jou")
+        cubit.cmd('graphics autoflush off')
+        try:
+            with os.fdopen(handle, "w") as journal:
+                journal.write("".join(self.MoveCommands()))
+            cubit.silent_cmd(f'playback "{path}"')
+        finally:
+            cubit.cmd('graphics autoflush on')
+            os.remove(path)
+        self.engine.Refresh(moved_nodes=list(self.moved))
+
+
+# Smooth the patches around the elements below the threshold. Returns a text report.
+def SmoothBadElements(engine, threshold=mesh_quality.METRICS['scaled jacobian'][1], rings=RINGS):
+    values = engine.values['scaled jacobian']
+    with np.errstate(invalid='ignore'):
+        bad = np.nonzero(values < threshold)[0]
+    if not len(bad):
+        return f"No elements below {threshold:g}."
+    seeds = engine.mesh.face_nodes[bad].ravel()
+    before = float(np.nanmin(values[bad]))
+
+    smoother = Smoother(engine, seeds[seeds >= 0], rings)
+    smoother.Run()
+    cubit.cmd('undo group begin')
+    try:
+        smoother.WriteBack()
+    finally:
+        cubit.cmd('undo group end')
+    values = engine.values['scaled jacobian']
+    with np.errstate(invalid='ignore'):
+        after_count = int((values < threshold).sum())
+    after = float(np.nanmin(values[smoother.rows]))
+    return (f"Smoothed {len(smoother.moved)} nodes around {len(bad)} elements below {threshold:g}. "
+            f"Elements below {threshold:g}: {len(bad)} before, {after_count} after. "
+            f"Worst scaled Jacobian in the patch: {before:.3f} before, {after:.3f} after.")
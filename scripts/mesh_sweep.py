@@ -0,0 +1,194 @@
+#!python
+"""
+    Mesh size sweep. The current pre-mesh model is saved once and meshed
+    at several sizes (and optionally with adaptive sizes) in parallel Cubit
+    worker processes, one per available core. The element counts, the
+    triangle fraction, the minimum scaled Jacobian and the meshing time of
+    each setting are shown in a table. The selected setting is applied to
+    the live model and the mesh dialog.
+"""
+import time
+
+from PySide6.QtCore import QTimer
+from PySide6.QtWidgets import QDialog, QGridLayout, QLabel, QLineEdit, QDialogButtonBox, \
+    QPushButton, QTableWidget, QTableWidgetItem, QAbstractItemView
+
+import cubit
+
+import cubit_utils
+import cubit_workers
+import mesh_sizing
+import part_scope
+
+COLUMNS = ["Size", "Sizing", "Elements", "Quads", "Tris", "Tri %", "Min SJ", "Time (s)"]
+
+
+class MeshSweep(QDialog):
+    def __init__(self, parent, mesh_dialog):
+        super().__init__(parent)
+        self.resize(560, 320)
+        self.setWindowTitle("Mesh Size Sweep")
+        self.setObjectName("MeshSweep")
+        self.mesh_dialog = mesh_dialog
+
+        self.gridLayout = QGridLayout(self)
+        self.sizesLabel = QLabel(u"Mesh Sizes:")
+        self.gridLayout.addWidget(self.sizesLabel, 0, 0)
+        self.sizesLineEdit = QLineEdit()
+        self.gridLayout.addWidget(self.sizesLineEdit, 0, 1)
+        mesh_size = mesh_dialog.GetMeshSize()
+        if mesh_size:
+            self.sizesLineEdit.setText(" ".join("%.4g" % (mesh_size * f) for f in (1.5, 1.0, 0.75, 0.5)))
+
+        self.minSizeLabel = QLabel(u"Adaptive Minimum Size:")
+        self.gridLayout.addWidget(self.minSizeLabel, 1, 0)
+        self.minSizeLineEdit = QLineEdit()
+        self.minSizeLineEdit.setToolTip("When set each size is also meshed with adaptive sizes")
+        self.minSizeLineEdit.setText(mesh_dialog.minSize.text())
+        self.gridLayout.addWidget(self.minSizeLineEdit, 1, 1)
+
+        self.runButton = QPushButton()
+        self.runButton.setAutoDefault(False)
+        self.runButton.setText("Run Sweep")
+        self.gridLayout.addWidget(self.runButton, 0, 2)
+        self.runButton.clicked.connect(self.RunSweep)
+
+        self.table = QTableWidget(0, len(COLUMNS))
+        self.table.setHorizontalHeaderLabels(COLUMNS)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.gridLayout.addWidget(self.table, 2, 0, 1, 3)
+
+        self.statusLabel = QLabel("")
+        self.gridLayout.addWidget(self.statusLabel, 3, 0, 1, 3)
+
+        QBtn = QDialogButtonBox.StandardButton.Apply | QDialogButtonBox.StandardButton.Close
+        self.buttonBox = QDialogButtonBox(QBtn)
+        self.buttonBox.button(QDialogButtonBox.StandardButton.Apply).setText("Apply Selected")
+        self.buttonBox.button(QDialogButtonBox.StandardButton.Apply).clicked.connect(self.ApplySelected)
+        self.buttonBox.rejected.connect(self.reject)
+        self.gridLayout.addWidget(self.buttonBox, 4, 1, 1, 2)
+        self.setLayout(self.gridLayout)
+
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.PollWorkers)
+        self.tasks = []
+        self.futures = []
+        self.session = None
+        self.executor = None
+    # init -- create GUI
+
+    # One task per size, and one more per size with adaptive sizes
+    def GetTasks(self):
+        try:
+            sizes = [float(s) for s in self.sizesLineEdit.text().replace(",", " ").split()]
+            assert(sizes and all(s > 0.0 for s in sizes))
+        except Exception:
+            cubit_utils.ErrorWindow("Enter one or more positive mesh sizes.")
+            return []
+        min_size = None
+        if self.minSizeLineEdit.text().strip():
+            try:
+                min_size = float(self.minSizeLineEdit.text())
+                assert(min_size > 0.0)
+            except Exception:
+                cubit_utils.ErrorWindow("The adaptive minimum size must be a positive value.")
+                return []
+
+        # the workers only mesh the surfaces of the active part
+        surfaces = None if part_scope.Active() == part_scope.ALL else part_scope.Entities('surface')
+        tasks = []
+        for size in sizes:
+            tasks.append({'type': 'sweep', 'size': size, 'min_size': None, 'surfaces': surfaces})
+            if min_size:
+                tasks.append({'type': 'sweep', 'size': size, 'min_size': min_size, 'surfaces': surfaces})
+        return tasks
+
+    def RunSweep(self):
+        if self.timer.isActive():
+            return
+        self.tasks = self.GetTasks()
+        if not self.tasks:
+            return
+        # the workers start from the same schemes and mapped surfaces as the mesh dialog
+        if not self.mesh_dialog.SetMeshSchemes():
+            return
+
+        self.table.setRowCount(len(self.tasks))
+        for row, task in enumerate(self.tasks):
+            self.SetRow(row, task, None)
+
+        try:
+            self.session = cubit_workers.WorkerSession()
+            self.session.SaveModel()
+            self.executor, self.futures = cubit_workers.StartTasks(self.session, self.tasks)
+        except Exception as e:
+            cubit_utils.ErrorWindow(f"Unable to start the worker processes: {e}")
+            return
+        self.filled = set()
+        self.start_time = time.perf_counter()
+        self.statusLabel.setText(f"Running {len(self.tasks)} settings on "
+                                 f"{cubit_workers.WorkerCount(self.tasks)} workers...")
+        self.timer.start(250)
+
+    def SetRow(self, row, task, result):
+        sizing = f"adaptive {task['min_size']:.4g}" if task['min_size'] else "uniform"
+        values = ["%.4g" % task['size'], sizing]
+        if result is None:
+            values += ["running"] + [""] * (len(COLUMNS) - 3)
+        elif 'error' in result:
+            values += ["failed"] + [""] * (len(COLUMNS) - 3)
+            print(f"Sweep size {task['size']} failed: {result['error']}")
+        else:
+            quality = "-" if result['min_quality'] is None else "%.3f" % result['min_quality']
+            values += [str(result['elements']), str(result['quads']), str(result['tris']),
+                       "%.1f" % (100.0 * result['tri_fraction']), quality, "%.2f" % result['seconds']]
+        for column, value in enumerate(values):
+            self.table.setItem(row, column, QTableWidgetItem(value))
+
+    # Fill in the rows of the finished workers without blocking the GUI
+    def PollWorkers(self):
+        for row, future in enumerate(self.futures):
+            if row not in self.filled and future.done():
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = {'error': str(e)}
+                self.SetRow(row, self.tasks[row], result)
+                self.filled.add(row)
+
+        if len(self.filled) == len(self.futures):
+            self.timer.stop()
+            self.executor.shutdown(wait=False)
+            self.session.Cleanup()
+            self.statusLabel.setText(f"Sweep of {len(self.tasks)} settings finished in "
+                                     f"{time.perf_counter() - self.start_time:.1f}s")
+
+    # Apply the selected size (and adaptive setting) to the mesh dialog and the live model
+    def ApplySelected(self):
+        row = self.table.currentRow()
+        if row < 0 or row >= len(self.tasks):
+            cubit_utils.ErrorWindow("Select a row of the sweep table.")
+            return
+        task = self.tasks[row]
+        self.mesh_dialog.meshSize.setText("%.4g" % task['size'])
+        self.mesh_dialog.ClearBlockSizes()
+        cubit.cmd(f"{part_scope.Scope('surface')} size {task['size']}")
+        if task['min_size']:
+            self.mesh_dialog.minSize.setText("%.4g" % task['min_size'])
+            self.mesh_dialog.adaptiveSizing.setChecked(True)
+            self.mesh_dialog.ApplyAdaptiveSizing(part_scope.Entities("surface"))
+        else:
+            self.mesh_dialog.adaptiveSizing.setChecked(False)
+            mesh_sizing.ResetAdaptiveSizes(task['size'])
+        self.mesh_dialog.CalculateElementBudget()
+
+    # Stop the workers that are still running and remove the session files
+    def reject(self):
+        self.timer.stop()
+        if self.executor:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+        if self.session:
+            self.session.Terminate()
+            self.session.Cleanup()
+        super().reject()
@@ -0,0 +1,208 @@
+#!python
+"""
+    Mesh validation before export.
+    1) Coincident nodes: node pairs closer than the tolerance that are not
+       the same node. The nodes are hashed into a grid with a cell size of
+       twice the tolerance. Every pair closer than the tolerance shares a
+       cell in at least one of the grids shifted by half a cell, so only the
+       nodes in the same cell are compared.
+    2) Hanging nodes: nodes of open face sides (sides with only one face)
+       that lie inside another open side. An open side on a material
+       interface means the two surfaces don't share their nodes. The open
+       side nodes are tested against the open sides in chunks.
+    The results are grouped by block and surface. The coincident nodes can
+    be merged.
+
+    The report gives the time to load the mesh from Cubit and the time of
+    the checks. The load issues one Cubit query per face and per node and
+    takes most of the time on a large mesh, the checks are NumPy passes.
+    Run it from the Cubit command line to measure both on the current mesh with
+        import mesh_validate; mesh_validate.Benchmark()
+"""
+import time
+
+import numpy as np
+
+import cubit
+
+import mesh_arrays
+from mesh_arrays import QUAD, TRI
+
+CHUNK_SIZE = 512
+
+
+# Default tolerance, a small fraction of the model size
+def DefaultTolerance(mesh):
+    if not len(mesh.coords):
+        return 1.0e-6
+    extent = np.linalg.norm(mesh.coords.max(axis=0) - mesh.coords.min(axis=0))
+    return max(extent * 1.0e-6, 1.0e-12)
+
+
+# Index pairs (i < j) of the points closer than the tolerance
+def CoincidentPairs(points, tolerance):
+    if len(points) < 2:
+        return np.zeros((0, 2), dtype=np.int64)
+    # a flat mesh only needs the shifts in x and y
+    flat = np.ptp(points[:, 2]) <= tolerance
+    dims = 2 if flat else 3
+    cell = 2.0 * tolerance
+    origin = points.min(axis=0)
+    pairs = []
+    for shift in range(2 ** dims):
+        offset = np.array([(shift >> d) & 1 for d in range(dims)]) * (cell / 2.0)
+        cells = np.floor((points[:, :dims] - origin[:dims] + offset) / cell).astype(np.int64)
+        # one integer key per cell
+        keys = cells[:, 0]
+        for d in range(1, dims):
+            keys = keys * (int(cells[:, d].max()) + 1) + cells[:, d]
+        _, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+        shared = np.nonzero(counts[inverse] > 1)[0]
+        if not len(shared):
+            continue
+        order = shared[np.argsort(inverse[shared], kind='stable')]
+        groups = np.split(order, np.nonzero(np.diff(inverse[order]))[0] + 1)
+        for group in groups:
+            i, j = np.triu_indices(len(group), 1)
+            pairs.append(np.stack([group[i], group[j]], axis=1))
+    if not pairs:
+        return np.zeros((0, 2), dtype=np.int64)
+    pairs = np.unique(np.sort(np.concatenate(pairs), axis=1), axis=0)
+    distance = np.linalg.norm(points[pairs[:, 0]] - points[pairs[:, 1]], axis=1)
+    return pairs[distance <= tolerance]
+
+
+# (node, side index) of the open side nodes that lie inside another open side
+def HangingNodes(mesh, side_nodes, tolerance):
+    if not len(side_nodes):
+        return []
+    nodes = np.unique(side_nodes)
+    points = mesh.coords[mesh.NodeIndex(nodes)]
+    start = mesh.coords[mesh.NodeIndex(side_nodes[:, 0])]
+    end = mesh.coords[mesh.NodeIndex(side_nodes[:, 1])]
+    direction = end - start
+    length2 = np.maximum((direction * direction).sum(axis=1), 1.0e-300)
+    lo = np.minimum(start, end) - tolerance
+    hi = np.maximum(start, end) + tolerance
+
+    found = []
+    for first in range(0, len(nodes), CHUNK_SIZE):
+        chunk = points[first:first + CHUNK_SIZE]
+        inside_box = ((chunk[:, None, :] >= lo[None]) & (chunk[:, None, :] <= hi[None])).all(axis=2)
+        node_index, side_index = np.nonzero(inside_box)
+        if not len(node_index):
+            continue
+        p = chunk[node_index]
+        t = ((p - start[side_index]) * direction[side_index]).sum(axis=1) / length2[side_index]
+        closest = start[side_index] + t[:, None] * direction[side_index]
+        distance = np.linalg.norm(p - closest, axis=1)
+        node_ids = nodes[first + node_index]
+        endpoint = (node_ids == side_nodes[side_index, 0]) | (node_ids == side_nodes[side_index, 1])
+        # the node is away from the side ends by more than the tolerance
+        margin = tolerance / np.sqrt(length2[side_index])
+        hanging = (distance <= tolerance) & (t > margin) & (t < 1.0 - margin) & ~endpoint
+        found += [(int(n), int(s)) for n, s in zip(node_ids[hanging], side_index[hanging])]
+    return found
+
+
+class MeshValidator():
+    def __init__(self, tolerance=None):
+        self.tolerance = tolerance
+        self.coincident = []
+        self.hanging = []
+        self.times = {}
+
+    def Run(self):
+        start = time.perf_counter()
+        blocks = list(cubit.get_block_id_list())
+        # the rebar bars use the nodes of the faces, they are not loaded
+        self.mesh = mesh_arrays.MeshArrays.Load(include_free=True)
+        if self.tolerance is None:
+            self.tolerance = DefaultTolerance(self.mesh)
+        self.BlockOfFaces(blocks)
+        self.times['load'] = time.perf_counter() - start
+
+        check_start = time.perf_counter()
+        pairs = CoincidentPairs(self.mesh.coords, self.tolerance)
+        self.coincident = [(int(self.mesh.node_ids[i]), int(self.mesh.node_ids[j])) for i, j in pairs]
+        side_nodes, self.side_faces, _ = self.mesh.BoundarySides()
+        self.side_nodes = side_nodes
+        self.hanging = HangingNodes(self.mesh, side_nodes, self.tolerance)
+        self.times['check'] = time.perf_counter() - check_start
+        return not self.coincident and not self.hanging
+
+    # Block of each face row, 0 where the face is not in a block
+    def BlockOfFaces(self, blocks):
+        rows = self.mesh.FaceRows()
+        self.face_block = np.zeros(len(self.mesh.face_ids), dtype=np.int64)
+        self.block_names = {0: "no block"}
+        for block in blocks:
+            self.block_names[block] = cubit.get_exodus_entity_name('block', block) or f"block {block}"
+            faces = [rows.get((QUAD, f)) for f in cubit.get_block_faces(block)]
+            faces += [rows.get((TRI, t)) for t in cubit.get_block_tris(block)]
+            faces = [f for f in faces if f is not None]
+            self.face_block[faces] = block
+
+    # (block name, surface) of the faces that use a node
+    def NodeGroups(self, node):
+        rows = np.nonzero((self.mesh.face_nodes == node).any(axis=1))[0]
+        return sorted(set((self.block_names[int(self.face_block[r])], int(self.mesh.face_surface[r])) for r in rows))
+
+    # Count the problems per (block, surface)
+    def Grouped(self):
+        groups = {}
+        for a, b in self.coincident:
+            for group in set(self.NodeGroups(a) + self.NodeGroups(b)):
+                groups.setdefault(group, [0, 0])[0] += 1
+        for node, side in self.hanging:
+            face = self.side_faces[side]
+            group = (self.block_names[int(self.face_block[face])], int(self.mesh.face_surface[face]))
+            groups.setdefault(group, [0, 0])[1] += 1
+        return groups
+
+    def Report(self):
+        lines = [f"Checked {len(self.mesh.node_ids)} nodes and {len(self.mesh.face_ids)} faces with tolerance "
+                 f"{self.tolerance:.3g} in {sum(self.times.values()):.2f}s (loading the mesh "
+                 f"{self.times['load']:.2f}s, checks {self.times['check']:.2f}s).",
+                 f"Coincident node pairs: {len(self.coincident)}",
+                 f"Hanging nodes on open sides: {len(self.hanging)}"]
+        groups = self.Grouped()
+        if groups:
+            lines.append(f"{'block':<32}{'surface':>8}{'coincident':>12}{'hanging':>9}")
+            for (block, surface), (coincident, hanging) in sorted(groups.items()):
+                surface = str(surface) if surface else "free"
+                lines.append(f"{block[:31]:<32}{surface:>8}{coincident:>12}{hanging:>9}")
+        for a, b in self.coincident[:10]:
+            lines.append(f"    coincident nodes {a} {b}")
+        for node, side in self.hanging[:10]:
+            lines.append(f"    node {node} hangs on the side {self.side_nodes[side][0]}-{self.side_nodes[side][1]}")
+        return "\n".join(lines)
+
+    # Merge the coincident node pairs into the lower id. Returns the number of merges.
+    def MergeCoincident(self):
+        merged = 0
+        removed = set()
+        cubit.cmd('set dev on')
+        try:
+            for a, b in self.coincident:
+                if a in removed or b in removed:
+                    continue
+                cubit.silent_cmd(f'merge node {max(a, b)} {min(a, b)}')
+                removed.add(max(a, b))
+                merged += 1
+        finally:
+            cubit.cmd('set dev off')
+        return merged
+
+
+# Time the load from Cubit and the checks on the current mesh
+def Benchmark(repeat=3):
+    lines = [f"{'nodes':>9} {'faces':>9} {'load':>8} {'checks':>8}"]
+    for _ in range(repeat):
+        validator = MeshValidator()
+        validator.Run()
+        lines.append(f"{len(validator.mesh.node_ids):>9} {len(validator.mesh.face_ids):>9} "
+                     f"{validator.times['load']:>8.2f} {validator.times['check']:>8.2f}")
+    report = "\n".join(lines)
+    print(report)
+    return report
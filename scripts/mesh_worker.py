@@ -0,0 +1,86 @@
+#!python
+"""
+    Entry point of a Cubit worker process started by cubit_workers.py.
+    The worker reads a JSON task file, opens the saved model in a Cubit
+    session without graphics, runs the task and prints the JSON result on
+    a line starting with cubit_workers.RESULT_PREFIX.
+
+    Tasks
+      sweep: delete any mesh, set the mesh size (and the adaptive sizes if a
+             minimum size is given), mesh the given surfaces (all surfaces
+             when none are given) and return the element
+             counts, triangle fraction, minimum scaled Jacobian and meshing time.
+      mesh_group: mesh the given surfaces, their curves are already meshed.
+             Return the interior nodes and the faces of every meshed surface
+             (see mesh_distributed.py).
+"""
+import json
+import sys
+import time
+
+import cubit
+
+import cubit_workers
+
+
+def InitCubit():
+    cubit.init(['cubit', '-nojournal', '-nographics', '-noecho'])
+
+
+def SweepTask(task):
+    import mesh_sizing
+
+    surfaces = task.get('surfaces') or cubit.get_entities('surface')
+    surface_str = cubit.string_from_id_list(surfaces)
+    cubit.cmd('delete mesh')
+    cubit.cmd(f"surface {surface_str} size {task['size']}")
+    if task.get('min_size'):
+        engine = mesh_sizing.SizingEngine(surfaces, task['size'], task['min_size'])
+        engine.Compute()
+        engine.Apply()
+
+    start = time.perf_counter()
+    cubit.cmd(f'mesh surface {surface_str}')
+    seconds = time.perf_counter() - start
+
+    elements, tris, min_quality = mesh_sizing.MeshStatistics(surfaces)
+    return {'elements': elements, 'quads': elements - tris, 'tris': tris,
+            'tri_fraction': tris / elements if elements else 0.0,
+            'min_quality': min_quality, 'seconds': seconds}
+
+
+def MeshGroupTask(task):
+    start = time.perf_counter()
+    surfaces = {}
+    for surf in task['surfaces']:
+        try:
+            cubit.cmd(f'mesh surface {surf}')
+        except Exception as e:
+            print(f"Unable to mesh surface {surf}:", e)
+        if not cubit.is_meshed('surface', surf):
+            continue
+        interior = cubit.parse_cubit_list('node', f'in surface {surf} except node in curve in surface {surf}')
+        nodes = [[n] + list(cubit.get_nodal_coordinates(n)) for n in interior]
+        faces = [list(cubit.get_connectivity('face', q))[:4] for q in cubit.get_surface_quads(surf)]
+        faces += [list(cubit.get_connectivity('tri', t))[:3] + [-1] for t in cubit.get_surface_tris(surf)]
+        surfaces[str(surf)] = {'nodes': nodes, 'faces': faces}
+    return {'surfaces': surfaces, 'seconds': time.perf_counter() - start}
+
+
+TASKS = {'sweep': SweepTask, 'mesh_group': MeshGroupTask}
+
+
+def main(task_file):
+    with open(task_file) as f:
+        task = json.load(f)
+    InitCubit()
+    cubit.cmd(f'open "{task["model"]}"')
+    try:
+        result = TASKS[task['type']](task)
+    except Exception as e:
+        result = {'error': str(e)}
+    print(cubit_workers.RESULT_PREFIX + json.dumps(result), flush=True)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1])
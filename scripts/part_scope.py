@@ -0,0 +1,222 @@
+#!python
+"""
+    Part scoping for several tire cross sections in one Cubit session. A
+    part is a Cubit group named part_<name> holding the bodies of one cross
+    section. While a part is active the tools only query and command the
+    entities of that part, so the cost of a step depends on the size of the
+    part and not on everything in the session:
+      Entities(kind)  the bodies, surfaces, curves, ... of the part,
+      Scope(kind)     the entity list of a command, "surface all" becomes
+                      "surface in body 4 5 6" (Within() is the list
+                      without the entity type),
+      Sets(kind)      the blocks, nodesets and sidesets of the part,
+      Name(name)      the block and set names get the part name as a prefix
+                      (<part>_tire-1_inside) so the parts don't share names.
+    The default part is ALL, every entity of the session. That is the
+    behaviour without parts, names are not prefixed. The active part is
+    kept for the Cubit session, see tire_parts.py to define and activate
+    parts.
+
+    Bodies created by a tool (geometry, blunting, reflection) are not in a
+    group yet, Adopt() adds them to the active part.
+"""
+import re
+
+import cubit
+
+ALL = "all"
+PREFIX = "part_"
+SEPARATOR = "_"
+
+active = ALL
+
+
+def GroupName(part):
+    return PREFIX + part
+
+
+# Group id of the part, 0 when it doesn't exist
+def GroupId(part):
+    return cubit.get_id_from_name(GroupName(part))
+
+
+# Names of the parts of the session
+def Parts():
+    parts = []
+    for group in cubit.parse_cubit_list('group', f'with name "{PREFIX}*"'):
+        name = cubit.get_entity_name('group', group)
+        if name.startswith(PREFIX):
+            parts.append(name[len(PREFIX):])
+    return sorted(parts)
+
+
+def PartBodies(part):
+    group = GroupId(part)
+    return list(cubit.get_group_bodies(group)) if group else []
+
+
+# Bodies that don't belong to any part
+def UnassignedBodies():
+    assigned = set()
+    for part in Parts():
+        assigned.update(PartBodies(part))
+    return [b for b in cubit.get_entities('body') if b not in assigned]
+
+
+# Create the part or add bodies to it. The part name becomes a prefix of
+# the block and set names, separated by SEPARATOR, so it is limited to
+# letters and digits. A part name can't contain the separator, "tire_*"
+# never matches the sets of a part "tire_v2".
+def Define(part, bodies=()):
+    if not re.fullmatch(r"[A-Za-z][A-Za-z0-9]*", part or ""):
+        raise ValueError(f'"{part}" is not a valid part name, use letters and digits.')
+    if part == ALL:
+        raise ValueError(f'"{ALL}" is reserved for the whole session.')
+    if bodies:
+        # a body belongs to one part
+        for other in Parts():
+            moved = sorted(set(bodies) & set(PartBodies(other))) if other != part else []
+            if moved:
+                cubit.cmd(f'group "{GroupName(other)}" remove body {cubit.string_from_id_list(moved)}')
+        cubit.cmd(f'group "{GroupName(part)}" add body {cubit.string_from_id_list(list(bodies))}')
+    elif not GroupId(part):
+        cubit.cmd(f'create group "{GroupName(part)}"')
+    return GroupId(part)
+
+
+def Activate(part):
+    global active
+    if part != ALL and not GroupId(part):
+        raise ValueError(f'There is no part "{part}".')
+    active = part
+    print(f"Active part: {part}")
+
+
+# Reset to the whole session, the part groups of a replaced model are gone
+def Reset():
+    global active
+    active = ALL
+
+
+def Active():
+    if active != ALL and not GroupId(active):
+        Reset()
+    return active
+
+
+# Add the bodies that don't belong to any part to the active part
+def Adopt():
+    if Active() == ALL:
+        return []
+    bodies = UnassignedBodies()
+    if bodies:
+        Define(active, bodies)
+    return bodies
+
+
+def Bodies():
+    if Active() == ALL:
+        return list(cubit.get_entities('body'))
+    return PartBodies(active)
+
+
+# The entities of the active part
+def Entities(kind):
+    if Active() == ALL:
+        return list(cubit.get_entities(kind))
+    bodies = PartBodies(active)
+    if kind == 'body' or not bodies:
+        return bodies
+    return list(cubit.parse_cubit_list(kind, f'in body {cubit.string_from_id_list(bodies)}'))
+
+
+# Id list of the active part for parse_cubit_list and filters, "all" or "in body 4 5 6"
+def Within():
+    if Active() == ALL:
+        return "all"
+    bodies = PartBodies(active)
+    if not bodies:
+        raise ValueError(f'The part "{active}" has no bodies.')
+    return f"in body {cubit.string_from_id_list(bodies)}"
+
+
+# Entity list of the active part for a command, e.g. f"mesh {Scope('surface')}"
+def Scope(kind):
+    if kind == 'body' and Active() != ALL:
+        return f"body {cubit.string_from_id_list(Bodies())}"
+    return f"{kind} {Within()}"
+
+
+# The name of a block or set in the active part
+def Name(name):
+    if Active() == ALL:
+        return name
+    return f"{active}{SEPARATOR}{name}"
+
+
+# The name without the part prefix, e.g. for the solver deck
+def BaseName(name):
+    if Active() != ALL and name.startswith(active + SEPARATOR):
+        return name[len(active) + len(SEPARATOR):]
+    return name
+
+
+def SetIds(kind):
+    if kind == 'block':
+        return list(cubit.get_block_id_list())
+    if kind == 'nodeset':
+        return list(cubit.get_nodeset_id_list())
+    return list(cubit.get_sideset_id_list())
+
+
+# Blocks, nodesets or sidesets of the active part: the sets named with the
+# part prefix and the unnamed material blocks created with the id of a part
+# body (tire_materials.py), unless another part's prefix names the block
+def Sets(kind):
+    if Active() == ALL:
+        return SetIds(kind)
+    sets = set(cubit.parse_cubit_list(kind, f'with name "{active}{SEPARATOR}*"'))
+    if kind == 'block':
+        others = tuple(part + SEPARATOR for part in Parts() if part != active)
+        for block in PartBodies(active):
+            if cubit.entity_exists('block', block) and \
+                    not (others and cubit.get_block_name(block).startswith(others)):
+                sets.add(block)
+    return sorted(sets)
+
+
+# Quads ('face') or triangles ('tri') of the active part, including the
+# elements of its blocks that are not owned by a surface (a mirrored mesh)
+def Elements(name):
+    if Active() == ALL:
+        return list(cubit.parse_cubit_list(name, 'all'))
+    elements = set(cubit.parse_cubit_list(name, Within()))
+    block_elements = cubit.get_block_faces if name == 'face' else cubit.get_block_tris
+    for block in Sets('block'):
+        elements.update(block_elements(block))
+    return sorted(elements)
+
+
+# Delete the blocks, nodesets or sidesets of the active part
+def DeleteSets(kind):
+    if Active() == ALL:
+        cubit.cmd(f"delete {kind} all")
+        return
+    sets = Sets(kind)
+    if sets:
+        cubit.cmd(f"delete {kind} {cubit.string_from_id_list(sets)}")
+
+
+def DeleteMesh():
+    if Active() == ALL:
+        cubit.cmd("delete mesh")
+    else:
+        cubit.cmd(f"delete mesh {Scope('surface')} propagate")
+
+
+# Opening a file (stage cache, checkpoints) replaces the whole session, it
+# is only safe when no other part has bodies
+def OnlyPart():
+    if Active() == ALL:
+        return True
+    return all(part == active or not PartBodies(part) for part in Parts())
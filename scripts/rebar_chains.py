@@ -0,0 +1,176 @@
+#!python
+"""
+    Rebar chains from the bulk bar connectivity (mesh_arrays.py). A chain
+    is an ordered node path along the bar elements of a block. A chain
+    starts at a node used by one bar, or by more than two bars where the
+    chain branches, and a closed chain starts at its lowest node.
+
+    The verifier checks the chains of every rebar block against the
+    reference sense, clockwise around the section centre in the x-y plane:
+      breaks:    open chain ends of a block within 1.5 bar lengths of each
+                 other that don't share a node,
+      branches:  nodes used by more than two bars,
+      mixed:     chains whose bars don't all point the same way,
+      reversed:  chains whose bars point counter-clockwise,
+      unordered: chains whose element ids are not monotonic along the chain.
+    Reversed, mixed and unordered chains are fixed by renumbering their
+    blocks with the clockwise start node (rebar_renumber.py).
+"""
+import numpy as np
+
+import cubit
+
+import mesh_arrays
+import part_scope
+import rebar_renumber
+
+
+# Ordered chains of the bars. Returns a list of (node path, bar rows), the
+# bar rows are in path order.
+def Chains(bar_nodes):
+    bar_nodes = np.asarray(bar_nodes, dtype=np.int64).reshape(-1, 2)
+    node_bars = {}
+    for row, (a, b) in enumerate(bar_nodes.tolist()):
+        node_bars.setdefault(a, []).append(row)
+        node_bars.setdefault(b, []).append(row)
+
+    used = np.zeros(len(bar_nodes), dtype=bool)
+    chains = []
+    # open chains first, then the closed loops that are left
+    starts = sorted(n for n, bars in node_bars.items() if len(bars) != 2) + sorted(node_bars)
+    for start in starts:
+        for first in node_bars[start]:
+            if used[first]:
+                continue
+            path, rows = [start], []
+            node, row = start, first
+            while row is not None:
+                used[row] = True
+                rows.append(row)
+                a, b = bar_nodes[row]
+                node = int(b if a == node else a)
+                path.append(node)
+                following = [r for r in node_bars[node] if not used[r]]
+                row = following[0] if len(node_bars[node]) == 2 and following else None
+            chains.append((np.array(path, dtype=np.int64), np.array(rows, dtype=np.int64)))
+    return chains
+
+
+# Bar rows to draw a direction arrow on: every k-th bar along each chain or
+# the middle bar of each chain
+def ArrowRows(bar_nodes, every=1, per_chain=False):
+    rows = []
+    for _, chain_rows in Chains(bar_nodes):
+        if per_chain:
+            rows.append(chain_rows[len(chain_rows) // 2])
+        else:
+            rows += list(chain_rows[::max(int(every), 1)])
+    return np.array(rows, dtype=np.int64)
+
+
+# Centre of the tire section (of the active part) in the x-y plane
+def SectionCenter():
+    bbox = cubit.get_total_bounding_box("body", part_scope.Bodies())
+    return np.array([(bbox[0] + bbox[1]) / 2, (bbox[3] + bbox[4]) / 2])
+
+
+# Signed angle swept by the path around the centre, negative is clockwise
+def SweepAngle(points, center):
+    r = points[:, :2] - center
+    cross = r[:-1, 0] * r[1:, 1] - r[:-1, 1] * r[1:, 0]
+    dot = (r[:-1] * r[1:]).sum(axis=1)
+    return float(np.arctan2(cross, dot).sum())
+
+
+# The end of the path where a clockwise chain starts
+def ClockwiseStart(path, points, center):
+    return int(path[0] if SweepAngle(points, center) <= 0.0 else path[-1])
+
+
+class ChainVerifier():
+    def __init__(self, blocks=None, center=None):
+        if blocks is None:
+            blocks = cubit.parse_cubit_list('block', f'with name "{part_scope.Name("reinf*")}"')
+        self.blocks = list(blocks)
+        block_edges = {b: list(cubit.get_block_edges(b)) for b in self.blocks}
+        self.mesh = mesh_arrays.MeshArrays.Load([], bar_edges=[e for b in self.blocks for e in block_edges[b]])
+        self.block_rows = {}
+        first = 0
+        for block in self.blocks:
+            self.block_rows[block] = np.arange(first, first + len(block_edges[block]))
+            first += len(block_edges[block])
+        self.center = SectionCenter() if center is None else np.asarray(center)[:2]
+        self.results = {}
+
+    # Check the chains of every block. Returns True when all chains are consistent.
+    # Run doesn't call Cubit, it can run in a worker thread with a
+    # cubit_tasks.TaskProgress.
+    def Run(self, progress=None):
+        lengths = np.linalg.norm(np.diff(self.mesh.coords[self.mesh.NodeIndex(self.mesh.bar_nodes)], axis=1)[:, 0], axis=1)
+        gap = 1.5 * float(np.median(lengths)) if len(lengths) else 0.0
+        for i, block in enumerate(self.blocks):
+            if progress:
+                progress.Update(i, len(self.blocks), f"Checking the chains of block {block}")
+            self.results[block] = self.CheckBlock(block, gap)
+        return not any(self.Problems(r) for r in self.results.values())
+
+    def CheckBlock(self, block, gap):
+        rows = self.block_rows[block]
+        bar_nodes = self.mesh.bar_nodes[rows]
+        bar_ids = self.mesh.bar_ids[rows]
+        nodes, counts = np.unique(bar_nodes, return_counts=True)
+        result = {'chains': 0, 'branches': [int(n) for n in nodes[counts > 2]], 'breaks': [],
+                  'mixed': [], 'reversed': [], 'unordered': []}
+        ends = []
+        for path, chain_rows in Chains(bar_nodes):
+            result['chains'] += 1
+            points = self.mesh.coords[self.mesh.NodeIndex(path)]
+            # the bars point along the path or against it
+            forward = bar_nodes[chain_rows, 0] == path[:-1]
+            if forward.any() and not forward.all():
+                result['mixed'].append(int(path[0]))
+                continue
+            sense = SweepAngle(points, self.center) * (1.0 if forward.all() else -1.0)
+            if sense > 0.0:
+                result['reversed'].append(int(path[0]))
+            ids = bar_ids[chain_rows] if forward.all() else bar_ids[chain_rows][::-1]
+            if len(ids) > 1 and not (np.all(np.diff(ids) > 0) or np.all(np.diff(ids) < 0)):
+                result['unordered'].append(int(path[0]))
+            if path[0] != path[-1]:
+                ends += [(int(path[0]), points[0]), (int(path[-1]), points[-1])]
+        # open chain ends of the block that nearly meet another chain end
+        for i in range(0, len(ends), 2):
+            for j in range(i + 2, len(ends)):
+                for a in (i, i + 1):
+                    if ends[a][0] != ends[j][0] and np.linalg.norm(ends[a][1] - ends[j][1]) <= gap:
+                        result['breaks'].append((ends[a][0], ends[j][0]))
+        return result
+
+    def Problems(self, result):
+        return sum(len(result[k]) for k in ('branches', 'breaks', 'mixed', 'reversed', 'unordered'))
+
+    # Blocks whose chains can be fixed by renumbering them clockwise
+    def FixableBlocks(self):
+        return [b for b, r in self.results.items() if r['mixed'] or r['reversed'] or r['unordered']]
+
+    def Report(self):
+        lines = [f"{'block':<40}{'chains':>7}{'breaks':>7}{'branches':>9}{'reversed':>9}{'mixed':>6}{'unordered':>10}"]
+        for block, r in self.results.items():
+            name = cubit.get_exodus_entity_name('block', block) or f"block {block}"
+            lines.append(f"{name[:39]:<40}{r['chains']:>7}{len(r['breaks']):>7}{len(r['branches']):>9}"
+                         f"{len(r['reversed']):>9}{len(r['mixed']):>6}{len(r['unordered']):>10}")
+            for a, b in r['breaks'][:5]:
+                lines.append(f"    break between nodes {a} and {b}")
+            for node in r['branches'][:5]:
+                lines.append(f"    branch at node {node}")
+        return "\n".join(lines)
+
+    # Renumber the blocks with reversed, mixed or unordered chains so every
+    # chain runs clockwise. Returns the blocks that failed.
+    def Fix(self):
+        blocks = self.FixableBlocks()
+        if not blocks:
+            return []
+        planner = rebar_renumber.RebarRenumber(blocks, self.center)
+        planner.Plan()
+        return planner.Apply()
@@ -0,0 +1,122 @@
+#!python
+"""
+    Rebar midline of mapped surfaces that are two elements thick. The quads
+    of a 2xN mapped surface form a structured grid and the rebar runs along
+    the middle row of edges. An interior edge of the surface is on the
+    midline when the opposite side of both of its quads is on the boundary
+    of the surface. The edges are found for all surfaces of a block in one
+    NumPy pass over the bulk connectivity (mesh_arrays.py), the node
+    coordinates are not loaded. Only the edges at the nodes of the midline
+    pairs are queried for their ids.
+
+    In a 2x2 surface all four interior edges pass the test. The two opposite
+    edges that connect to the midlines of the neighbouring surfaces are used.
+"""
+import numpy as np
+
+import cubit
+
+import mesh_arrays
+from mesh_arrays import QUAD
+
+
+# Midline node pairs of every surface. Returns {surface: [(node, node), ...]}
+# and the surfaces that are not meshed with quads only.
+def MidlineNodePairs(surfaces):
+    mesh = mesh_arrays.MeshArrays.Load(surfaces, coordinates=False)
+    not_quads = sorted(set(int(s) for s in mesh.face_surface[mesh.face_types != QUAD]))
+    quad_rows = np.nonzero(~np.isin(mesh.face_surface, not_quads))[0]
+    if not len(quad_rows):
+        return {}, not_quads
+
+    nodes, faces, sides = mesh.FaceSides()
+    keep = np.isin(faces, quad_rows)
+    nodes, faces, sides = nodes[keep], faces[keep], sides[keep]
+    side_row = np.full((len(mesh.face_ids), 4), -1, dtype=np.int64)
+    side_row[faces, sides] = np.arange(len(faces))
+
+    # a side is on the boundary of its surface when no other quad of the surface uses it
+    surface_key = mesh.EdgeKey(nodes[:, 0], nodes[:, 1]) * (int(mesh.face_surface.max()) + 1) \
+        + mesh.face_surface[faces]
+    order = np.argsort(surface_key, kind='stable')
+    _, inverse, counts = np.unique(surface_key, return_inverse=True, return_counts=True)
+    boundary = counts[inverse] == 1
+
+    sorted_keys = surface_key[order]
+    pairs = np.nonzero(sorted_keys[1:] == sorted_keys[:-1])[0]
+    first, second = order[pairs], order[pairs + 1]
+    opposite_first = side_row[faces[first], (sides[first] + 2) % 4]
+    opposite_second = side_row[faces[second], (sides[second] + 2) % 4]
+    midline = boundary[opposite_first] & boundary[opposite_second]
+
+    result = {}
+    for row in first[midline]:
+        surface = int(mesh.face_surface[faces[row]])
+        result.setdefault(surface, []).append((int(nodes[row, 0]), int(nodes[row, 1])))
+    return result, not_quads
+
+
+# The four midline edges of a 2x2 surface share the center node, the
+# midline of a longer surface is a path
+def IsTwoByTwo(pairs):
+    if len(pairs) != 4:
+        return False
+    return bool(set(pairs[0]).intersection(*(set(p) for p in pairs[1:])))
+
+
+# In a 2x2 surface pick the two opposite center edges that continue the
+# chain of the neighbouring surfaces
+def ResolveTwoByTwo(pairs, chain_nodes):
+    counts = {}
+    for a, b in pairs:
+        counts[a] = counts.get(a, 0) + 1
+        counts[b] = counts.get(b, 0) + 1
+    center = max(counts, key=counts.get)
+    outer = [b if a == center else a for a, b in pairs]
+    # opposite mid-side nodes don't share a quad with each other
+    quads = {n: set(cubit.parse_cubit_list('face', f'in node {n}')) for n in outer}
+    choices = []
+    for i in range(len(outer)):
+        for j in range(i + 1, len(outer)):
+            if not quads[outer[i]] & quads[outer[j]]:
+                connected = (outer[i] in chain_nodes) + (outer[j] in chain_nodes)
+                choices.append((connected, [(center, outer[i]), (center, outer[j])]))
+    if not choices:
+        return pairs
+    choices.sort(key=lambda c: c[0], reverse=True)
+    if choices[0][0] == 0:
+        print("A 2x2 rebar surface is not connected to another rebar surface, its direction is a guess.")
+    return choices[0][1]
+
+
+# Mesh edge id of each node pair, the edge shared by the edges of both
+# nodes. node_edges caches the edges of a node, the pairs of a midline
+# share their nodes.
+def EdgeIds(node_pairs, node_edges=None):
+    node_edges = {} if node_edges is None else node_edges
+    edges = []
+    for pair in node_pairs:
+        for node in pair:
+            if node not in node_edges:
+                node_edges[node] = set(cubit.parse_cubit_list('edge', f'in node {node}'))
+        shared = node_edges[pair[0]] & node_edges[pair[1]]
+        if shared:
+            edges.append(min(shared))
+    return edges
+
+
+# The rebar edges of the surfaces of a block. Returns (edge ids, surfaces that failed).
+def MidlineEdges(surfaces):
+    pairs, failed = MidlineNodePairs(surfaces)
+    two_by_two = [s for s, p in pairs.items() if IsTwoByTwo(p)]
+    chain_nodes = set(n for s, p in pairs.items() if s not in two_by_two for pair in p for n in pair)
+    for surf in two_by_two:
+        pairs[surf] = ResolveTwoByTwo(pairs[surf], chain_nodes)
+        chain_nodes.update(n for pair in pairs[surf] for n in pair)
+    failed += [s for s in surfaces if s not in pairs and s not in failed]
+
+    edges = []
+    node_edges = {}
+    for surface_pairs in pairs.values():
+        edges += EdgeIds(surface_pairs, node_edges)
+    return edges, failed
@@ -0,0 +1,125 @@
+#!python
+"""
+    Planned renumbering of all rebar blocks.
+    1) Load the bars of every "reinf*" block once (mesh_arrays.py).
+    2) Split the left/right oriented blocks by the y coordinate of the bar
+       midpoints, the bars with y > 0 go to a new "-left" block.
+    3) Build the chains of each block (rebar_chains.py) and start each
+       chain at the end that makes it run clockwise around the section
+       centre. Unlike the maximum y end this also holds for plies that fold
+       back around the bead.
+    4) Give each block its own contiguous element and node id range above
+       all existing ids, run `renumber rebar` for every block and compress
+       the ids once at the end.
+"""
+import numpy as np
+
+import cubit
+
+import mesh_arrays
+import part_scope
+import rebar_chains
+
+# blocks that are split into left and right after the reflection
+LEFT_RIGHT_BLOCKS = ("reinf-1_Set-Rebar-Chafer",
+                     "reinf-1_Set-Rebar-Chafer-nylon1",
+                     "reinf-1_Set-Rebar-Chafer-nylon2")
+
+
+class RebarRenumber():
+    def __init__(self, blocks=None, center=None):
+        if blocks is None:
+            blocks = cubit.parse_cubit_list('block', f'with name "{part_scope.Name("reinf*")}"')
+        self.blocks = list(blocks)
+        block_edges = {b: list(cubit.get_block_edges(b)) for b in self.blocks}
+        bar_edges = [e for b in self.blocks for e in block_edges[b]]
+        self.mesh = mesh_arrays.MeshArrays.Load([], bar_edges=bar_edges)
+        self.block_rows = {}
+        first = 0
+        for block in self.blocks:
+            self.block_rows[block] = np.arange(first, first + len(block_edges[block]))
+            first += len(block_edges[block])
+        self.center = rebar_chains.SectionCenter() if center is None else np.asarray(center)[:2]
+        self.plan = []
+        self.error_blocks = []
+
+    def BarPoints(self, rows):
+        return self.mesh.coords[self.mesh.NodeIndex(self.mesh.bar_nodes[rows])]
+
+    # Move the bars with y > 0 of the named blocks to new "-left" blocks and
+    # rename the original blocks "-right"
+    def SplitLeftRight(self, names=LEFT_RIGHT_BLOCKS):
+        for name in map(part_scope.Name, names):
+            found = cubit.parse_cubit_list('block', f'with name "{name}"')
+            if len(found) != 1 or found[0] not in self.block_rows:
+                continue
+            block = found[0]
+            rows = self.block_rows[block]
+            left = self.BarPoints(rows)[:, :, 1].mean(axis=1) > 0.0
+            base_name = name.replace('-left', '').replace('-right', '')
+            cubit.cmd(f'block {block} name "{base_name}-right"')
+            if not left.any():
+                continue
+            left_edges = cubit.string_from_id_list([int(e) for e in self.mesh.bar_ids[rows[left]]])
+            cubit.silent_cmd(f'block {block} remove edge {left_edges}')
+            next_block = cubit.get_next_block_id()
+            cubit.silent_cmd(f'block {next_block} add edge {left_edges}')
+            cubit.cmd(f'block {next_block} name "{base_name}-left"')
+            self.block_rows[block] = rows[~left]
+            self.block_rows[next_block] = rows[left]
+            self.blocks.append(next_block)
+
+    # The end of each chain where it starts running clockwise
+    def StartNodes(self, block):
+        start_nodes = []
+        for path, _ in rebar_chains.Chains(self.mesh.bar_nodes[self.block_rows[block]]):
+            points = self.mesh.coords[self.mesh.NodeIndex(path)]
+            start_nodes.append(rebar_chains.ClockwiseStart(path, points, self.center))
+        return start_nodes
+
+    # Contiguous element and node id ranges of every block above all existing ids
+    def Plan(self):
+        elem_start = max(cubit.get_last_id('quad'), cubit.get_last_id('tri'),
+                         cubit.get_last_id('edge'), cubit.get_last_id('node')) + 1
+        node_start = elem_start + len(self.mesh.bar_ids)
+        self.plan = []
+        for block in self.blocks:
+            rows = self.block_rows[block]
+            if not len(rows):
+                continue
+            self.plan.append((block, self.StartNodes(block), node_start, elem_start))
+            elem_start += len(rows)
+            node_start += len(np.unique(self.mesh.bar_nodes[rows]))
+        return self.plan
+
+    def ApplyBlock(self, block, start_nodes, node_start, elem_start):
+        try:
+            initial_node_str = " ".join(str(n) for n in start_nodes)
+            cubit.cmd(f'renumber rebar block {block} initial node {initial_node_str} '
+                      f'node_start_id {node_start} elem_start_id {elem_start}')
+        except Exception as e:
+            self.error_blocks.append(block)
+            print(f"Error renumbering rebar block {block}")
+            print(e)
+
+    # The renumbering of each block of the plan and the final compress, so a
+    # cubit_tasks.CommandQueue can run them in time slices
+    def Commands(self):
+        self.error_blocks = []
+        return [lambda entry=entry: self.ApplyBlock(*entry) for entry in self.plan] + \
+            [lambda: cubit.silent_cmd('compress')]
+
+    # Renumber the blocks of the plan and compress once. Returns the blocks that failed.
+    def Apply(self):
+        for command in self.Commands():
+            command()
+        return self.error_blocks
+
+    # Split the left/right blocks and plan the renumbering
+    def Prepare(self, split_names=LEFT_RIGHT_BLOCKS):
+        self.SplitLeftRight(split_names)
+        return self.Plan()
+
+    def Run(self, split_names=LEFT_RIGHT_BLOCKS):
+        self.Prepare(split_names)
+        return self.Apply()
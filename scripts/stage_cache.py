@@ -0,0 +1,179 @@
+#!python
+"""
+    Content addressed cache of the pipeline stage results. The inputs of a
+    stage are hashed together with the stage name and the toolbar version
+    (a digest of the toolbar scripts, so changing a script invalidates its
+    results):
+      geometry: the curve geometry and the merge tolerance,
+      mesh:     the fingerprints of the surfaces and curves (geometry after
+                blunting, mapped schemes, sizes and intervals, see
+                mesh_fingerprint.py), the block names and the mesh options.
+    The result of a stage is the model saved as a cub5 file under its key.
+    A cache hit opens the file instead of running the stage. Opening
+    replaces the whole session, so the cache is only used when the session
+    holds nothing but the inputs of the stage (OnlyStageInputs).
+
+    The cache lives in TIRE_STAGE_CACHE (default: tire_stage_cache in the
+    temporary directory) and is kept under TIRE_STAGE_CACHE_MB megabytes
+    (default 2048) by removing the least recently used files. The hit, miss
+    and time saved statistics of each stage are kept for the Cubit session.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+import cubit
+
+import mesh_fingerprint
+
+CACHE_DIR = os.environ.get("TIRE_STAGE_CACHE", os.path.join(tempfile.gettempdir(), "tire_stage_cache"))
+CACHE_BUDGET = int(os.environ.get("TIRE_STAGE_CACHE_MB", "2048")) * 1024 * 1024
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# stage -> {'hits', 'misses', 'stored', 'saved'} for the session
+stats = {}
+toolbar_version = None
+
+
+# Digest of the toolbar scripts
+def ToolbarVersion():
+    global toolbar_version
+    if toolbar_version is None:
+        digest = hashlib.sha256()
+        for name in sorted(os.listdir(SCRIPT_DIR)):
+            if name.endswith(".py"):
+                with open(os.path.join(SCRIPT_DIR, name), "rb") as f:
+                    digest.update(name.encode() + f.read())
+        toolbar_version = digest.hexdigest()
+    return toolbar_version
+
+
+def StageKey(stage, inputs):
+    return hashlib.sha256(repr((stage, ToolbarVersion(), inputs)).encode()).hexdigest()
+
+
+# The geometry of the curves read from the file (all curves by default), independent of their ids
+def CurveInputs(curve_ids=None):
+    curves = []
+    for curve in curve_ids if curve_ids is not None else cubit.get_entities("curve"):
+        vertices = cubit.get_relatives('curve', curve, 'vertex')
+        curves.append((round(cubit.get_curve_length(curve), mesh_fingerprint.PRECISION),
+                       mesh_fingerprint.RoundedCoordinates(vertices)))
+    return tuple(sorted(curves))
+
+
+# The fingerprints of the surfaces and curves (mesh_fingerprint.ComputeFingerprints) and the block names
+def ModelInputs(fingerprints):
+    surface_fingerprints, curve_fingerprints = fingerprints[:2]
+    blocks = tuple((b, cubit.get_exodus_entity_name('block', b)) for b in cubit.get_block_id_list())
+    return tuple(sorted(surface_fingerprints.items())), tuple(sorted(curve_fingerprints.items())), blocks
+
+
+# True when the session holds nothing but the inputs of a stage: the given
+# bodies and free curves, no nodesets or sidesets and, unless the blocks are
+# part of the stage inputs, no blocks. Anything else would be lost when the
+# cached model is opened.
+def OnlyStageInputs(bodies=(), free_curves=(), with_blocks=False):
+    if set(cubit.get_entities('body')) != set(bodies):
+        return False
+    if set(cubit.parse_cubit_list('curve', 'all except curve in body all')) != set(free_curves):
+        return False
+    if cubit.get_nodeset_count() or cubit.get_sideset_count():
+        return False
+    return with_blocks or not cubit.get_block_count()
+
+
+# Files under a size budget, the least recently used are removed first
+class FileStore():
+    def __init__(self, directory, budget, suffix=".cub5"):
+        self.directory = directory
+        self.budget = budget
+        self.suffix = suffix
+        os.makedirs(directory, exist_ok=True)
+
+    def Path(self, key):
+        return os.path.join(self.directory, key + self.suffix)
+
+    # The file of the key or None, a hit counts as a use
+    def Get(self, key):
+        path = self.Path(key)
+        if not os.path.exists(path):
+            return None
+        os.utime(path)
+        return path
+
+    def Files(self):
+        files = []
+        for name in os.listdir(self.directory):
+            if name.endswith(self.suffix):
+                path = os.path.join(self.directory, name)
+                files.append((os.path.getmtime(path), os.path.getsize(path), path))
+        return sorted(files)
+
+    def Usage(self):
+        return sum(size for _, size, _ in self.Files())
+
+    # Remove the oldest files until the store fits the budget, keep is never removed
+    def Evict(self, keep=None):
+        files = self.Files()
+        total = sum(size for _, size, _ in files)
+        for _, size, path in files:
+            if total <= self.budget:
+                break
+            if path == keep:
+                continue
+            for remove in (path, os.path.splitext(path)[0] + ".json"):
+                if os.path.exists(remove):
+                    os.remove(remove)
+            total -= size
+        return total
+
+
+class StageCache():
+    def __init__(self, directory=CACHE_DIR, budget=CACHE_BUDGET):
+        self.store = FileStore(directory, budget)
+
+    def Stats(self, stage):
+        return stats.setdefault(stage, {'hits': 0, 'misses': 0, 'stored': 0, 'saved': 0.0})
+
+    # Open the cached result of the stage. Returns True on a hit.
+    def Restore(self, stage, inputs):
+        key = StageKey(stage, inputs)
+        path = self.store.Get(key)
+        if path is None:
+            self.Stats(stage)['misses'] += 1
+            return False
+        start = time.perf_counter()
+        cubit.cmd(f'open "{path}"')
+        # the session caches refer to the replaced model
+        mesh_fingerprint.Reset()
+        seconds = 0.0
+        meta = os.path.splitext(path)[0] + ".json"
+        if os.path.exists(meta):
+            with open(meta) as f:
+                seconds = json.load(f).get("seconds", 0.0)
+        self.Stats(stage)['hits'] += 1
+        self.Stats(stage)['saved'] += max(seconds - (time.perf_counter() - start), 0.0)
+        print(f"Stage {stage}: restored the cached result ({seconds:.1f}s to compute).")
+        return True
+
+    # Save the current model as the result of the stage
+    def Store(self, stage, inputs, seconds):
+        key = StageKey(stage, inputs)
+        path = self.store.Path(key)
+        cubit.cmd(f'save cub5 "{path}" overwrite')
+        with open(os.path.splitext(path)[0] + ".json", "w") as f:
+            json.dump({"stage": stage, "seconds": seconds}, f)
+        self.Stats(stage)['stored'] += 1
+        self.store.Evict(keep=path)
+        return path
+
+    def Report(self):
+        lines = [f"{'stage':<12}{'hits':>6}{'misses':>8}{'stored':>8}{'saved (s)':>11}"]
+        for stage, s in sorted(stats.items()):
+            lines.append(f"{stage:<12}{s['hits']:>6}{s['misses']:>8}{s['stored']:>8}{s['saved']:>11.1f}")
+        lines.append(f"Cache {self.store.directory}: {self.store.Usage() / 1048576.0:.1f} of "
+                     f"{self.store.budget / 1048576.0:.0f} MB")
+        return "\n".join(lines)
@@ -1,12 +1,17 @@
 #!python
 
 # create boundary sets nodeset and sidesets (NSET and ELSET in Abaqus).
-# Use geometric reasoning and connectedness to find the sets.
+# When the surfaces are meshed the sets come from the exterior boundary of
+# the mesh (see mesh_boundary.py). Otherwise use geometric reasoning and
+# connectedness to find the sets.
 
 from itertools import chain
 from math import *
 
 import cubit_utils
+import mesh_arrays
+import mesh_boundary
+import part_scope
 
 from PySide6.QtCore import QMetaObject, Qt
 
@@ -48,7 +53,7 @@ class BoundaryConditions(QDialog):
         
         # Initial setup commands (assuming cubit is available)
         cubit.set_pick_type("Vertex")
-        bodies = cubit.get_entities("body")
+        bodies = part_scope.Bodies()
         bbox = cubit.get_total_bounding_box("body", bodies)
         self.xmin = bbox[0]
         self.xmax = bbox[1]
@@ -57,9 +62,9 @@ class BoundaryConditions(QDialog):
         self.xcenter = (self.xmin + self.xmax)/2
         self.ycenter = (self.ymin + self.ymax)/2
 
-        # clear all existing sidests
-        cubit.cmd("delete sideset all")
-        cubit.cmd("delete nodeset all")
+        # clear all existing sidests (of the active part)
+        part_scope.DeleteSets("sideset")
+        part_scope.DeleteSets("nodeset")
     # end __init__
 
     # Get the selected id from Cubit and insert it into the GUI
@@ -80,13 +85,13 @@ class BoundaryConditions(QDialog):
     def inside_bc_nodeset(self):
         origin = [self.xcenter, self.ycenter, 0]
         direction = [0, -1, 0]
-        all_curves = cubit.get_entities('curve')
+        all_curves = part_scope.Entities('curve')
         try:
             _, curves =  cubit.fire_ray(origin, direction, 'curve', all_curves, 0, .001) 
             cubit.cmd(f"nodeset auto_id add curve {curves[0]} include continuous with num_parents=1")
             nodeset_id = cubit.get_next_nodeset_id()-1
             print(f"Creating inside bc: {nodeset_id}")
-            cubit.cmd(f'nodeset {nodeset_id} name "tire-1_inside"')
+            cubit.cmd(f'nodeset {nodeset_id} name "{part_scope.Name("tire-1_inside")}"')
         except Exception as e:
             print('Unable to create inside bc nodeset')
             
@@ -98,13 +103,13 @@ class BoundaryConditions(QDialog):
 
     # define the nodeset outside of the tire
     def outside_bc_nodeset(self):
-        exterior_curves = set(cubit.parse_cubit_list("curve", "with num_parents=1"))
-        inside_curves = set(cubit.parse_cubit_list("curve", "in nodeset with name 'tire-1_inside'"))
+        exterior_curves = set(cubit.parse_cubit_list("curve", f"{part_scope.Within()} with num_parents=1"))
+        inside_curves = set(cubit.parse_cubit_list("curve", f"in nodeset with name '{part_scope.Name('tire-1_inside')}'"))
         outside_curves = exterior_curves - inside_curves
         outside_curve_str = " ".join([str(c) for c in outside_curves])
-        cubit.cmd(f"nodeset auto_id add curve {outside_curve_str} except curve in nodeset with name 'tire-1_symm-nodes'")
+        cubit.cmd(f"nodeset auto_id add curve {outside_curve_str} except curve in nodeset with name '{part_scope.Name('tire-1_symm-nodes')}'")
         nodeset_id = cubit.get_next_nodeset_id()-1
-        cubit.cmd(f'nodeset {nodeset_id} name "tire-1_outside"')
+        cubit.cmd(f'nodeset {nodeset_id} name "{part_scope.Name("tire-1_outside")}"')
 
     # create a nodeset at the tip. Note that a tip vertex must be specified via the GUI.
     def tip_bc_nodeset(self):
@@ -113,39 +118,39 @@ class BoundaryConditions(QDialog):
             coord = cubit.get_center_point('vertex', vertex)
             cubit.cmd(f"nodeset auto_id add curve in surface in vertex {vertex} with num_parents=1 except curve with y_coord > {coord[1]}")
             nodeset_id = cubit.get_next_nodeset_id()-1
-            cubit.cmd(f'nodeset {nodeset_id} name "tire-1_Set-contact-R/L"')
+            cubit.cmd(f'nodeset {nodeset_id} name "{part_scope.Name("tire-1_Set-contact-R/L")}"')
         except Exception as e:
             cubit_utils.ErrorWindow("A tip vertex must be specified prior to creating boundary conditions.") 
             
     # create the nodes containing all nodes
     def all_nodes(self): 
-        cubit.cmd("nodeset auto_id add surface all")
+        cubit.cmd(f"nodeset auto_id add {part_scope.Scope('surface')}")
         nodeset_id = cubit.get_next_nodeset_id()-1
-        cubit.cmd(f'nodeset {nodeset_id} name "Set-all-nodes"')        
+        cubit.cmd(f'nodeset {nodeset_id} name "{part_scope.Name("Set-all-nodes")}"')        
 
     # create the nodeset on the axisymmetric boundary
     def axisymmetric(self):
         # This needs a tolerance and not be exactly y=0.0
-        cubit.cmd("nodeset auto_id add curve with y_coord > -0.006")
+        cubit.cmd(f"nodeset auto_id add curve {part_scope.Within()} with y_coord > -0.006")
         nodeset_id = cubit.get_next_nodeset_id()-1
-        cubit.cmd(f'nodeset {nodeset_id} name "tire-1_symm-nodes"')
+        cubit.cmd(f'nodeset {nodeset_id} name "{part_scope.Name("tire-1_symm-nodes")}"')
 
     # create the sideset inside the tire
     def inside_contact_sideset(self):
-        cubit.cmd("sideset auto_id add curve in nodeset with name 'tire-1_inside'")
+        cubit.cmd(f"sideset auto_id add curve in nodeset with name '{part_scope.Name('tire-1_inside')}'")
         sideset_id = cubit.get_next_sideset_id()-1
-        cubit.cmd(f'sideset {sideset_id} name "tire-1_Surf-inflation"')
+        cubit.cmd(f'sideset {sideset_id} name "{part_scope.Name("tire-1_Surf-inflation")}"')
 
     # create a nodeset in the tread based on the curves in the previously defined tread sideset
     def tread_nodeset(self):
-        cubit.cmd(f"nodeset auto_id add curve in sideset with name 'tire-1_Surf-contact-TRD'")
+        cubit.cmd(f"nodeset auto_id add curve in sideset with name '{part_scope.Name('tire-1_Surf-contact-TRD')}'")
         nodeset_id = cubit.get_next_nodeset_id()-1
-        cubit.cmd(f'nodeset {nodeset_id} name "tire-1_Set-contact-TRD"')
+        cubit.cmd(f'nodeset {nodeset_id} name "{part_scope.Name("tire-1_Set-contact-TRD")}"')
 
     # find the curves at maximum X direction.
     def simple_tread_sideset(self):
         # find the center point of the bounding box of all bodies
-        bodies = cubit.get_entities("body")
+        bodies = part_scope.Bodies()
         bbox = cubit.get_total_bounding_box("body", bodies)
         xmin = bbox[0]
         xmax = bbox[1]
@@ -155,7 +160,7 @@ class BoundaryConditions(QDialog):
         # fire a ray from the center point in the positive x direction
         # find the last intersecting curve. This will be a curve on the tread
         # then find the surface in that curve. That will be the tread surface.
-        all_curves = cubit.get_entities('curve')
+        all_curves = part_scope.Entities('curve')
         origin = [xcenter, ycenter, 0]
         # surfaces in the -Y direction
         direction = [1, 0, 0]
@@ -171,13 +176,52 @@ class BoundaryConditions(QDialog):
 
         # Now find the curves that are exterior (number of parents = 1) on the tread surface.
         # These are the curves in the tread surface. Exclude the axisymmetric curve.
-        cubit.cmd(f"sideset auto_id add curve in surface {tread_surface} with num_parents=1 except curve in nodeset with name 'tire-1_symm-nodes'")
+        cubit.cmd(f"sideset auto_id add curve in surface {tread_surface} with num_parents=1 except curve in nodeset with name '{part_scope.Name('tire-1_symm-nodes')}'")
         sideset_id = cubit.get_next_sideset_id()-1
-        cubit.cmd(f'sideset {sideset_id} name "tire-1_Surf-contact-TRD"')
+        cubit.cmd(f'sideset {sideset_id} name "{part_scope.Name("tire-1_Surf-contact-TRD")}"')
+
+    # create all sets from the exterior boundary of the mesh with the same names
+    # as the geometric sets. Returns False if the mesh can't be used.
+    def mesh_boundary_sets(self):
+        within = part_scope.Within()
+        if not cubit.parse_cubit_list('face', within) and not cubit.parse_cubit_list('tri', within):
+            return False
+        try:
+            vertex = self.GetVertexLineEdit()
+        except Exception as e:
+            cubit_utils.ErrorWindow("A tip vertex must be specified prior to creating boundary conditions.")
+            return True
+        try:
+            boundary = mesh_boundary.ExteriorBoundary()
+            boundary.Split(vertex)
+        except mesh_arrays.MirroredMesh as e:
+            cubit_utils.ErrorWindow(f"{e}\nMirroring the mesh copies the sets.")
+            return True
+        except Exception as e:
+            print("Unable to use the mesh boundary, using the geometric sets:", e)
+            return False
+
+        symmetry_nodes = boundary.SegmentNodes('symmetry')
+        inside_nodes = boundary.SegmentNodes('inside')
+        # like the geometric sets, the outside keeps the nodes it shares with
+        # the symmetry and inside segments (the corner and the tip node), the
+        # interior nodes of those segments are not on an outside side
+        outside_nodes = boundary.SegmentNodes('outside')
+        mesh_boundary.CreateNodeset(part_scope.Name("tire-1_symm-nodes"), symmetry_nodes)
+        mesh_boundary.CreateNodeset(part_scope.Name("tire-1_inside"), inside_nodes[inside_nodes != boundary.tip_node])
+        mesh_boundary.CreateNodeset(part_scope.Name("tire-1_outside"), outside_nodes)
+        mesh_boundary.CreateNodeset(part_scope.Name("tire-1_Set-contact-R/L"), boundary.SegmentNodes('tip'))
+        self.all_nodes()
+        mesh_boundary.CreateSideset(part_scope.Name("tire-1_Surf-inflation"), *boundary.SegmentCurvesAndEdges('inside'))
+        mesh_boundary.CreateSideset(part_scope.Name("tire-1_Surf-contact-TRD"), *boundary.SegmentCurvesAndEdges('tread'))
+        mesh_boundary.CreateNodeset(part_scope.Name("tire-1_Set-contact-TRD"), boundary.SegmentNodes('tread'))
+        return True
 
     # create the required sets
     def CreateBCs(self):            
         try:
+            if self.mesh_boundary_sets():
+                return
             self.axisymmetric()
             self.inside_bc_nodeset()
             self.outside_bc_nodeset()
@@ -19,6 +19,7 @@ import numpy as np
 from scipy.spatial.transform import Rotation
 import sys
 import cubit_utils
+import part_scope
 
 from PySide6.QtCore import QMetaObject, Qt
 
@@ -266,8 +267,8 @@ class TireBlunt(QDialog):
         cubit.cmd("undo group begin")
 
         # make sure that we are picking only one vertex at blunt point
-        cubit.cmd("imprint all")
-        cubit.cmd("merge all")
+        cubit.cmd(f"imprint {part_scope.Scope('body')}")
+        cubit.cmd(f"merge {part_scope.Scope('body')}")
         try:
             dist_str = self.bluntDistance.text()
             distance = float(dist_str)
@@ -365,9 +366,11 @@ class TireBlunt(QDialog):
             cubit.cmd("undo group end")
             return
 
+        # the separated surfaces are new bodies of the active part
+        part_scope.Adopt()
         try:
-            cubit.cmd('imprint all')
-            cubit.cmd('merge all')
+            cubit.cmd(f"imprint {part_scope.Scope('body')}")
+            cubit.cmd(f"merge {part_scope.Scope('body')}")
         except Exception as e:
             print("Error in imprint and merge", e)
             cubit.cmd("undo group end")
@@ -0,0 +1,116 @@
+#!python
+"""
+    Write the Abaqus input deck with the streaming writer (see
+    abaqus_writer.py). The deck is written with gzip when the compress
+    option is checked or the file name ends in .gz. The revolved 3D deck
+    (tire_revolve.py) is written from the mesh archive next to the section
+    deck as <name>_3d.inp.
+"""
+import os
+import time
+
+from PySide6.QtCore import QMetaObject
+from PySide6.QtWidgets import QDialog, QGridLayout, QLabel, QLineEdit, QDialogButtonBox, \
+    QPushButton, QCheckBox, QFileDialog, QSpinBox
+
+import cubit_utils
+import abaqus_writer
+import mesh_archive
+import part_scope
+import tire_revolve
+
+
+class ExportDeck(QDialog):
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.resize(480, 120)
+        self.setWindowTitle("Export Abaqus Deck")
+        self.setObjectName("ExportDeck")
+
+        self.gridLayout = QGridLayout(self)
+        self.fileLabel = QLabel(u"Abaqus File:")
+        self.gridLayout.addWidget(self.fileLabel, 0, 0)
+        self.fileLineEdit = QLineEdit()
+        part = part_scope.Active()
+        self.fileLineEdit.setText(os.path.join(os.getcwd(), "tire-1.inp" if part == part_scope.ALL else f"{part}.inp"))
+        self.gridLayout.addWidget(self.fileLineEdit, 0, 1)
+        self.browseButton = QPushButton()
+        self.browseButton.setAutoDefault(False)
+        self.browseButton.setText("...")
+        self.gridLayout.addWidget(self.browseButton, 0, 2)
+        self.browseButton.clicked.connect(self.Browse)
+
+        self.compressCheckBox = QCheckBox("Compress (gzip)")
+        self.gridLayout.addWidget(self.compressCheckBox, 1, 1)
+        self.archiveCheckBox = QCheckBox("Write Mesh Archive (.tmsh)")
+        self.gridLayout.addWidget(self.archiveCheckBox, 1, 2)
+        self.revolveCheckBox = QCheckBox("Write Revolved 3D Deck, Divisions:")
+        self.revolveCheckBox.setToolTip("Writes the mesh archive and revolves the section from it")
+        self.gridLayout.addWidget(self.revolveCheckBox, 2, 1)
+        self.divisionsSpinBox = QSpinBox()
+        self.divisionsSpinBox.setRange(4, 3600)
+        self.divisionsSpinBox.setValue(tire_revolve.DIVISIONS)
+        self.gridLayout.addWidget(self.divisionsSpinBox, 2, 2)
+
+        QBtn = QDialogButtonBox.StandardButton.Ok | QDialogButtonBox.StandardButton.Cancel
+        self.buttonBox = QDialogButtonBox(QBtn)
+        self.buttonBox.button(QDialogButtonBox.StandardButton.Ok).setText("Export")
+        self.buttonBox.accepted.connect(self.Export)
+        self.buttonBox.rejected.connect(self.reject)
+        self.gridLayout.addWidget(self.buttonBox, 3, 1)
+
+        self.setLayout(self.gridLayout)
+        QMetaObject.connectSlotsByName(self)
+    # init -- create GUI
+
+    def Browse(self):
+        path, _ = QFileDialog.getSaveFileName(self, "Abaqus File", self.fileLineEdit.text(),
+                                              "Abaqus input (*.inp *.inp.gz)")
+        if path:
+            self.fileLineEdit.setText(path)
+
+    def Export(self):
+        path = self.fileLineEdit.text().strip()
+        if not path:
+            cubit_utils.ErrorWindow("Enter the name of the Abaqus file.")
+            return
+        compress = self.compressCheckBox.isChecked() or path.endswith(".gz")
+        if compress and not path.endswith(".gz"):
+            path += ".gz"
+        start = time.perf_counter()
+        try:
+            lines = abaqus_writer.AbaqusWriter().Write(path, compress)
+        except Exception as e:
+            cubit_utils.ErrorWindow(f"Unable to write the Abaqus file: {e}")
+            return
+        print(f"Wrote {lines} lines to {path} in {time.perf_counter() - start:.2f}s.")
+        base = os.path.splitext(path[:-3] if path.endswith(".gz") else path)[0]
+        revolve = self.revolveCheckBox.isChecked()
+        if self.archiveCheckBox.isChecked() or revolve:
+            archive_path = base + ".tmsh"
+            try:
+                mesh_archive.ExportArchive(archive_path)
+            except Exception as e:
+                cubit_utils.ErrorWindow(f"Unable to write the mesh archive: {e}")
+                return
+            print(f"Wrote the mesh archive {archive_path}")
+        if revolve:
+            deck_path = base + ("_3d.inp.gz" if compress else "_3d.inp")
+            try:
+                tire_revolve.Revolve(archive_path, deck_path, self.divisionsSpinBox.value(), compress=compress)
+            except Exception as e:
+                cubit_utils.ErrorWindow(f"Unable to write the revolved deck: {e}")
+                return
+            print(f"Wrote the revolved deck {deck_path}")
+        self.accept()
+
+
+def main():
+    # 'claro' must be globally defined or passed to main
+    global claro
+    dlg = ExportDeck(claro)
+    dlg.show()
+
+if __name__ == "__coreformcubit__":
+    claro = cubit_utils.find_claro()
+    main()
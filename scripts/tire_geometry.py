@@ -7,14 +7,18 @@
 """
 import math
 import sys
+import time
 
 from PySide6.QtCore import QMetaObject, Qt
 
 from PySide6.QtGui import QIcon
 from PySide6.QtWidgets import QApplication, QDialog, QGridLayout, QLabel, \
-    QLineEdit, QDialogButtonBox, QMessageBox
+    QLineEdit, QDialogButtonBox, QMessageBox, QCheckBox
 
+import checkpoints
 import cubit_utils
+import part_scope
+import stage_cache
 
 class TireGeometry(QDialog):
     # Create the GUI
@@ -43,6 +47,10 @@ class TireGeometry(QDialog):
         self.mergeTolerance = QLineEdit()
         self.mergeTolerance.setText(".03")
         self.gridLayout.addWidget(self.mergeTolerance, 2, 1)
+        self.useCache = QCheckBox(u"Use stage cache")
+        self.useCache.setToolTip("Restore the surfaces of identical curves and tolerance from the stage cache")
+        self.useCache.setChecked(True)
+        self.gridLayout.addWidget(self.useCache, 3, 0)
 
         # 3. Update Dialog Button Enums
         QBtn = QDialogButtonBox.StandardButton.Ok | QDialogButtonBox.StandardButton.Cancel
@@ -59,10 +67,17 @@ class TireGeometry(QDialog):
         self.all_curves = ()
     # end init -- create GUI
 
+    # The curves read from file. With an active part (part_scope.py) these
+    # are the free curves, the curves of the other parts are in bodies.
+    def InputCurves(self):
+        if part_scope.Active() == part_scope.ALL:
+            return cubit.get_entities("curve")
+        return cubit.parse_cubit_list("curve", "all except curve in body all")
+
     # Get all the curves, and the lengths, then get the curve with the minimum length
     def FindSmallestCurve(self):
         if not self.all_curves:
-            self.all_curves = cubit.get_entities("curve")
+            self.all_curves = self.InputCurves()
         if not self.all_curves:
             cubit_utils.ErrorWindow("Curves must be read from file before creating the geometry")
             return ()
@@ -76,18 +91,30 @@ class TireGeometry(QDialog):
     def CreateTireGeometry(self):
         # curves should previously exist
         if not self.all_curves:
-            self.all_curves = cubit.get_entities("curve")
+            self.all_curves = self.InputCurves()
         if not self.all_curves:
             ErrorWindow("Curves must be read from file before creating the geometry.")
             return
+        # the checkpoints belong to the previous model
+        checkpoints.Invalidate()
+
+        # the cache key must be taken before the bounding surface adds curves
+        start = time.perf_counter()
+        # opening a cached result replaces the session, only the input curves may be in it
+        cache = stage_cache.StageCache() if self.useCache.isChecked() and \
+            stage_cache.OnlyStageInputs(free_curves=self.all_curves) else None
+        curve_inputs = stage_cache.CurveInputs(self.all_curves) if cache else None
+        curve_str = cubit.string_from_id_list(self.all_curves)
 
         cubit.cmd("undo group begin")
         cubit.cmd("graphics off")
     
         # Create the bounding surface (since the z-depth is 0 this is a sheet body).
-        # we know that at this point this is surface 1
-        cubit.cmd(f'create brick bounding box Curve all extended percentage 10')
+        # Without parts this is surface 1
+        cubit.cmd(f'create brick bounding box curve {curve_str} extended percentage 10')
         last_vertex = cubit.get_last_id("vertex")
+        bounding_body = cubit.get_last_id("body")
+        bounding_surface = cubit.get_last_id("surface")
         
         if self.mergeTolerance.text():
             self.merge_tolerance = float(self.mergeTolerance.text())
@@ -100,29 +127,46 @@ class TireGeometry(QDialog):
             cubit.cmd("undo group end")
             return
 
+        if cache and cache.Restore('geometry', (curve_inputs, self.merge_tolerance)):
+            print(cache.Report())
+            cubit.cmd("graphics on")
+            cubit.cmd("undo group end")
+            return
+
         # Do a tolerant imprint to close small gaps in the model
         cubit.cmd(f"merge tolerance {self.merge_tolerance}")
-        cubit.cmd("imprint tolerant surface 1 with curve all except curve in surf 1") 
+        cubit.cmd(f"imprint tolerant surface {bounding_surface} with curve {curve_str} except curve in surf {bounding_surface}") 
         cubit.cmd("merge tolerance 5.000000e-04")
-        cubit.cmd("imprint surface 1 with curve all")
+        cubit.cmd(f"imprint surface {bounding_surface} with curve {curve_str}")
 
         # separate the surfaces into individual bodies
-        surfs = cubit.get_entities("surface")
+        surfs = cubit.parse_cubit_list("surface", f"in body {bounding_body}")
         for surf in surfs:
             cubit.cmd(f'separate surface {surf}')
 
         # clean up
         cubit.cmd(f'delete surface in vertex {last_vertex}') 
-        cubit.cmd('delete curve all') # remove free curves
+        free_curves = cubit.parse_cubit_list("curve", f"{curve_str} except curve in body all")
+        if free_curves:
+            cubit.cmd(f'delete curve {cubit.string_from_id_list(free_curves)}') # remove free curves
+        new_bodies = [b for b in cubit.get_entities("body") if b >= bounding_body]
+        part_scope.Adopt()
     
         # make sure everything is merged and finish
         original_tolerance = cubit.get_merge_tolerance()
         cubit.cmd(f"merge tolerance {self.merge_tolerance}")
-        cubit.cmd("merge all")
+        cubit.cmd(f"merge body {cubit.string_from_id_list(new_bodies)}")
         cubit.cmd(f"merge tolerance {original_tolerance}")
         cubit.cmd("graphics on")
         cubit.cmd("undo group end")
 
+        if cache:
+            try:
+                cache.Store('geometry', (curve_inputs, self.merge_tolerance), time.perf_counter() - start)
+                print(cache.Report())
+            except Exception as e:
+                print("Unable to store the surfaces in the stage cache:", e)
+
 
 
 def main():
@@ -132,7 +176,7 @@ def main():
     min_data = dlg.FindSmallestCurve()
 
     # as a check get the diagonal of the bounding box
-    curves = cubit.get_entities("curve")
+    curves = dlg.all_curves or dlg.InputCurves()
     bbox = cubit.get_total_bounding_box("curve", curves)
     diagonal = bbox[9]
 
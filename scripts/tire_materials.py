@@ -16,6 +16,7 @@ from PySide6.QtWidgets import QLineEdit, QDialogButtonBox, QMessageBox
 
 # Use general cubit_utils
 import cubit_utils
+import part_scope
 
 
 class TireMaterials(QDialog):
@@ -65,7 +66,7 @@ class TireMaterials(QDialog):
 
     # Assign Material names
     def AssignMaterials(self):
-        bodies = cubit.get_entities("body")
+        bodies = part_scope.Bodies()
         bbox = cubit.get_total_bounding_box("body", bodies)
         xmin = bbox[0]
         xmax = bbox[1]
@@ -78,7 +79,7 @@ class TireMaterials(QDialog):
             cubit.cmd(f'block {body} body {body}')
             #cubit.cmd(f'block {body} element type QUAD4')
     
-        all_curves = cubit.get_entities('curve')
+        all_curves = part_scope.Entities('curve')
         origin = [xcenter, ycenter, 0]
         # bodies in the -Y direction
         direction = [0, -1, 0]
@@ -95,14 +96,15 @@ class TireMaterials(QDialog):
             WarningWindow("Unable to get number of plys. Assuming one ply.", parent_widget=self) 
             number_plys = 1
 
-        cubit.cmd(f'block {ordered_bodies[0]} name "tire-1_Set-Rubber-Inner"')
+        name = part_scope.Name
+        cubit.cmd(f'block {ordered_bodies[0]} name "{name("tire-1_Set-Rubber-Inner")}"')
         if number_plys == 1:
-            cubit.cmd(f'block {ordered_bodies[1]} name "tire-1_Set-Rubber-Bodyply"')
+            cubit.cmd(f'block {ordered_bodies[1]} name "{name("tire-1_Set-Rubber-Bodyply")}"')
         else:
             for i in range(number_plys):
-                cubit.cmd(f'block {ordered_bodies[i+1]} name "tire-1_Set-Rubber-Bodyply-{i+1}"')
+                cubit.cmd(f'block {ordered_bodies[i+1]} name "{name(f"tire-1_Set-Rubber-Bodyply-{i+1}")}"')
 
-        cubit.cmd(f'block {ordered_bodies[-1]} name "tire-1_Set-Rubber-Side"')
+        cubit.cmd(f'block {ordered_bodies[-1]} name "{name("tire-1_Set-Rubber-Side")}"')
     
         # bodies in the +X direction
         origin = [0, -1, 0]    # just move a little off the y x axis
@@ -110,8 +112,8 @@ class TireMaterials(QDialog):
         _, curves =  cubit.fire_ray(origin, direction, 'curve', all_curves, 0, .1) 
         ordered_bodies = self.get_bodies_from_curves(curves)
         # the inside body is already assigned a name
-        cubit.cmd(f'block {ordered_bodies[-1]} name "tire-1_Set-Rubber-TRD"')
-        cubit.cmd(f'block {ordered_bodies[-2]} name "tire-1_Set-Rubber-Base"')
+        cubit.cmd(f'block {ordered_bodies[-1]} name "{name("tire-1_Set-Rubber-TRD")}"')
+        cubit.cmd(f'block {ordered_bodies[-2]} name "{name("tire-1_Set-Rubber-Base")}"')
 
         # assign all layers between the inner rubber and the rubber base as belts
         # this may not be right, but it may be easier to edit if there is something
@@ -122,13 +124,13 @@ class TireMaterials(QDialog):
             if 'tire' in block_name:
                 decrement = decrement + 1
             else:
-                cubit.cmd(f'block {body} name "tire-1_Set-Rubber-Belt{counter+1-decrement}"')
+                cubit.cmd(f'block {body} name "{name(f"tire-1_Set-Rubber-Belt{counter+1-decrement}")}"')
     
         # find the tip at the bead
-        bead_tuple = cubit.parse_cubit_list("body", f"in vertex with x_coord < {ceil(xmin)}") 
+        bead_tuple = cubit.parse_cubit_list("body", f"in vertex {part_scope.Within()} with x_coord < {ceil(xmin)}") 
         if len(bead_tuple) == 1:
             bead_tip = bead_tuple[0]
-            cubit.cmd(f'block {bead_tip} name "tire-1_Set-Rubber-RC"')
+            cubit.cmd(f'block {bead_tip} name "{name("tire-1_Set-Rubber-RC")}"')
 
             bead_center = cubit.get_center_point("body", bead_tip)
             origin = [xmin-50, bead_center[1], 0]
@@ -8,15 +8,28 @@
 """
 import math
 import sys
+import time
 
 # Update Imports to PySide6
 from PySide6.QtCore import QMetaObject, Qt
 
 from PySide6.QtGui import QIcon
 from PySide6.QtWidgets import QApplication, QDialog, QGridLayout, QLabel, \
-    QLineEdit, QDialogButtonBox, QPushButton, QMessageBox, QDockWidget
+    QLineEdit, QDialogButtonBox, QPushButton, QMessageBox, QDockWidget, QCheckBox
 
+import checkpoints
+import cubit_tasks
 import cubit_utils
+import mesh_budget
+import mesh_distributed
+import mesh_driver
+import mesh_fingerprint
+import mesh_journal
+import mesh_recombine
+import mesh_sizing
+import mesh_sweep
+import part_scope
+import stage_cache
 
 
 class TireMesh(QDialog):
@@ -44,6 +57,9 @@ class TireMesh(QDialog):
         #  Update Qt.LinksAccessibleByMouse|Qt.TextSelectableByMouse to PySide6 syntax
         self.surfaceAreaData.setTextInteractionFlags(Qt.TextInteractionFlag.LinksAccessibleByMouse | Qt.TextInteractionFlag.TextSelectableByMouse)
         self.gridLayout.addWidget(self.surfaceAreaData, 1, 1)
+        # gather the geometry metrics once, the element count predictions reuse them
+        self.surface_metrics = mesh_budget.GatherSurfaceMetrics(part_scope.Entities("surface"))
+        self.block_sizes = {}
         self.surface_area = self.SurfaceArea()
         self.surfaceAreaData.setText("%.3f" % self.surface_area)
 
@@ -52,8 +68,9 @@ class TireMesh(QDialog):
         self.meshSize = QLineEdit()
         self.gridLayout.addWidget(self.meshSize, 2, 1)
         self.meshSize.editingFinished.connect(self.CalculateElementBudget)
+        self.meshSize.textEdited.connect(self.ClearBlockSizes)
 
-        surfaces = cubit.get_entities("surface")
+        surfaces = part_scope.Entities("surface")
         mesh_size = cubit.get_mesh_size("surface", surfaces[0])
         self.meshSize.setText("%.2f" % mesh_size)
 
@@ -63,6 +80,46 @@ class TireMesh(QDialog):
         # Update Qt.LinksAccessibleByMouse|Qt.TextSelectableByMouse to PySide6 syntax
         self.elementBudgetData.setTextInteractionFlags(Qt.TextInteractionFlag.LinksAccessibleByMouse | Qt.TextInteractionFlag.TextSelectableByMouse)
         self.gridLayout.addWidget(self.elementBudgetData, 3, 1)
+
+        self.targetBudgetLabel = QLabel(u"Target element count:")
+        self.gridLayout.addWidget(self.targetBudgetLabel, 4, 0)
+        self.targetBudget = QLineEdit()
+        self.gridLayout.addWidget(self.targetBudget, 4, 1)
+        self.solveSize = QPushButton()
+        self.solveSize.setAutoDefault(False)
+        self.solveSize.setText("Solve Size")
+        self.gridLayout.addWidget(self.solveSize, 4, 2)
+        self.solveSize.clicked.connect(self.SolveMeshSize)
+        self.perBlockSizes = QCheckBox(u"Per-block sizes")
+        self.gridLayout.addWidget(self.perBlockSizes, 5, 1)
+        self.distributed = QCheckBox(u"Distributed meshing")
+        self.distributed.setToolTip("Mesh groups of surfaces in parallel worker processes")
+        self.gridLayout.addWidget(self.distributed, 5, 2)
+        self.changedOnly = QCheckBox(u"Remesh changed surfaces only")
+        self.changedOnly.setChecked(True)
+        self.gridLayout.addWidget(self.changedOnly, 6, 1)
+        self.sizeSweep = QPushButton()
+        self.sizeSweep.setAutoDefault(False)
+        self.sizeSweep.setText("Size Sweep...")
+        self.gridLayout.addWidget(self.sizeSweep, 6, 2)
+        self.sizeSweep.clicked.connect(self.ShowSizeSweep)
+
+        self.minSizeLabel = QLabel("Minimum Size")
+        self.gridLayout.addWidget(self.minSizeLabel, 7, 0)
+        self.minSize = QLineEdit()
+        self.gridLayout.addWidget(self.minSize, 7, 1)
+        self.adaptiveSizing = QCheckBox(u"Adaptive sizes")
+        self.adaptiveSizing.setToolTip("Refine curves by curvature and surfaces by thickness down to the minimum size")
+        self.gridLayout.addWidget(self.adaptiveSizing, 7, 2)
+        self.compareUniform = QCheckBox(u"Compare with uniform size")
+        self.gridLayout.addWidget(self.compareUniform, 8, 1)
+        self.recombine = QCheckBox(u"Recombine triangles")
+        self.recombine.setToolTip("Recombine triangle pairs and triangle-quad-triangle chains into quads after meshing")
+        self.gridLayout.addWidget(self.recombine, 8, 2)
+        self.useCache = QCheckBox(u"Use stage cache")
+        self.useCache.setToolTip("Restore the mesh of identical inputs from the stage cache instead of meshing")
+        self.useCache.setChecked(True)
+        self.gridLayout.addWidget(self.useCache, 8, 0)
         cubit.set_pick_type('Surface')
 
         self.CalculateElementBudget()
@@ -80,7 +137,7 @@ class TireMesh(QDialog):
         self.buttonBox.rejected.connect(self.reject)
         self.buttonBox.button(QDialogButtonBox.StandardButton.Apply).clicked.connect(self.CalculateElementBudget)
 
-        self.gridLayout.addWidget(self.buttonBox, 4, 1)
+        self.gridLayout.addWidget(self.buttonBox, 9, 1)
 
         self.setLayout(self.gridLayout)
         QMetaObject.connectSlotsByName(self)
@@ -101,11 +158,7 @@ class TireMesh(QDialog):
 
     # calculate the total surface area
     def SurfaceArea(self):
-        surfaces = cubit.get_entities("surface")
-        area = 0.0
-        for surf in surfaces:
-            area += cubit.get_surface_area(surf)
-        return area
+        return sum(m.area for m in self.surface_metrics.values())
 
     # Check to see if the selected mapped surfaces are really mappable
     def CheckMappedSurfaces(self):
@@ -285,33 +338,112 @@ class TireMesh(QDialog):
                 print("Exception in FindShortSide", e)
 
 
-    # Approximate the number of elements by taking the surface area / average element area
+    # Get the mesh size from the GUI, None if it is not a positive number
+    def GetMeshSize(self):
+        try:
+            mesh_size = float(self.meshSize.text())
+            assert(mesh_size > 0.0)
+        except Exception:
+            return None
+        return mesh_size
+
+    # The mesh size of each surface. Surfaces in blocks with a solved
+    # block size use that size, all others use the size in the GUI.
+    def SurfaceSizes(self, mesh_size):
+        sizes = {s: mesh_size for s in self.surface_metrics}
+        if self.block_sizes:
+            block_surfaces = mesh_budget.BlockSurfaces()
+            for block, size in self.block_sizes.items():
+                for surf in block_surfaces.get(block, []):
+                    sizes[surf] = size
+        return sizes
+
+    # The solved block sizes no longer apply once the user types a new size
+    def ClearBlockSizes(self):
+        self.block_sizes = {}
+
+    # Predict the number of quads and tris from the cached geometry metrics
     def CalculateElementBudget(self):
-        if not self.meshSize.text():
+        mesh_size = self.GetMeshSize()
+        if mesh_size is None:
             # Assuming cubit_utils.ErrorWindow is updated to PySide6
-            cubit_utils.ErrorWindow("Mesh Size must be set.")
+            cubit_utils.ErrorWindow("Mesh Size must be set to a positive value.")
             return
-        element_budget = 0
-        if self.meshSize.text():
-            mesh_size = float(self.meshSize.text())
-            element_budget = self.surface_area/(mesh_size * mesh_size)
-        self.elementBudgetData.setText("%i" % element_budget)
 
         # also on apply gather surfaces in blocks that require rebar
-        belt_surfaces = cubit.parse_cubit_list('surface', 'in volume in block with name "*Belt*" except surf in volume in block with name "*filler*"')
-        ply_surfaces = cubit.parse_cubit_list('surface', 'in volume in block with name "*Bodyply*"')
-        chafer_surfaces = cubit.parse_cubit_list('surface', 'in volume in block with name "*Chafer*"')
+        name = part_scope.Name
+        belt_surfaces = cubit.parse_cubit_list('surface', f'in volume in block with name "{name("*Belt*")}" except surf in volume in block with name "{name("*filler*")}"')
+        ply_surfaces = cubit.parse_cubit_list('surface', f'in volume in block with name "{name("*Bodyply*")}"')
+        chafer_surfaces = cubit.parse_cubit_list('surface', f'in volume in block with name "{name("*Chafer*")}"')
         # Duplicate line in original, keeping the second one
-        chafer_surfaces = cubit.parse_cubit_list('surface', 'in volume in block with name "*Chafer*"') 
-        cap_surfaces = cubit.parse_cubit_list('surface', 'in volume in block with name "*Set-Rubber-Cap*"')
+        chafer_surfaces = cubit.parse_cubit_list('surface', f'in volume in block with name "{name("*Chafer*")}"') 
+        cap_surfaces = cubit.parse_cubit_list('surface', f'in volume in block with name "{name("*Set-Rubber-Cap*")}"')
         map_surfaces = cubit.string_from_id_list(belt_surfaces + ply_surfaces + chafer_surfaces + cap_surfaces)
         self.surfaceMappedLineEdit.setText(map_surfaces.strip())
-        
+
+        _, quads, tris = mesh_budget.PredictElementCount(self.surface_metrics, self.SurfaceSizes(mesh_size),
+                                                         self.GetMappedLineEdit())
+        self.elementBudgetData.setText("%i (%i quads, %i tris)" % (quads + tris, quads, tris))
+
+    # Solve for the mesh size, or the size in each block, that meets the
+    # target element count without meshing.
+    def SolveMeshSize(self):
+        try:
+            budget = int(self.targetBudget.text())
+            assert(budget > 0)
+        except Exception:
+            cubit_utils.ErrorWindow("The target element count must be a positive integer.")
+            return
+
+        mapped_surfaces = self.GetMappedLineEdit()
+        if self.perBlockSizes.isChecked():
+            # keep the ratio of the current (automatic) sizes in each block
+            block_surfaces = mesh_budget.BlockSurfaces()
+            base_sizes = {}
+            for block, surfaces in block_surfaces.items():
+                sizes = [cubit.get_mesh_size("surface", s) for s in surfaces]
+                base_sizes[block] = sum(sizes) / len(sizes)
+            if not base_sizes:
+                cubit_utils.ErrorWindow("Blocks must be defined to solve for per-block sizes.")
+                return
+            self.block_sizes = mesh_budget.SolveBlockSizesForBudget(self.surface_metrics, block_surfaces,
+                                                                    base_sizes, budget, mapped_surfaces)
+            for block, size in sorted(self.block_sizes.items()):
+                print(f"Block {block} {cubit.get_block_name(block)}: size {size:.4g}")
+            mesh_size = max(self.block_sizes.values())
+        else:
+            self.block_sizes = {}
+            mesh_size = mesh_budget.SolveSizeForBudget(self.surface_metrics, budget, mapped_surfaces)
+
+        self.meshSize.setText("%.4g" % mesh_size)
+        self.CalculateElementBudget()
+
+    # Open the mesh size sweep, it runs in worker processes
+    def ShowSizeSweep(self):
+        self.sweep_dialog = mesh_sweep.MeshSweep(self, self)
+        self.sweep_dialog.show()
+
+    # Set all surfaces to scheme tripave and then overwrite the mapped
+    # surfaces. Returns False if the mapped surfaces could not be set.
+    def SetMeshSchemes(self):
+        try:
+            cubit.cmd(f'{part_scope.Scope("surface")} except surface with has_scheme "pave" scheme tripave')
+        except Exception as e:
+            print("Failed setting mesh scheme as tripave:", e)
+
+        # set up the mapped surfaces
+        try:
+            self.SetMappableSurfaces()
+        except Exception as e:
+            print("Failed setting map scheme:", e)
+            return False
+        return True
+
     # Main algorithm for meshing
     def MeshTireSurfaces(self):
         cubit.cmd("undo group begin")
         
-        surfaces = cubit.get_entities("surface")
+        surfaces = part_scope.Entities("surface")
         if not surfaces:
             # Assuming cubit_utils.ErrorWindow is updated to PySide6
             cubit_utils.ErrorWindow("Surfaces must exist prior to meshing.")
@@ -323,36 +455,45 @@ class TireMesh(QDialog):
             print("Failed getting mesh state:", e)
             cubit.cmd("undo group end")
             return
+        if not meshed:
+            checkpoints.Save('mesh')
 
-        if meshed:
+        # when only remeshing changed surfaces the existing mesh is kept
+        incremental = self.changedOnly.isChecked()
+        if meshed and not incremental:
             # 4. Access QMessageBox.Yes using the PySide6 Enum syntax
             result = cubit_utils.QuestionWindow("Surfaces are already meshed. Delete the existing mesh?")
             if result == QMessageBox.StandardButton.Yes:
-                cubit.cmd('delete mesh')
+                part_scope.DeleteMesh()
+                mesh_fingerprint.Reset()
             else:
                 cubit.cmd("undo group end")
                 return
 
-        # set all surfaces to scheme tripave and then overwrite the mapped surfaces
-        try:
-            cubit.cmd('surface all except surface with has_scheme "pave" scheme tripave')
-        except Exception as e:
-            print("Failed setting mesh scheme as tripave:", e)
-
-        # set up the mapped surfaces
-        try:
-            self.SetMappableSurfaces()
-        except Exception as e:
-            print("Failed setting map scheme:", e)
+        if not self.SetMeshSchemes():
             cubit.cmd("undo group end")
             return
 
         mesh_size = self.meshSize.text()
         try:
-            cubit.cmd(f'surface all size {mesh_size}')
+            cubit.cmd(f'{part_scope.Scope("surface")} size {mesh_size}')
+            block_surfaces = mesh_budget.BlockSurfaces()
+            for block, size in self.block_sizes.items():
+                if block_surfaces.get(block):
+                    cubit.cmd(f'surface {cubit.string_from_id_list(block_surfaces[block])} size {size}')
         except Exception as e:
             print("Failed setting mesh size:", e)
 
+        # refine by curvature and thickness, the baseline is only meshed when it is compared
+        sizing_engine = None
+        if self.adaptiveSizing.isChecked():
+            sizing_engine = self.ApplyAdaptiveSizing(surfaces)
+            if sizing_engine is None:
+                cubit.cmd("undo group end")
+                return
+        else:
+            mesh_sizing.ResetAdaptiveSizes(mesh_size)
+
         # Set the default element type for Abaqus
         try:
             cubit.cmd('create solver_element "abaqus" "CGAX4H" from "QUAD4"')
@@ -364,12 +505,147 @@ class TireMesh(QDialog):
             cubit.cmd('create solver_element "abaqus" "SFMGAX1" from "BAR"')
         except Exception as e:
             print("Failed setting solver_element:", e)
+
+        # the fingerprints must be taken after the schemes, sizes and intervals are set
+        if incremental:
+            changed_surfaces, fingerprints = mesh_fingerprint.ChangedSurfaces(surfaces)
+        else:
+            changed_surfaces, fingerprints = surfaces, mesh_fingerprint.ComputeFingerprints(surfaces)[:2]
+
+        if not changed_surfaces:
+            print("No surfaces changed since the last mesh. Nothing to remesh.")
+            cubit.cmd("undo group end")
+            return
+
+        # a full mesh of identical inputs is restored from the stage cache,
+        # opening the cached model replaces the session, so it may only hold
+        # the bodies and blocks of the mesh inputs
+        cache, cache_inputs = None, None
+        if self.useCache.isChecked() and set(changed_surfaces) == set(surfaces) and \
+                stage_cache.OnlyStageInputs(part_scope.Bodies(), with_blocks=True):
+            cache = stage_cache.StageCache()
+            cache_inputs = (stage_cache.ModelInputs(fingerprints), self.recombine.isChecked())
+            if cache.Restore('mesh', cache_inputs):
+                mesh_fingerprint.RecordMeshed(fingerprints)
+                mesh_journal.Clear()
+                print(cache.Report())
+                cubit.cmd("undo group end")
+                return
+        mesh_start = time.perf_counter()
+
+        changed_str = cubit.string_from_id_list(changed_surfaces)
+        try:
+            if meshed and incremental:
+                cubit.cmd(f"delete mesh surface {changed_str} propagate")
+        except Exception as e:
+            print("Unable to delete the mesh:", e)
+
+        baseline = None
+        if sizing_engine and self.compareUniform.isChecked():
+            baseline = sizing_engine.MeshUniformBaseline(changed_surfaces)
+
+        # mesh groups of surfaces in worker processes, the driver handles any surface they missed
+        driver_surfaces = changed_surfaces
+        if self.distributed.isChecked():
+            mesher = mesh_distributed.DistributedMesher(changed_surfaces)
+            try:
+                driver_surfaces = mesher.Run()
+                print(mesher.Report())
+                if mesher.non_conformal:
+                    cubit_utils.WarningWindow(f"{len(mesher.non_conformal)} non-conformal element sides "
+                                              "found after distributed meshing. See the command window.")
+            except Exception as e:
+                print("Distributed meshing failed, meshing serially:", e)
+
+        # mesh surface by surface so that failures can be retried individually.
+        # The surfaces are meshed in time slices with a progress dialog, the
+        # undo group is closed when the queue finishes or is cancelled.
+        driver = mesh_driver.MeshDriver(driver_surfaces)
         try:
-            cubit.cmd("mesh surface all")
+            steps = driver.Steps()
         except Exception as e:
             print("Unable to mesh surfaces:", e)
+            mesh_journal.Clear()
+            cubit.cmd("undo group end")
+            return
+        finish = lambda: self.FinishMesh(driver, surfaces, changed_surfaces, fingerprints, sizing_engine,
+                                         baseline, cache, cache_inputs, mesh_start)
+        # the journaled collapses refer to the deleted mesh, the journal is
+        # cleared when the queue closes, also after a cancel or a failed step
+        queue = cubit_tasks.CommandQueue(steps + [finish], undo_group=False,
+                                         end=[mesh_journal.Clear, "undo group end"])
+        self.runner = cubit_tasks.ProgressRunner(self.parent(), "Meshing surfaces")
+        self.runner.Execute(queue)
+
+    # Report the meshing, recombine the triangles and store the mesh in the
+    # stage cache. The last step of the meshing queue.
+    def FinishMesh(self, driver, surfaces, changed_surfaces, fingerprints, sizing_engine,
+                   baseline, cache, cache_inputs, mesh_start):
+        print(driver.Report())
+        problems = driver.Problems()
+        if problems:
+            cubit_utils.WarningWindow("Surfaces that failed or have poor quality:\n" +
+                                      "\n".join(f"surface {r.surface}: {r.status}" for r in problems))
+
+        # fewer CGAX3H elements, the surfaces that did not mesh are skipped
+        if self.recombine.isChecked():
+            try:
+                print(mesh_recombine.Recombine([s for s in changed_surfaces if cubit.is_meshed("surface", s)]))
+            except Exception as e:
+                print("Unable to recombine triangles:", e)
+
+        # the fallback schemes and sizes changed the fingerprints of the recovered surfaces
+        recovered = [r.surface for r in driver.results.values() if r.status != 'meshed']
+        if recovered:
+            fingerprints = mesh_fingerprint.ComputeFingerprints(surfaces)[:2]
+        mesh_fingerprint.RecordMeshed(fingerprints)
+        self.ReportSkippedWork(surfaces, changed_surfaces)
+        if sizing_engine:
+            predicted = sizing_engine.PredictedCounts(self.GetMappedLineEdit())
+            print(mesh_sizing.Report(sizing_engine, predicted, baseline,
+                                     mesh_sizing.MeshStatistics(changed_surfaces)))
+        if cache and not problems:
+            try:
+                cache.Store('mesh', cache_inputs, time.perf_counter() - mesh_start)
+                print(cache.Report())
+            except Exception as e:
+                print("Unable to store the mesh in the stage cache:", e)
 
-        cubit.cmd("undo group end")
+    # Set curve and surface sizes from the curvature and the thickness.
+    # Returns the sizing engine or None on error.
+    def ApplyAdaptiveSizing(self, surfaces):
+        mesh_size = self.GetMeshSize()
+        try:
+            min_size = float(self.minSize.text())
+            assert(min_size > 0.0)
+        except Exception:
+            cubit_utils.ErrorWindow("The minimum size must be set to a positive value for adaptive sizes.")
+            return None
+        if mesh_size is None:
+            cubit_utils.ErrorWindow("Mesh Size must be set to a positive value.")
+            return None
+
+        sizing_engine = mesh_sizing.SizingEngine(surfaces, mesh_size, min_size)
+        try:
+            sizing_engine.Compute()
+            sizing_engine.Apply()
+        except Exception as e:
+            print("Failed setting adaptive sizes:", e)
+            return None
+        return sizing_engine
+
+    # Report how many surfaces (and elements) were reused from the previous mesh
+    def ReportSkippedWork(self, surfaces, changed_surfaces):
+        reused_surfaces = sorted(set(surfaces) - set(changed_surfaces))
+        if not reused_surfaces:
+            return
+        reused_elements = mesh_fingerprint.SurfaceElementCount(reused_surfaces)
+        remeshed_elements = mesh_fingerprint.SurfaceElementCount(changed_surfaces)
+        total = reused_elements + remeshed_elements
+        print(f"Remeshed {len(changed_surfaces)} of {len(surfaces)} surfaces. "
+              f"Reused {reused_elements} of {total} elements "
+              f"({100.0 * reused_elements / max(total, 1):.0f}%) from the previous mesh.")
+        print(f"    Remeshed surfaces: {cubit.string_from_id_list(changed_surfaces).strip()}")
 
 
 def main():
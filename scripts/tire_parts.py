@@ -0,0 +1,106 @@
+#!python
+"""
+    Define and activate the parts of the session (see part_scope.py). Each
+    tire cross section is a part, while a part is active the toolbar only
+    works on its bodies, blocks and sets. A new part is created from the
+    selected bodies, or from the bodies that are not in a part yet. To
+    create the geometry of a new part activate the empty part before
+    Create Tire Surfaces, the new bodies are added to it.
+"""
+from PySide6.QtCore import QMetaObject
+from PySide6.QtWidgets import QDialog, QGridLayout, QLabel, QLineEdit, QDialogButtonBox, \
+    QPushButton, QComboBox
+
+import cubit_utils
+import part_scope
+
+
+class TireParts(QDialog):
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.resize(360, 160)
+        self.setWindowTitle("Tire Parts")
+        self.setObjectName("TireParts")
+
+        self.gridLayout = QGridLayout(self)
+        self.activeLabel = QLabel(u"Active Part:")
+        self.gridLayout.addWidget(self.activeLabel, 0, 0)
+        self.partComboBox = QComboBox()
+        self.gridLayout.addWidget(self.partComboBox, 0, 1)
+        self.activateButton = QPushButton()
+        self.activateButton.setAutoDefault(False)
+        self.activateButton.setText("Activate")
+        self.gridLayout.addWidget(self.activateButton, 0, 2)
+        self.activateButton.clicked.connect(self.Activate)
+
+        self.nameLabel = QLabel(u"New Part:")
+        self.gridLayout.addWidget(self.nameLabel, 1, 0)
+        self.nameLineEdit = QLineEdit()
+        self.nameLineEdit.setToolTip("Letters and digits, the name prefixes the block and set names")
+        self.gridLayout.addWidget(self.nameLineEdit, 1, 1)
+        self.defineButton = QPushButton()
+        self.defineButton.setAutoDefault(False)
+        self.defineButton.setText("Add Selected Bodies")
+        self.defineButton.setToolTip("Without a selection the bodies that are not in a part are added")
+        self.gridLayout.addWidget(self.defineButton, 1, 2)
+        self.defineButton.clicked.connect(self.DefinePart)
+
+        self.partsLabel = QLabel()
+        self.gridLayout.addWidget(self.partsLabel, 2, 0, 1, 3)
+
+        QBtn = QDialogButtonBox.StandardButton.Close
+        self.buttonBox = QDialogButtonBox(QBtn)
+        self.buttonBox.rejected.connect(self.reject)
+        self.gridLayout.addWidget(self.buttonBox, 3, 2)
+
+        self.setLayout(self.gridLayout)
+        QMetaObject.connectSlotsByName(self)
+        cubit.set_pick_type("Body")
+        self.UpdateParts()
+    # init -- create GUI
+
+    def UpdateParts(self):
+        parts = part_scope.Parts()
+        self.partComboBox.clear()
+        self.partComboBox.addItems([part_scope.ALL] + parts)
+        self.partComboBox.setCurrentText(part_scope.Active())
+        lines = [f"{part}: {len(part_scope.PartBodies(part))} bodies" for part in parts]
+        unassigned = part_scope.UnassignedBodies()
+        if unassigned:
+            lines.append(f"not in a part: {len(unassigned)} bodies")
+        self.partsLabel.setText("\n".join(lines) or "No parts, the toolbar works on the whole session.")
+
+    def Activate(self):
+        try:
+            part_scope.Activate(self.partComboBox.currentText())
+        except ValueError as e:
+            cubit_utils.ErrorWindow(str(e))
+        self.UpdateParts()
+
+    # Create the part from the selected bodies or the bodies that are not in a part
+    def DefinePart(self):
+        name = self.nameLineEdit.text().strip()
+        bodies = cubit.get_selected_ids() or part_scope.UnassignedBodies()
+        try:
+            part_scope.Define(name, bodies)
+        except ValueError as e:
+            cubit_utils.ErrorWindow(str(e))
+            return
+        except Exception as e:
+            cubit_utils.ErrorWindow(f"Unable to create the part {name}: {e}")
+            return
+        print(f"Part {name}: {len(part_scope.PartBodies(name))} bodies")
+        self.nameLineEdit.clear()
+        self.UpdateParts()
+        self.partComboBox.setCurrentText(name)
+
+
+def main():
+    # 'claro' must be globally defined or passed to main
+    global claro
+    dlg = TireParts(claro)
+    dlg.show()
+
+if __name__ == "__coreformcubit__":
+    claro = cubit_utils.find_claro()
+    main()
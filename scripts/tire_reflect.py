@@ -4,7 +4,14 @@ from math import fabs, floor, log10
     Reflect the model about the XZ plane. Make sure that blocks get renamed
     as left and right (top/bottom in our orientation). Also, work around an 
     issue in Cubit so that the blocks output the correct element topology.
+    When the surfaces are meshed the mesh can be mirrored directly, see
+    mesh_reflect.py.
 """
+from PySide6.QtWidgets import QMessageBox
+
+import cubit_utils
+import mesh_reflect
+import part_scope
 
 # There is a deficiency in Cubit where blocks containing bodies are
 # always interpreted as 3D entities. Move the surfaces into the blocks
@@ -12,7 +19,7 @@ from math import fabs, floor, log10
 # TODO: could this be a source of a bug? What happens when we undo this?
 # Do we undo the body to surface conversion? Need to fix Cubit.
 def ResolveSheetBodyBlocks():
-    bodies = cubit.get_entities('body')
+    bodies = part_scope.Bodies()
     # blocks were created body ids. So body id == block id
     for body in bodies:
         if cubit.parse_cubit_list('volume', f'in block {body}'):
@@ -29,14 +36,8 @@ def ReflectAboutY():
 
     # AutoCAD doesn't create symmetry vertices at y == 0. Find
     # difference so that we can set a merge tolerance.
-    # First, find the vertices near the symmetry plane
-    vertices = cubit.get_entities("vertex")
-    bbox = cubit.get_total_bounding_box("vertex", vertices)
-    y_max = bbox[4]
-    # Second, find the curvein the vertices at the symmetry plane
-    curves = cubit.parse_cubit_list("curve", f"with y_coord > {-2.0*y_max} and y_coord < {2.0*y_max}")
-    # Third, get the bounding box of the vertices in the curves at the symmetry plane
-    vertices = cubit.parse_cubit_list("vertex", f"in curve {cubit.string_from_id_list(curves)}")
+    # First, find the vertices in the curves at the symmetry plane
+    vertices = mesh_reflect.SymmetryVertices()
     print(vertices)
     bbox = cubit.get_total_bounding_box("vertex", vertices)
     # Finally, caluclate the merge tolerance
@@ -49,14 +50,13 @@ def ReflectAboutY():
     # .0073 goes to .01, .0001 goes to .001, etc.  
     print(f"y_min: {y_min}")
     old_merge = cubit.get_merge_tolerance()
-    if y_min > 0.0: 
-        exponent = math.floor(math.log10(y_min * 2.0))  # Get the exponent of the range
-        merge_tolerance = 10 ** (exponent + 1)  # Calculate the ceiling
-        if merge_tolerance > old_merge:
-            cubit.cmd(f"merge tolerance {merge_tolerance}")
+    merge_tolerance = mesh_reflect.MergeTolerance(y_min)
+    if merge_tolerance > old_merge:
+        cubit.cmd(f"merge tolerance {merge_tolerance}")
 
     # do the reflection
-    cubit.cmd("surface all copy reflect y ")
+    cubit.cmd(f"{part_scope.Scope('surface')} copy reflect y ")
+    part_scope.Adopt()
 
     # reset the copy back to the original state
     cubit.cmd("set copy_block_on_geometry_copy OFF")
@@ -64,14 +64,43 @@ def ReflectAboutY():
     cubit.cmd("set copy_sideset_on_geometry_copy OFF")
 
     # this is a really odd hack due to a graphics issue
-    cubit.cmd("merge all")
+    merge = f"merge {part_scope.Scope('body')}"
+    cubit.cmd(merge)
     cubit.cmd("undo")
-    cubit.cmd("merge all")
+    cubit.cmd(merge)
     cubit.cmd(f"merge tolerance {old_merge}")
 
 
+# A meshed half section can be mirrored at the mesh level instead. The
+# mirrored elements have no surfaces for Create Rebar, so the rebar must
+# exist before the mesh is mirrored.
+def MirrorMeshMode():
+    surfaces = part_scope.Entities("surface")
+    if not any(cubit.is_meshed("surface", s) for s in surfaces):
+        return False
+    if not mesh_reflect.RebarBlocks():
+        cubit_utils.WarningWindow("The surfaces are meshed but there are no rebar blocks.\n"
+                                  "Create the rebar before mirroring the mesh, the geometry is reflected instead.")
+        return False
+    result = cubit_utils.QuestionWindow("The surfaces are meshed. Mirror the mesh instead of copying the geometry?")
+    return result == QMessageBox.StandardButton.Yes
+
+
 def main():
     ResolveSheetBodyBlocks()
+    if MirrorMeshMode():
+        mirror = mesh_reflect.MeshMirror()
+        cubit.cmd("undo group begin")
+        try:
+            mirror.Run()
+        except Exception as e:
+            cubit.cmd("undo group end")
+            cubit_utils.ErrorWindow(f"Unable to mirror the mesh, the mirrored elements were removed: {e}")
+            return
+        cubit.cmd("undo group end")
+        if mirror.error_blocks:
+            cubit_utils.WarningWindow(f"Unable to renumber the following blocks: {cubit.string_from_id_list(mirror.error_blocks)}")
+        return
     ReflectAboutY()
 
 if __name__ == "__coreformcubit__":
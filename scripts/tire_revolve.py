@@ -0,0 +1,208 @@
+#!python
+"""
+    3D tire mesh revolved from the meshed axisymmetric section. The section
+    is read from a mesh archive (mesh_archive.py), so the generator runs
+    without Cubit:
+        python tire_revolve.py section.tmsh tire3d.inp.gz [divisions]
+    or from the Export Abaqus Deck dialog.
+
+    The section lies in the x-y plane with the radius along x and the axis
+    of the tire along y. A section point (r, y) at the angle t becomes
+    (r cos t, y, r sin t). The angles of the section copies are not uniform:
+    FOOTPRINT_ANGLE degrees around FOOTPRINT_CENTER (the footprint, -90 is
+    the bottom of the tire in -z) get the fine spacing, the rest of the
+    revolution is SPACING_RATIO times coarser with a linear transition of
+    half the footprint angle on both sides.
+
+    Every segment between two copies turns
+      CGAX4H quads into C3D8H hexahedra,
+      CGAX3H triangles into C3D6H wedges,
+      SFMGAX1 rebar bars into SFM3D4R surface elements for the rebar layers.
+    The node and element ids of copy k are the section ids plus k times the
+    largest section id. The blocks, nodesets and sidesets become ELSETs,
+    NSETs and element based SURFACEs of the revolved mesh, a section side
+    Sj becomes the face S(j+2) of the hexahedron or wedge.
+
+    The deck is written one copy at a time in chunks (abaqus_deck.py), the
+    memory use depends on the section and not on the number of divisions.
+    The rebar layer definitions (*REBAR LAYER, *EMBEDDED ELEMENT) are left
+    to the solver model.
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+import abaqus_deck
+import mesh_archive
+
+ELEMENT_TYPES = {4: "C3D8H", 3: "C3D6H", 2: "SFM3D4R"}
+DIVISIONS = 120
+FOOTPRINT_ANGLE = 30.0
+FOOTPRINT_CENTER = -90.0
+SPACING_RATIO = 4.0
+
+
+# Angles (radians) of the section copies for a full revolution. The copies
+# are placed at equal steps of the integrated density, the density is the
+# inverse of the spacing.
+def Angles(divisions=DIVISIONS, footprint_angle=FOOTPRINT_ANGLE, center=FOOTPRINT_CENTER, ratio=SPACING_RATIO):
+    samples = max(64 * divisions, 36000)
+    # measured from the top of the tire so the footprint is in the middle
+    start = np.radians(center) - np.pi
+    t = np.linspace(0.0, 2.0 * np.pi, samples + 1)
+    distance = np.abs(t - np.pi)
+    half = np.radians(footprint_angle) / 2.0
+    transition = max(half, 1e-9)
+    spacing = 1.0 + (ratio - 1.0) * np.clip((distance - half) / transition, 0.0, 1.0)
+    density = 1.0 / spacing
+    cumulative = np.concatenate([[0.0], np.cumsum((density[1:] + density[:-1]) / 2.0 * np.diff(t))])
+    steps = np.linspace(0.0, cumulative[-1], divisions + 1)[:-1]
+    return start + np.interp(steps, cumulative, t)
+
+
+class Revolver(abaqus_deck.DeckWriter):
+    def __init__(self, archive, angles):
+        super().__init__()
+        self.archive = archive
+        self.angles = np.asarray(angles, dtype=float)
+        self.copies = len(self.angles)
+        self.node_ids = archive["node_ids"]
+        self.coords = np.asarray(archive["coords"])
+        self.node_offset = int(self.node_ids.max())
+        element_ids = [archive["face_ids"], archive["bar_ids"]] if "bar_ids" in archive else [archive["face_ids"]]
+        self.element_offset = int(max(ids.max() for ids in element_ids if len(ids)))
+        self.OrientFaces()
+
+    # Section faces ordered counterclockwise in the x-y plane, so the
+    # revolved elements have a positive volume. flipped marks the reordered faces.
+    def OrientFaces(self):
+        types = np.asarray(self.archive["face_types"])
+        nodes = np.array(self.archive["face_nodes"], dtype=np.int64)
+        xy = self.coords[np.searchsorted(self.node_ids, np.where(nodes >= 0, nodes, self.node_ids[0])), :2]
+        area = np.zeros(len(nodes))
+        for elem_type in (4, 3):
+            rows = types == elem_type
+            p = xy[rows, :elem_type]
+            q = np.roll(p, -1, axis=1)
+            area[rows] = (p[:, :, 0] * q[:, :, 1] - q[:, :, 0] * p[:, :, 1]).sum(axis=1)
+        self.flipped = area < 0.0
+        quads = self.flipped & (types == 4)
+        tris = self.flipped & (types == 3)
+        nodes[quads] = nodes[quads][:, [0, 3, 2, 1]]
+        nodes[tris, :3] = nodes[tris][:, [0, 2, 1]]
+        self.face_types = types
+        self.face_nodes = nodes
+
+    def CopyIds(self, ids, copy, offset):
+        return ids + (copy % self.copies) * offset
+
+    def WriteNodes(self, deck):
+        deck.write("*NODE\n")
+        r = self.coords[:, 0]
+        y = self.coords[:, 1]
+        for copy, angle in enumerate(self.angles):
+            rows = np.column_stack([self.CopyIds(self.node_ids, copy, self.node_offset).astype(float),
+                                    r * np.cos(angle), y, r * np.sin(angle)])
+            self.WriteRows(deck, "%d, %.15g, %.15g, %.15g\n", rows)
+
+    # Elements of every segment, the last segment closes the revolution
+    def WriteElements(self, deck):
+        face_ids = np.asarray(self.archive["face_ids"])
+        for elem_type in (4, 3):
+            rows = np.nonzero(self.face_types == elem_type)[0]
+            if not len(rows):
+                continue
+            deck.write(f"*ELEMENT, TYPE={ELEMENT_TYPES[elem_type]}\n")
+            nodes = self.face_nodes[rows, :elem_type]
+            fmt = ", ".join(["%d"] * (2 * elem_type + 1)) + "\n"
+            for copy in range(self.copies):
+                table = np.column_stack([self.CopyIds(face_ids[rows], copy, self.element_offset),
+                                         self.CopyIds(nodes, copy, self.node_offset),
+                                         self.CopyIds(nodes, copy + 1, self.node_offset)])
+                self.WriteRows(deck, fmt, table)
+        if "bar_ids" in self.archive and len(self.archive["bar_ids"]):
+            deck.write(f"*ELEMENT, TYPE={ELEMENT_TYPES[2]}\n")
+            bar_ids = np.asarray(self.archive["bar_ids"])
+            bar_nodes = np.asarray(self.archive["bar_nodes"])
+            for copy in range(self.copies):
+                table = np.column_stack([self.CopyIds(bar_ids, copy, self.element_offset),
+                                         self.CopyIds(bar_nodes, copy, self.node_offset),
+                                         self.CopyIds(bar_nodes[:, ::-1], copy + 1, self.node_offset)])
+                self.WriteRows(deck, "%d, %d, %d, %d, %d\n", table)
+
+    def ElementShifts(self):
+        return np.arange(self.copies, dtype=np.int64) * self.element_offset
+
+    def NodeShifts(self):
+        return np.arange(self.copies, dtype=np.int64) * self.node_offset
+
+    def WriteElementSets(self, deck):
+        for index, name in enumerate(self.archive.names.get("blocks", [])):
+            self.WriteSet(deck, "ELSET", name, self.archive.Group("blocks", index), self.ElementShifts())
+
+    def WriteNodeSets(self, deck):
+        for index, name in enumerate(self.archive.names.get("nodesets", [])):
+            self.WriteSet(deck, "NSET", name, self.archive.Group("nodesets", index), self.NodeShifts())
+
+    # Section side Sj of a face is the face S(j+2) of the revolved element,
+    # the side numbers of a reordered face are mirrored
+    def WriteSurfaces(self, deck):
+        face_ids = np.asarray(self.archive["face_ids"])
+        order = np.argsort(face_ids)
+        for index, name in enumerate(self.archive.names.get("sidesets", [])):
+            members = np.asarray(self.archive.Group("sidesets", index))
+            if not len(members):
+                continue
+            elements, sides = members[:, 0], members[:, 1].copy()
+            rows = order[np.searchsorted(face_ids, elements, sorter=order)]
+            flipped = self.flipped[rows]
+            corners = self.face_types[rows].astype(np.int64)
+            # side j of a face with n corners is side n + 1 - j of the reordered face
+            sides[flipped] = corners[flipped] + 1 - sides[flipped]
+            surface_sets = []
+            for side in np.unique(sides):
+                set_name = f"_{name}_S{side + 2}"
+                self.WriteSet(deck, "ELSET", set_name, elements[sides == side], self.ElementShifts())
+                surface_sets.append((set_name, side + 2))
+            deck.write(f"*SURFACE, TYPE=ELEMENT, NAME={name}\n")
+            deck.write("".join(f"{set_name}, S{face_number}\n" for set_name, face_number in surface_sets))
+
+    # Write the deck. Returns the number of data lines written.
+    def Write(self, path, compress=None):
+        self.lines = 0
+        with abaqus_deck.OpenDeck(path, compress) as deck:
+            deck.write("*HEADING\n")
+            deck.write(f"** Tire revolved from the section by tire_revolve.py, {self.copies} divisions\n")
+            self.WriteNodes(deck)
+            self.WriteElements(deck)
+            self.WriteElementSets(deck)
+            self.WriteNodeSets(deck)
+            self.WriteSurfaces(deck)
+        return self.lines
+
+    def ElementCount(self):
+        bars = len(self.archive["bar_ids"]) if "bar_ids" in self.archive else 0
+        return (len(self.face_types) + bars) * self.copies
+
+
+# Revolve the section of a mesh archive and write the 3D deck. Returns the revolver.
+def Revolve(archive_path, deck_path, divisions=DIVISIONS, footprint_angle=FOOTPRINT_ANGLE,
+            center=FOOTPRINT_CENTER, ratio=SPACING_RATIO, compress=None):
+    start = time.perf_counter()
+    angles = Angles(divisions, footprint_angle, center, ratio)
+    revolver = Revolver(mesh_archive.MeshArchive(archive_path), angles)
+    lines = revolver.Write(deck_path, compress)
+    spacing = np.degrees(np.diff(np.concatenate([angles, [angles[0] + 2.0 * np.pi]])))
+    print(f"Revolved {len(revolver.face_types)} faces into {revolver.ElementCount()} elements with "
+          f"{divisions} divisions ({spacing.min():.2f} to {spacing.max():.2f} degrees), "
+          f"{lines} lines in {time.perf_counter() - start:.2f}s.")
+    return revolver
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("python tire_revolve.py section.tmsh tire3d.inp[.gz] [divisions]")
+        sys.exit(1)
+    Revolve(sys.argv[1], sys.argv[2], int(sys.argv[3]) if len(sys.argv) > 3 else DIVISIONS)
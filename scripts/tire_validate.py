@@ -0,0 +1,106 @@
+#!python
+"""
+    Validate the mesh before export. Find coincident nodes that are not
+    merged and hanging nodes on material interfaces (see mesh_validate.py),
+    report them by block and surface and optionally merge the coincident
+    nodes.
+"""
+from PySide6.QtCore import QMetaObject
+from PySide6.QtGui import QFontDatabase
+from PySide6.QtWidgets import QDialog, QGridLayout, QLabel, QLineEdit, QDialogButtonBox, \
+    QPushButton, QPlainTextEdit
+
+import cubit_utils
+import mesh_validate
+
+
+class ValidateMesh(QDialog):
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.resize(560, 320)
+        self.setWindowTitle("Validate Mesh")
+        self.setObjectName("ValidateMesh")
+
+        self.gridLayout = QGridLayout(self)
+        self.toleranceLabel = QLabel(u"Tolerance:")
+        self.gridLayout.addWidget(self.toleranceLabel, 0, 0)
+        self.toleranceLineEdit = QLineEdit()
+        self.toleranceLineEdit.setToolTip("Leave empty for a tolerance of 1e-6 times the model size")
+        self.gridLayout.addWidget(self.toleranceLineEdit, 0, 1)
+
+        self.validateButton = QPushButton()
+        self.validateButton.setAutoDefault(False)
+        self.validateButton.setText("Validate")
+        self.gridLayout.addWidget(self.validateButton, 0, 2)
+        self.validateButton.clicked.connect(self.Validate)
+
+        self.reportText = QPlainTextEdit()
+        self.reportText.setReadOnly(True)
+        self.reportText.setFont(QFontDatabase.systemFont(QFontDatabase.SystemFont.FixedFont))
+        self.gridLayout.addWidget(self.reportText, 1, 0, 1, 3)
+
+        self.mergeButton = QPushButton()
+        self.mergeButton.setAutoDefault(False)
+        self.mergeButton.setText("Merge Coincident Nodes")
+        self.mergeButton.setEnabled(False)
+        self.gridLayout.addWidget(self.mergeButton, 2, 0)
+        self.mergeButton.clicked.connect(self.MergeCoincident)
+
+        QBtn = QDialogButtonBox.StandardButton.Close
+        self.buttonBox = QDialogButtonBox(QBtn)
+        self.buttonBox.rejected.connect(self.reject)
+        self.gridLayout.addWidget(self.buttonBox, 2, 2)
+
+        self.setLayout(self.gridLayout)
+        QMetaObject.connectSlotsByName(self)
+        self.validator = None
+    # init -- create GUI
+
+    def GetTolerance(self):
+        text = self.toleranceLineEdit.text().strip()
+        if not text:
+            return None
+        tolerance = float(text)
+        if tolerance <= 0.0:
+            raise ValueError("The tolerance must be positive.")
+        return tolerance
+
+    def Validate(self):
+        try:
+            tolerance = self.GetTolerance()
+        except ValueError:
+            cubit_utils.ErrorWindow("The tolerance must be a positive number.")
+            return
+        try:
+            self.validator = mesh_validate.MeshValidator(tolerance)
+            self.validator.Run()
+            report = self.validator.Report()
+        except Exception as e:
+            cubit_utils.ErrorWindow(f"Unable to validate the mesh: {e}")
+            return
+        print(report)
+        self.reportText.setPlainText(report)
+        self.mergeButton.setEnabled(bool(self.validator.coincident))
+
+    def MergeCoincident(self):
+        if not self.validator or not self.validator.coincident:
+            return
+        try:
+            merged = self.validator.MergeCoincident()
+            print(f"Merged {merged} coincident node pairs.")
+        except Exception as e:
+            cubit_utils.ErrorWindow(f"Unable to merge the coincident nodes: {e}")
+            return
+        # check again so the report shows the merged mesh
+        self.Validate()
+
+
+def main():
+    # 'claro' must be globally defined or passed to main
+    global claro
+    dlg = ValidateMesh(claro)
+    dlg.show()
+
+if __name__ == "__coreformcubit__":
+    claro = cubit_utils.find_claro()
+    main()
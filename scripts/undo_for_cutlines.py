@@ -2,6 +2,9 @@
 """
     If the process has been completed once and you want to start over
     we have to get back to a place where we can insert cutlines.
+    The cut lines checkpoint taken before the automatic composites is
+    restored when it exists. Otherwise the model is rewound by reverse
+    operations:
     1) Unmerge everything
     2) Remove the reflected geometry
     3) Delete the mesh
@@ -14,6 +17,8 @@
     7) Put bodies back in blocks (this is a work-around)
     8) Replace the "-right" designation on some blocks
 """
+import checkpoints
+import part_scope
 
 # this requires a new version of Cubit and is still under development
 # but this captures the algorithm. The variable automatic_composite_curves is 
@@ -45,51 +50,61 @@ def recover_manual_composites():
         print(f'    You may need an updated version of Coreform Cubit')
 
 
-cubit.cmd("unmerge all")
-reflected_ids = cubit.parse_cubit_list('surface', 'with y_coord > 0')
-if reflected_ids:
-    reflected_surfaces = cubit.string_from_id_list(reflected_ids)
-    cubit.cmd(f'delete surface {reflected_surfaces}')
+# Undo back to cut lines by reverse operations, used when this session has
+# no cut lines checkpoint. Only the active part is rewound (part_scope.py).
+def undo_by_reverse_operations():
+    within = part_scope.Within()
+    cubit.cmd(f"unmerge {part_scope.Scope('body')}")
+    reflected_ids = cubit.parse_cubit_list('surface', f'{within} with y_coord > 0')
+    if reflected_ids:
+        reflected_surfaces = cubit.string_from_id_list(reflected_ids)
+        cubit.cmd(f'delete surface {reflected_surfaces}')
 
-ids = cubit.parse_cubit_list('surface', 'with is_meshed')
-ids += cubit.parse_cubit_list('curve', 'with is_meshed')
-ids += cubit.parse_cubit_list('vertex', 'with is_meshed')
-if ids:
-    cubit.cmd(f"delete mesh")
+    ids = cubit.parse_cubit_list('surface', f'{within} with is_meshed')
+    ids += cubit.parse_cubit_list('curve', f'{within} with is_meshed')
+    ids += cubit.parse_cubit_list('vertex', f'{within} with is_meshed')
+    if ids:
+        part_scope.DeleteMesh()
 
-# remove the composited curves
-cubit.cmd("virtual remove body all")
+    # remove the composited curves
+    cubit.cmd(f"virtual remove {part_scope.Scope('body')}")
 
-# This is a work-around for a Cubit bug with names
-blunt_vertices = cubit.parse_cubit_list('vertex', 'with name "blunt_vertex_*"')
-for vertex in blunt_vertices:
-    name = cubit.get_entity_name('vertex', vertex)
-    if str(vertex) not in name:
-        cubit.cmd(f'vertex {vertex} remove name all')
-    
+    # This is a work-around for a Cubit bug with names
+    blunt_vertices = cubit.parse_cubit_list('vertex', f'{within} with name "blunt_vertex_*"')
+    for vertex in blunt_vertices:
+        name = cubit.get_entity_name('vertex', vertex)
+        if str(vertex) not in name:
+            cubit.cmd(f'vertex {vertex} remove name all')
 
-cubit.cmd("merge all") # this is needed to be ready to do manual composites
 
-# delete the boundary sets
-if cubit.get_sideset_count():
-    val = cubit.cmd("delete sideset all")
-if cubit.get_nodeset_count():
-    val = cubit.cmd("delete nodeset all")
+    cubit.cmd(f"merge {part_scope.Scope('body')}") # this is needed to be ready to do manual composites
 
-# delete the rebar blocks
-rebar_blocks = cubit.parse_cubit_list('block', 'with name "reinf*"')
-if rebar_blocks:
-    rebar_block_str = cubit.string_from_id_list(rebar_blocks)
-    val = cubit.cmd(f'delete block {rebar_block_str}')
+    # delete the boundary sets
+    if cubit.get_sideset_count():
+        part_scope.DeleteSets("sideset")
+    if cubit.get_nodeset_count():
+        part_scope.DeleteSets("nodeset")
 
-# remove surfaces and put bodies back. This should be
-# fixed in Cubit so that this is not required.
-blocks = cubit.parse_cubit_list('block', 'all')
-for block in blocks:
-    val = cubit.cmd(f'block {block} remove surface all')
-    val = cubit.cmd(f'block {block} add body {block}')
-    block_name = cubit.get_entity_name('block', block)
-    if block_name.endswith("-right"):
-        block_name.replace('-right', '')
-    if block_name.endswith("-left"):
-        cubit.cmd(f'delete block {block}')
+    # delete the rebar blocks
+    rebar_blocks = cubit.parse_cubit_list('block', f'with name "{part_scope.Name("reinf*")}"')
+    if rebar_blocks:
+        rebar_block_str = cubit.string_from_id_list(rebar_blocks)
+        val = cubit.cmd(f'delete block {rebar_block_str}')
+
+    # remove surfaces and put bodies back. This should be
+    # fixed in Cubit so that this is not required.
+    blocks = part_scope.Sets('block')
+    for block in blocks:
+        val = cubit.cmd(f'block {block} remove surface all')
+        val = cubit.cmd(f'block {block} add body {block}')
+        block_name = cubit.get_entity_name('block', block)
+        if block_name.endswith("-right"):
+            block_name.replace('-right', '')
+        if block_name.endswith("-left"):
+            cubit.cmd(f'delete block {block}')
+
+
+# Restoring the cut lines checkpoint (see checkpoints.py) is much faster
+# and keeps the composites created before it
+if not checkpoints.Restore('cutlines'):
+    undo_by_reverse_operations()